@@ -9,164 +9,253 @@ import os
 if os.environ.get("FORCE_CPU"):
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
 
+import asyncio
 import base64
-import re
-import sys
-import tempfile
-from pathlib import Path
+import functools
+import hmac
+import io
+import json
+import subprocess
+import threading
+import time
+import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
 
 import cv2
 import numpy as np
-import torch
-torch.set_default_device("cpu")
-from fastapi import FastAPI, File, UploadFile, HTTPException, Body
+from fastapi import FastAPI, File, UploadFile, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
+from starlette.concurrency import run_in_threadpool
 
-# Importa após clone do dfdc_deepfake_challenge em DFDCDIR
-DFDCDIR = os.environ.get("DFDC_DIR", "/app/dfdc_deepfake_challenge")
-sys_path = os.environ.get("PYTHONPATH", "")
-if DFDCDIR not in sys_path:
-    os.environ["PYTHONPATH"] = f"{DFDCDIR}:{sys_path}"
+import deepfake_detector
+import model_registry
+import phash_index
+import sessions
+from model_server import MODEL_SERVER_ADDR, ModelServerClient
+from scheduler import ALLOWED_ORIGINS, join_deadline, MAX_INFLIGHT, Scheduler
+from scratch import ScratchManager
+from singleflight import SingleFlight, content_key
+
+# Com registro local, nenhum modelo vem do hub (antes de qualquer import de transformers)
+model_registry.offline()
 
 app = FastAPI(title="RealityScan Deepfake API")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
-
-# Modelos carregados uma vez no startup
-models = []
-# GPU ou CPU: só usa CUDA se houver pelo menos uma GPU (evita "No CUDA GPUs are available")
-def _resolve_device():
-    if os.environ.get("FORCE_CPU"):
-        return "cpu"
-    dev = os.environ.get("DEVICE", "").strip().lower()
-    if dev in ("cpu", "cuda"):
-        return dev
-    if torch.cuda.is_available() and torch.cuda.device_count() > 0:
-        return "cuda"
-    return "cpu"
-
-DEVICE = _resolve_device()
-WEIGHTS_DIR = os.environ.get("WEIGHTS_DIR", "/app/weights")
-MODEL_FILES = os.environ.get("MODEL_FILES", "final_111_DeepFakeClassifier_tf_efficientnet_b7_ns_0_36").split(",")
-
-
-def load_models():
-    """Carrega EfficientNet B7 do selimsef/dfdc_deepfake_challenge."""
-    global models, DEVICE
-    if models:
-        return
+app.add_middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_methods=["*"], allow_headers=["*"])
 
-    # Garante dispositivo válido (CPU se não houver GPU disponível)
-    DEVICE = _resolve_device()
-    if DEVICE != "cuda":
-        print(f"ℹ️ Usando dispositivo: {DEVICE} (inferência mais lenta que GPU).")
+# Rate limit por cliente + fila justa: Sentry (interativo) passa à frente de vídeos completos
+scheduler = Scheduler({
+    "/analisar": "batch",
+    "/analisar-audio": "batch",
+    "/analisar-lipsync": "batch",
+    "/analisar-lote": "batch",
+    "/analisar-frames": "interactive",
+    "/analisar-audio-base64": "interactive",
+    "/analisar-lipsync-sentry": "interactive",
+})
+app.middleware("http")(scheduler.middleware)
 
-    sys.path.insert(0, DFDCDIR)
-    from kernel_utils import VideoReader, FaceExtractor, confident_strategy
-    from training.zoo.classifiers import DeepFakeClassifier
+# Arquivos temporários por requisição em tmpfs/disco com cota; limpa sobras de workers mortos
+scratch_space = ScratchManager("deepfake-api")
 
-    weights_path = Path(WEIGHTS_DIR)
-    if not weights_path.exists():
-        raise RuntimeError(f"WEIGHTS_DIR não encontrado: {WEIGHTS_DIR}. Execute run_setup.sh primeiro.")
+# Uploads idênticos simultâneos (vídeo viralizando) rodam uma única análise
+inflight = SingleFlight(join=join_deadline)
 
-    use_half = DEVICE == "cuda"
-    for fname in MODEL_FILES:
-        fpath = weights_path / fname.strip()
-        if not fpath.exists():
-            print(f"⚠️ Peso não encontrado: {fpath}, pulando.")
-            continue
-        try:
-            model = DeepFakeClassifier(encoder="tf_efficientnet_b7_ns").to(DEVICE)
-            ckpt = torch.load(fpath, map_location="cpu", weights_only=False)
-            state = ckpt.get("state_dict", ckpt)
-            model.load_state_dict({re.sub(r"^module\.", "", k): v for k, v in state.items()}, strict=True)
-            model.eval()
-            if use_half:
-                model = model.half()
-            models.append(model)
-            del ckpt
-        except RuntimeError as e:
-            err_msg = str(e).lower()
-            if "cuda" in DEVICE and ("no kernel image" in err_msg or "cuda" in err_msg or "no cuda gpus" in err_msg):
-                print(f"⚠️ GPU indisponível ({e}). Usando CPU (inferência mais lenta).")
-                DEVICE = "cpu"
-                use_half = False
-                model = DeepFakeClassifier(encoder="tf_efficientnet_b7_ns").to("cpu")
-                ckpt = torch.load(fpath, map_location="cpu", weights_only=False)
-                state = ckpt.get("state_dict", ckpt)
-                model.load_state_dict({re.sub(r"^module\.", "", k): v for k, v in state.items()}, strict=True)
-                model.eval()
-                models.append(model)
-                del ckpt
-            else:
-                raise
-
-    if not models:
-        raise RuntimeError("Nenhum modelo carregado. Verifique WEIGHTS_DIR e MODEL_FILES.")
-
-
-def predict_video(video_path: str) -> float:
-    """Retorna probabilidade de fake (0-1) para um vídeo."""
-    # Quando rodamos em CPU, o dfdc_deepfake_challenge ainda chama .cuda() internamente.
-    # Patch para .cuda() não falhar ("No CUDA GPUs are available").
-    _patched = False
-    if DEVICE == "cpu":
-        _orig_cuda_available = torch.cuda.is_available
-        _orig_tensor_cuda = torch.Tensor.cuda
-        _orig_module_cuda = torch.nn.Module.cuda
-        torch.cuda.is_available = lambda: False
-        def _tensor_cuda_noop(self, device=None):
-            return self.to("cpu")
-        def _module_cuda_noop(self, device=None):
-            return self.to("cpu")
-        torch.Tensor.cuda = _tensor_cuda_noop
-        torch.nn.Module.cuda = _module_cuda_noop
-        _patched = True
+# Chamadas ao vivo do Sentry (X-Session-Id): evidência acumulada, amostragem reduzida após o veredito
+session_store = sessions.SessionStore()
+
+# Near-duplicates de deepfakes já confirmados respondem sem rodar o B7
+phash_idx = phash_index.open_index()
+
+# Com MODEL_SERVER_ADDR este processo não carrega pesos: só decodifica, recorta faces e
+# delega a inferência ao model_server.py (permite vários workers com 1 cópia dos pesos por GPU)
+model_client = ModelServerClient(MODEL_SERVER_ADDR) if MODEL_SERVER_ADDR else None
+
+
+def decode_video(video_path: str, stats: dict = None) -> list:
+    """Frames amostrados do vídeo (RGB), decodificados uma vez para o pHash e para a inferência. [] se não decodifica."""
     try:
-        if DFDCDIR not in sys.path:
-            sys.path.insert(0, DFDCDIR)
-        from kernel_utils import (
-            VideoReader,
-            FaceExtractor,
-            confident_strategy,
-            predict_on_video,
-        )
+        return deepfake_detector.decode_video(video_path, stats)
+    except Exception as e:
+        print("Prediction error on video %s: %s" % (video_path, str(e)))
+        return []
+
+
+def predict_video(frames_rgb: list) -> float:
+    """Probabilidade de fake (0-1) para os frames de decode_video."""
+    # Mesmo contrato de deepfake_detector.predict_video: vídeo que não decodifica vira 0.5
+    # (indeterminado), não 500. Falha do model server continua sendo erro.
+    try:
+        if not frames_rgb:
+            raise ValueError("nenhum frame decodificado")
+        crops = deepfake_detector.extract_faces_from_frames(frames_rgb)
+        if model_client is None:
+            return deepfake_detector.predict_faces(deepfake_detector.preprocess_faces(crops))
+    except Exception as e:
+        print("Prediction error on video: %s" % str(e))
+        return 0.5
+    return model_client.predict_crops(crops)
 
-        frames_per_video = 32
-        video_reader = VideoReader()
-        video_read_fn = lambda x: video_reader.read_frames(x, num_frames=frames_per_video)
-        face_extractor = FaceExtractor(video_read_fn)
-        input_size = 380
-
-        pred = predict_on_video(
-            face_extractor=face_extractor,
-            video_path=video_path,
-            batch_size=frames_per_video,
-            input_size=input_size,
-            models=models,
-            strategy=confident_strategy,
-            apply_compression=False,
-        )
-        return float(pred)
-    finally:
-        if _patched:
-            torch.cuda.is_available = _orig_cuda_available
-            torch.Tensor.cuda = _orig_tensor_cuda
-            torch.nn.Module.cuda = _orig_module_cuda
+
+def predict_frames(frames_rgb: list, stats: dict = None) -> float:
+    """Probabilidade de fake (0-1) a partir de frames já decodificados, sem gravar vídeo temporário."""
+    t0 = time.perf_counter()
+    crops = deepfake_detector.extract_faces_from_frames(frames_rgb)
+    if stats is not None:
+        stats.update(decoder="memoria", frames_sampled=len(frames_rgb), decode_ms=round((time.perf_counter() - t0) * 1000, 1))
+    if model_client is None:
+        return deepfake_detector.predict_faces(deepfake_detector.preprocess_faces(crops))
+    return model_client.predict_crops(crops)
+
+
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+WARMUP_VOICE = os.environ.get("WARMUP_VOICE", "1") != "0"
+WARMUP_AUDIO_SECONDS = [float(x) for x in os.environ.get("WARMUP_AUDIO_SECONDS", "3,10").split(",") if x.strip()]
+
+# /ready só responde 200 depois do warm-up (load balancer não manda tráfego antes)
+ready = threading.Event()
+
+
+def _warmup():
+    """Lotes sintéticos nas formas de produção por todos os engines carregados antes de ficar pronto."""
+    try:
+        # Um MTCNN por thread que recorta faces ao mesmo tempo: inferências simultâneas + pool do lote
+        t = deepfake_detector.warmup(face_extractors=MAX_INFLIGHT + BULK_DECODE_WORKERS)
+        print(f"🔥 Warm-up EfficientNet/MTCNN: {t:.1f}s (buckets {deepfake_detector.FACE_BATCH_BUCKETS}).")
+        if WARMUP_VOICE:
+            from voice_detector import warmup as voice_warmup
+            t = voice_warmup(WARMUP_AUDIO_SECONDS)
+            print(f"🔥 Warm-up wav2vec2: {t:.1f}s (áudios de {WARMUP_AUDIO_SECONDS}s).")
+    except model_registry.RegistryError as e:
+        # Modelo faltando no registro: /ready fica em 503 em vez de servir sem ele
+        print(f"❌ Registro de modelos: {e}")
+        return
+    except Exception as e:
+        print(f"⚠️ Warm-up falhou ({e}); seguindo sem warm-up.")
+    ready.set()
 
 
 @app.on_event("startup")
 def startup():
-    load_models()
-    print(f"✅ RealityScan Deepfake API pronta. Modelos EfficientNet B7 carregados ({DEVICE.upper()}).")
+    if model_client is not None:
+        print(f"✅ RealityScan Deepfake API pronta (frontend). Inferência no model server {MODEL_SERVER_ADDR}.")
+    else:
+        deepfake_detector.load_models()
+        print(f"✅ RealityScan Deepfake API pronta. Modelos EfficientNet B7 carregados ({deepfake_detector.DEVICE.upper()}).")
+    if model_registry.enabled():
+        from lipsync_detector import SYNCNET_DIR
+        model_registry.install_syncnet(SYNCNET_DIR)
+    if WARMUP:
+        threading.Thread(target=_warmup, daemon=True).start()
+    else:
+        ready.set()
+
+
+@app.get("/ready")
+def readiness():
+    if not ready.is_set():
+        return JSONResponse({"ready": False, "detail": "warm-up em andamento"}, status_code=503)
+    return {"ready": True}
+
+
+# Troca de versão do registro local de modelos; sem ADMIN_TOKEN as rotas /admin ficam desativadas
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+_swap_lock = threading.Lock()
+
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(403, "Acesso restrito.")
+    if not model_registry.enabled():
+        raise HTTPException(409, "Registro de modelos desativado (defina MODEL_REGISTRY_DIR).")
+
+
+def _activate(version: str) -> dict:
+    """Carrega a versão em todos os modelos deste serviço e só então a marca como ativa."""
+    import voice_detector
+    from lipsync_detector import SYNCNET_DIR
+
+    t0 = time.perf_counter()
+    version = model_registry.checked(version)
+    if model_client is not None:
+        model_client.reload(version)
+    else:
+        # Aquece a versão nova ao lado da atual; a troca da referência é o último passo
+        deepfake_detector.reload_models(version, warm=WARMUP)
+    if voice_detector._voice is not None:
+        voice_detector.reload_voice(version, WARMUP_AUDIO_SECONDS if WARMUP and WARMUP_VOICE else ())
+    model_registry.install_syncnet(SYNCNET_DIR, version)
+    model_registry.set_current(version)
+    return {"versao": version, "tempo_s": round(time.perf_counter() - t0, 1)}
+
+
+@app.get("/admin/modelos")
+def admin_modelos(request: Request):
+    import voice_detector
+
+    _require_admin(request)
+    try:
+        ativa = model_registry.current_version()
+    except model_registry.RegistryError:
+        ativa = None
+    return {
+        "versao_ativa": ativa,
+        "carregadas": {"deepfake": deepfake_detector.models_version, "voz": voice_detector._voice_version},
+        "versoes": model_registry.versions(),
+    }
+
+
+@app.post("/admin/modelos/ativar")
+async def admin_ativar_modelos(request: Request, body: dict = Body(...)):
+    """Hot-swap: body { "versao": "2026.10" }. Requisições em andamento terminam com a versão anterior."""
+    _require_admin(request)
+    version = body.get("versao")
+    if not version or not isinstance(version, str):
+        raise HTTPException(400, "Campo 'versao' obrigatório.")
+    if not _swap_lock.acquire(blocking=False):
+        raise HTTPException(409, "Troca de versão já em andamento.")
+    try:
+        return await run_in_threadpool(_activate, version)
+    except model_registry.RegistryError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Falha ao carregar versão {version}: {str(e)}")
+    finally:
+        _swap_lock.release()
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "models_loaded": len(models)}
+    if model_client is not None:
+        try:
+            return {
+                "status": "ok",
+                "model_server": MODEL_SERVER_ADDR,
+                **model_client.health(),
+                "scheduler": scheduler.stats(),
+                "scratch": scratch_space.stats(),
+                "singleflight": inflight.stats(),
+                "sessoes": session_store.stats(),
+                "phash": phash_idx.stats() if phash_idx else None,
+            }
+        except Exception as e:
+            return {"status": "degraded", "model_server": MODEL_SERVER_ADDR, "models_loaded": 0, "erro": str(e)}
+    return {
+        "status": "ok",
+        "models_loaded": len(deepfake_detector.models),
+        "models_version": deepfake_detector.models_version,
+        "scheduler": scheduler.stats(),
+        "scratch": scratch_space.stats(),
+        "singleflight": inflight.stats(),
+        "sessoes": session_store.stats(),
+        "phash": phash_idx.stats() if phash_idx else None,
+    }
 
 
 @app.post("/analisar")
-async def analisar(video: UploadFile = File(...)):
+async def analisar(request: Request, video: UploadFile = File(...)):
     """
     Recebe vídeo (mp4, webm, etc) e retorna score de deepfake.
     fake: 0-1 (probabilidade de ser fake)
@@ -180,41 +269,50 @@ async def analisar(video: UploadFile = File(...)):
     if ".webm" in (video.filename or "").lower():
         ext = ".webm"
 
-    tmp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            content = await video.read()
-            if len(content) > 200 * 1024 * 1024:  # 200MB
-                raise HTTPException(400, "Vídeo muito grande. Máximo 200MB.")
-            f.write(content)
-            tmp_path = f.name
-
-        fake = predict_video(tmp_path)
-        real = 1.0 - fake
+    content = await video.read()
+    if len(content) > 200 * 1024 * 1024:  # 200MB
+        raise HTTPException(400, "Vídeo muito grande. Máximo 200MB.")
+    key = await run_in_threadpool(content_key, "/analisar", content)
+    return await inflight.do(key, lambda: _analisar_video(request, content, ext), request)
 
-        if fake >= 0.7:
-            resultado = "provável deepfake"
-        elif fake >= 0.5:
-            resultado = "suspeito - recomenda-se validação"
-        elif fake >= 0.3:
-            resultado = "indeterminado"
-        else:
-            resultado = "aparenta ser conteúdo real"
 
-        return {
+async def _analisar_video(request: Request, content: bytes, ext: str) -> dict:
+    scratch = scratch_space.new()
+    try:
+        tmp_path = scratch.write(content, ext)
+
+        # Os mesmos frames amostrados servem ao pHash e à inferência (o vídeo é decodificado uma vez só)
+        decode_stats = {}
+        frames = await run_in_threadpool(decode_video, tmp_path, decode_stats)
+        hashes = phash_index.frame_hashes(frames, phash_index.PHASH_KEYFRAMES, rgb=True) if phash_idx else []
+        # ffmpeg do áudio só roda se algum registro bater nos frames, ou se o resultado for indexado;
+        # o cache faz a consulta e o registro compartilharem a mesma impressão digital
+        audio_fp = functools.lru_cache(maxsize=1)(lambda: phash_index.audio_hashes(tmp_path))
+        match = await run_in_threadpool(phash_idx.lookup, hashes, audio_fp) if phash_idx else None
+        if match:
+            return _duplicate_response(match)
+
+        async with scheduler.slot(request):
+            fake = await run_in_threadpool(predict_video, frames)
+        resultado = _resultado_from_fake(fake)
+
+        response = {
             "fake": round(fake, 4),
-            "real": round(real, 4),
+            "real": round(1.0 - fake, 4),
             "resultado": resultado,
             "score_fake_pct": round(fake * 100, 1),
+            "decodificacao": decode_stats,
         }
+        analise_id = await run_in_threadpool(phash_idx.add, hashes, audio_fp, fake, resultado, "video") if phash_idx else None
+        if analise_id:
+            response["analise_id"] = analise_id
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise: {str(e)}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        scratch.close()
 
 
 def _resultado_from_fake(fake: float) -> str:
@@ -227,8 +325,20 @@ def _resultado_from_fake(fake: float) -> str:
     return "aparenta ser conteúdo real"
 
 
-def _frames_to_video(frames_b64: list) -> str:
-    """Converte frames base64 em arquivo de vídeo temporário. Retorna path."""
+def _duplicate_response(match: dict) -> dict:
+    """Resposta instantânea para near-duplicate de um deepfake já analisado."""
+    fake = match["fake"]
+    return {
+        "fake": round(fake, 4),
+        "real": round(1.0 - fake, 4),
+        "resultado": _resultado_from_fake(fake),
+        "score_fake_pct": round(fake * 100, 1),
+        "duplicado_de": match,
+    }
+
+
+def _decode_frames(frames_b64: list) -> list:
+    """Decodifica frames base64 (data URL ou puro) em imagens BGR."""
     if not frames_b64 or len(frames_b64) > 32:
         raise ValueError("Envie entre 1 e 32 frames.")
     decoded = []
@@ -244,87 +354,128 @@ def _frames_to_video(frames_b64: list) -> str:
             decoded.append(img)
     if not decoded:
         raise ValueError("Nenhum frame válido.")
+    return decoded
+
+
+def _write_video(decoded: list, scratch) -> str:
+    """Grava frames BGR decodificados em vídeo no rascunho da requisição. Retorna path."""
     h, w = decoded[0].shape[:2]
-    out = tempfile.NamedTemporaryFile(delete=False, suffix=".mp4")
-    out.close()
+    out_path = scratch.path(".mp4")
     fourcc = cv2.VideoWriter_fourcc(*"mp4v")
-    writer = cv2.VideoWriter(out.name, fourcc, 2.0, (w, h))
+    writer = cv2.VideoWriter(out_path, fourcc, 2.0, (w, h))
     for img in decoded:
         writer.write(img)
     writer.release()
-    return out.name
+    return scratch.account(out_path)
 
 
-def _save_audio_from_base64(audio_b64: str) -> str:
-    """Salva áudio base64 em arquivo temporário. Retorna path."""
+def _save_audio_from_base64(audio_b64: str, scratch) -> str:
+    """Salva áudio base64 no rascunho da requisição. Retorna path."""
     orig = audio_b64
     if "base64," in str(audio_b64):
         audio_b64 = audio_b64.split("base64,", 1)[1]
     raw = base64.b64decode(audio_b64)
     ext = ".webm" if "webm" in str(orig).lower() else ".wav"
-    with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-        f.write(raw)
-        return f.name
+    return scratch.write(raw, ext)
 
 
 @app.post("/analisar-audio-base64")
-async def analisar_audio_base64(body: dict = Body(...)):
-    """Recebe áudio em base64 (Sentry). body: { "audio": "data:audio/webm;base64,..." }"""
+async def analisar_audio_base64(request: Request, body: dict = Body(...)):
+    """Recebe áudio em base64 (Sentry). body: { "audio": "data:audio/webm;base64,...", "sessao": opcional }"""
     audio = body.get("audio") or body.get("audioBase64")
     if not audio or not isinstance(audio, str):
         raise HTTPException(400, "Campo 'audio' obrigatório.")
-    tmp_path = None
+    sid = sessions.session_id(request, body)
+    key = await run_in_threadpool(content_key, "/analisar-audio-base64", sid or "", audio)
+    return await inflight.do(key, lambda: _analisar_audio_base64(request, audio, sid), request)
+
+
+def _load_voice_sample(audio_path: str) -> tuple:
+    import voice_detector
+
+    audio = voice_detector.load_audio(audio_path)
+    return audio, sessions.speaker_signature(audio)
+
+
+async def _analisar_audio_base64(request: Request, audio: str, sid: str = None) -> dict:
+    scratch = scratch_space.new()
     try:
-        tmp_path = _save_audio_from_base64(audio)
-        from voice_detector import analyze_audio_synthetic
-        return analyze_audio_synthetic(tmp_path)
+        tmp_path = _save_audio_from_base64(audio, scratch)
+        import voice_detector
+        if sid is None:
+            async with scheduler.slot(request):
+                return await run_in_threadpool(voice_detector.analyze_audio_synthetic, tmp_path)
+
+        # Mesmo contrato de analyze_audio_synthetic: áudio que não carrega ou falha do modelo
+        # vira o dict de erro (0.5), não 500
+        try:
+            samples, signature = await run_in_threadpool(_load_voice_sample, tmp_path)
+        except Exception as e:
+            return voice_detector.error_result(e)
+        mode = session_store.plan(
+            sid, "voz", signature, sessions.cosine_distance, sessions.SESSION_SPEAKER_DISTANCE
+        )
+        if mode == sessions.SKIP:
+            response = voice_detector.voice_result(session_store.modality_score(sid, "voz"))
+        else:
+            if mode == sessions.LIGHT:
+                samples = samples[: int(16000 * sessions.SESSION_LIGHT_AUDIO_S)]
+            async with scheduler.slot(request):
+                try:
+                    synthetic = await run_in_threadpool(voice_detector.score_audio, samples)
+                except Exception as e:
+                    return voice_detector.error_result(e)
+            if synthetic is None:
+                return voice_detector.analyze_audio(samples)
+            session_store.record(sid, "voz", synthetic, mode)
+            response = voice_detector.voice_result(synthetic)
+        response["sessao"] = session_store.summary(sid, mode)
+        return response
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise de áudio: {str(e)}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        scratch.close()
 
 
 @app.post("/analisar-audio")
-async def analisar_audio(audio: UploadFile = File(...)):
+async def analisar_audio(request: Request, audio: UploadFile = File(...)):
     """
     Analisa áudio (wav, mp3, webm) com wav2vec2 para detectar voz sintética.
     body: multipart audio file
     """
     if not audio.content_type or not any(x in (audio.content_type or "") for x in ["audio/", "video/", "application/octet"]):
         raise HTTPException(400, "Envie um arquivo de áudio (wav, mp3, webm, etc).")
-    tmp_path = None
+    content = await audio.read()
+    if len(content) > 50 * 1024 * 1024:
+        raise HTTPException(400, "Áudio muito grande. Máximo 50MB.")
+    suffix = ".wav"
+    if "webm" in (audio.filename or "").lower() or "webm" in (audio.content_type or ""):
+        suffix = ".webm"
+    elif "mp3" in (audio.filename or "").lower():
+        suffix = ".mp3"
+    key = await run_in_threadpool(content_key, "/analisar-audio", content)
+    return await inflight.do(key, lambda: _analisar_audio(request, content, suffix), request)
+
+
+async def _analisar_audio(request: Request, content: bytes, suffix: str) -> dict:
+    scratch = scratch_space.new()
     try:
-        content = await audio.read()
-        if len(content) > 50 * 1024 * 1024:
-            raise HTTPException(400, "Áudio muito grande. Máximo 50MB.")
-        suffix = ".wav"
-        if "webm" in (audio.filename or "").lower() or "webm" in (audio.content_type or ""):
-            suffix = ".webm"
-        elif "mp3" in (audio.filename or "").lower():
-            suffix = ".mp3"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=suffix) as f:
-            f.write(content)
-            tmp_path = f.name
+        tmp_path = scratch.write(content, suffix)
         from voice_detector import analyze_audio_synthetic
-        return analyze_audio_synthetic(tmp_path)
+        async with scheduler.slot(request):
+            return await run_in_threadpool(analyze_audio_synthetic, tmp_path)
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise de áudio: {str(e)}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        scratch.close()
 
 
 @app.post("/analisar-lipsync-sentry")
-async def analisar_lipsync_sentry(body: dict = Body(...)):
+async def analisar_lipsync_sentry(request: Request, body: dict = Body(...)):
     """
     Lip-sync para Sentry: frames + áudio base64.
     Cria vídeo temporário, mescla áudio, executa SyncNet.
@@ -333,100 +484,294 @@ async def analisar_lipsync_sentry(body: dict = Body(...)):
     audio_b64 = body.get("audio") or body.get("audioBase64")
     if not frames or not audio_b64 or "base64," not in str(audio_b64):
         raise HTTPException(400, "Envie 'frames' (lista) e 'audio' (data URL base64).")
-    video_path = None
-    audio_path = None
-    out_path = None
+    sid = sessions.session_id(request, body)
+    key = await run_in_threadpool(content_key, "/analisar-lipsync-sentry", sid or "", audio_b64, *map(str, frames))
+    return await inflight.do(key, lambda: _analisar_lipsync_sentry(request, frames, audio_b64, sid), request)
+
+
+async def _analisar_lipsync_sentry(request: Request, frames: list, audio_b64: str, sid: str = None) -> dict:
+    scratch = scratch_space.new()
     try:
-        video_path = _frames_to_video(frames)
+        decoded = _decode_frames(frames)
+        video_path = _write_video(decoded, scratch)
         b64 = audio_b64.split("base64,", 1)[1].strip()
-        raw = base64.b64decode(b64)
-        with tempfile.NamedTemporaryFile(delete=False, suffix=".webm") as f:
-            f.write(raw)
-            audio_path = f.name
-        out_path = tempfile.mktemp(suffix=".mp4")
-        import subprocess
+        audio_path = scratch.write(base64.b64decode(b64), ".webm")
+        out_path = scratch.path(".mp4")
         subprocess.run([
             "ffmpeg", "-y", "-i", video_path, "-i", audio_path,
             "-c:v", "copy", "-c:a", "aac", "-shortest", out_path
         ], capture_output=True, timeout=30, check=False)
         if not os.path.exists(out_path) or os.path.getsize(out_path) < 1000:
             return {"ok": False, "avg_distance": 1.0, "resultado": "ffmpeg merge falhou", "suspicious": False}
+        scratch.account(out_path)
         from lipsync_detector import analyze_lipsync
-        return analyze_lipsync(out_path)
+        syncnet_dir = scratch.mkdtemp("syncnet_")
+        async with scheduler.slot(request):
+            result = await run_in_threadpool(analyze_lipsync, out_path, syncnet_dir)
+        scratch.account(syncnet_dir)
+        if sid is not None:
+            # avg_distance do SyncNet é distância de embedding (tipicamente > 1), não probabilidade de fake:
+            # sem calibração ela não entra no SPRT da sessão; a resposta só traz o veredito das outras modalidades
+            result["sessao"] = session_store.summary(sid)
+        return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro lip-sync: {str(e)}")
     finally:
-        for p in (video_path, audio_path, out_path):
-            if p and os.path.exists(p):
-                try:
-                    os.unlink(p)
-                except Exception:
-                    pass
+        scratch.close()
 
 
 @app.post("/analisar-lipsync")
-async def analisar_lipsync_endpoint(video: UploadFile = File(...)):
+async def analisar_lipsync_endpoint(request: Request, video: UploadFile = File(...)):
     """
     Executa SyncNet para verificar lip-sync (boca vs áudio).
     Vídeo deve conter áudio.
     """
     if not video.content_type or not video.content_type.startswith("video/"):
         raise HTTPException(400, "Envie um arquivo de vídeo com áudio.")
-    tmp_path = None
+    content = await video.read()
+    if len(content) > 200 * 1024 * 1024:
+        raise HTTPException(400, "Vídeo muito grande. Máximo 200MB.")
+    ext = ".mp4"
+    if "webm" in (video.filename or "").lower():
+        ext = ".webm"
+    key = await run_in_threadpool(content_key, "/analisar-lipsync", content)
+    return await inflight.do(key, lambda: _analisar_lipsync(request, content, ext), request)
+
+
+async def _analisar_lipsync(request: Request, content: bytes, ext: str) -> dict:
+    scratch = scratch_space.new()
     try:
-        content = await video.read()
-        if len(content) > 200 * 1024 * 1024:
-            raise HTTPException(400, "Vídeo muito grande. Máximo 200MB.")
-        ext = ".mp4"
-        if "webm" in (video.filename or "").lower():
-            ext = ".webm"
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            f.write(content)
-            tmp_path = f.name
+        tmp_path = scratch.write(content, ext)
         from lipsync_detector import analyze_lipsync
-        return analyze_lipsync(tmp_path)
+        syncnet_dir = scratch.mkdtemp("syncnet_")
+        async with scheduler.slot(request):
+            result = await run_in_threadpool(analyze_lipsync, tmp_path, syncnet_dir)
+        scratch.account(syncnet_dir)
+        return result
     except HTTPException:
         raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise lip-sync: {str(e)}")
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        scratch.close()
 
 
 @app.post("/analisar-frames")
-async def analisar_frames(body: dict = Body(...)):
+async def analisar_frames(request: Request, body: dict = Body(...)):
     """
     Recebe frames base64 (Sentry Mini HUD) e retorna score de deepfake.
-    body: { "frames": ["data:image/jpeg;base64,...", ...] }
+    body: { "frames": ["data:image/jpeg;base64,...", ...], "sessao": opcional }
+    Com sessão (X-Session-Id ou "sessao") a resposta traz o bloco "sessao" com o veredito acumulado.
     """
     frames = body.get("frames")
     if not isinstance(frames, list):
         raise HTTPException(400, "Campo 'frames' deve ser uma lista de imagens base64.")
-    tmp_path = None
+    sid = sessions.session_id(request, body)
+    key = await run_in_threadpool(content_key, "/analisar-frames", sid or "", *map(str, frames))
+    return await inflight.do(key, lambda: _analisar_frames(request, frames, sid), request)
+
+
+async def _analisar_frames(request: Request, frames: list, sid: str = None) -> dict:
     try:
-        tmp_path = _frames_to_video(frames)
-        fake = predict_video(tmp_path)
+        decoded = _decode_frames(frames)
+        # Ticks do Sentry (com sessão) não consultam nem alimentam o índice: um falso positivo
+        # reaproveitado a cada tick impediria o SPRT da sessão de corrigir o veredito
+        match = phash_idx.lookup(phash_index.frame_hashes(decoded)) if phash_idx and sid is None else None
+        if match:
+            return _duplicate_response(match)
+
+        mode = None
+        if sid is not None:
+            signature = phash_index.phash(decoded[0])
+            mode = session_store.plan(sid, "frames", signature, sessions.hamming, sessions.SESSION_SCENE_DISTANCE)
+            if mode == sessions.SKIP:
+                fake = session_store.modality_score(sid, "frames")
+                return {
+                    "fake": round(fake, 4),
+                    "real": round(1.0 - fake, 4),
+                    "resultado": _resultado_from_fake(fake),
+                    "score_fake_pct": round(fake * 100, 1),
+                    "sessao": session_store.summary(sid, mode),
+                }
+            if mode == sessions.LIGHT:
+                decoded = decoded[: sessions.SESSION_LIGHT_FRAMES]
+
+        # Frames já estão em memória: vão direto ao detector de faces, sem vídeo temporário
+        frames_rgb = [cv2.cvtColor(img, cv2.COLOR_BGR2RGB) for img in decoded]
+        decode_stats = {}
+        async with scheduler.slot(request):
+            fake = await run_in_threadpool(predict_frames, frames_rgb, decode_stats)
         real = 1.0 - fake
-        return {
+        response = {
             "fake": round(fake, 4),
             "real": round(real, 4),
             "resultado": _resultado_from_fake(fake),
             "score_fake_pct": round(fake * 100, 1),
+            "decodificacao": decode_stats,
         }
+        if sid is not None:
+            session_store.record(sid, "frames", fake, mode)
+            response["sessao"] = session_store.summary(sid, mode)
+        return response
     except ValueError as e:
         raise HTTPException(400, str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise de frames: {str(e)}")
-    finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+
+
+BULK_MAX_ITEMS = int(os.environ.get("BULK_MAX_ITEMS", 50))
+BULK_MAX_BYTES = int(os.environ.get("BULK_MAX_MB", 500)) * 1024 * 1024
+BULK_DECODE_WORKERS = int(os.environ.get("BULK_DECODE_WORKERS", 2))
+# Faces acumuladas (de vários itens) por passada no ensemble
+BULK_BATCH_FACES = int(os.environ.get("BULK_BATCH_FACES", 128))
+
+_VIDEO_EXTS = (".mp4", ".webm", ".mov", ".mkv", ".avi", ".m4v")
+_IMAGE_EXTS = (".jpg", ".jpeg", ".png", ".webp", ".bmp")
+
+# Pool único e duradouro de threads de decodificação; o MTCNN vem do pool de FaceExtractors do detector
+_bulk_executor = ThreadPoolExecutor(BULK_DECODE_WORKERS, thread_name_prefix="lote")
+
+
+def _bulk_items(nome: str, data: bytes, max_items: int, max_bytes: int) -> list:
+    """
+    Expande um upload do lote em itens (nome, bytes). Arquivo .zip vira um item por mídia.
+    max_items / max_bytes: o que ainda cabe no lote (itens e bytes descompactados). O zip é recusado
+    antes de descompactar se tiver itens demais, e a leitura para assim que o orçamento estoura
+    (file_size do cabeçalho pode mentir: zip bomb).
+    """
+    if not nome.lower().endswith(".zip"):
+        return [(nome, data)]
+    items = []
+    unpacked = 0
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        entries = [
+            info for info in zf.infolist()
+            if not info.is_dir() and info.filename.lower().endswith(_VIDEO_EXTS + _IMAGE_EXTS)
+        ]
+        if len(entries) > max_items:
+            raise HTTPException(400, f"Máximo de {BULK_MAX_ITEMS} itens por lote.")
+        for info in entries:
+            with zf.open(info) as f:
+                content = f.read(max_bytes - unpacked + 1)
+            unpacked += len(content)
+            if unpacked > max_bytes:
+                raise HTTPException(400, f"Lote muito grande descompactado. Máximo {BULK_MAX_BYTES // (1024 * 1024)}MB.")
+            items.append((info.filename, content))
+    return items
+
+
+def _extract_item(nome: str, data: bytes) -> tuple:
+    """Etapa de decodificação + crop de faces de um item do lote (roda no pool de threads). Retorna (crops, stats)."""
+    lower = nome.lower()
+    if lower.endswith(_IMAGE_EXTS):
+        img = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("imagem inválida")
+        return deepfake_detector.extract_faces_from_frames([cv2.cvtColor(img, cv2.COLOR_BGR2RGB)]), {}
+    if not lower.endswith(_VIDEO_EXTS):
+        raise ValueError("formato não suportado")
+    with scratch_space.request() as scratch:
+        tmp_path = scratch.write(data, os.path.splitext(lower)[1])
+        stats = {}
+        return deepfake_detector.extract_faces(tmp_path, stats), stats
+
+
+def _predict_crops_batch(crops_list: list) -> list:
+    """Inferência de vários itens numa passada (local) ou via model server (que agrupa sozinho)."""
+    if model_client is not None:
+        return [model_client.predict_crops(crops) for crops in crops_list]
+    return deepfake_detector.predict_faces_batch([deepfake_detector.preprocess_faces(c) for c in crops_list])
+
+
+def _bulk_line(obj: dict) -> bytes:
+    return (json.dumps(obj, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+@app.post("/analisar-lote")
+async def analisar_lote(request: Request, itens: List[UploadFile] = File(...)):
+    """
+    Analisa vários vídeos/imagens (ou um .zip) numa única requisição (BulkSummary / API corporativa).
+    Decodificação e crop das faces rodam em paralelo; a inferência agrupa faces de vários itens.
+    Resposta em NDJSON, uma linha por item na ordem em que terminam:
+      { "indice", "nome", "fake", "real", "resultado", "score_fake_pct", "faces" } ou { "indice", "nome", "erro" }
+    Última linha: { "fim": true, "total", "ms" }.
+    """
+    items = []
+    total_bytes = 0
+    for up in itens:
+        data = await up.read()
+        total_bytes += len(data)
+        if total_bytes > BULK_MAX_BYTES:
+            raise HTTPException(400, f"Lote muito grande. Máximo {BULK_MAX_BYTES // (1024 * 1024)}MB.")
+        unpacked = sum(len(d) for _, d in items)
+        try:
+            items.extend(_bulk_items(up.filename or "item", data, BULK_MAX_ITEMS - len(items), BULK_MAX_BYTES - unpacked))
+        except (zipfile.BadZipFile, zlib.error):
+            raise HTTPException(400, f"Arquivo zip inválido: {up.filename}")
+        except (RuntimeError, NotImplementedError) as e:
+            # Item criptografado ou compressão não suportada
+            raise HTTPException(400, f"Zip não suportado ({up.filename}): {e}")
+        if len(items) > BULK_MAX_ITEMS:
+            raise HTTPException(400, f"Máximo de {BULK_MAX_ITEMS} itens por lote.")
+    if not items:
+        raise HTTPException(400, "Envie pelo menos um vídeo ou imagem em 'itens'.")
+
+    async def stream():
+        t0 = time.monotonic()
+        loop = asyncio.get_running_loop()
+        pending = {
+            loop.run_in_executor(_bulk_executor, _extract_item, nome, data): i
+            for i, (nome, data) in enumerate(items)
+        }
+        extracted = []
+        try:
+            while pending or extracted:
+                if pending:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for fut in done:
+                        i = pending.pop(fut)
+                        try:
+                            extracted.append((i, fut.result()))
+                        except Exception as e:
+                            yield _bulk_line({"indice": i, "nome": items[i][0], "erro": str(e)})
+                n_faces = sum(len(c) for _, (c, _) in extracted)
+                if not extracted or (n_faces < BULK_BATCH_FACES and pending):
+                    continue
+                # Micro-lote: itens prontos até BULK_BATCH_FACES faces (pelo menos 1 item)
+                batch, n_faces = [], 0
+                while extracted and (not batch or n_faces + len(extracted[0][1][0]) <= BULK_BATCH_FACES):
+                    batch.append(extracted.pop(0))
+                    n_faces += len(batch[-1][1][0])
+                try:
+                    async with scheduler.slot(request):
+                        preds = await run_in_threadpool(_predict_crops_batch, [c for _, (c, _) in batch])
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    for i, _ in batch:
+                        yield _bulk_line({"indice": i, "nome": items[i][0], "erro": detail})
+                    continue
+                for (i, (crops, decode_stats)), fake in zip(batch, preds):
+                    yield _bulk_line({
+                        "indice": i,
+                        "nome": items[i][0],
+                        "fake": round(fake, 4),
+                        "real": round(1.0 - fake, 4),
+                        "resultado": _resultado_from_fake(fake),
+                        "score_fake_pct": round(fake * 100, 1),
+                        "faces": len(crops),
+                        "decodificacao": decode_stats,
+                    })
+            yield _bulk_line({"fim": True, "total": len(items), "ms": round((time.monotonic() - t0) * 1000)})
+        finally:
+            # Cliente desconectou: itens que ainda não começaram saem da fila do pool compartilhado
+            for fut in pending:
+                fut.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,493 @@
+"""
+Detector de deepfake em vídeo - EfficientNet B7 (selimsef/dfdc_deepfake_challenge).
+Dividido em etapas para que a inferência possa rodar no próprio processo (app.py)
+ou no model server (model_server.py), que mantém uma única cópia dos pesos por GPU:
+  extract_faces     → decodifica só os frames amostrados (video_decoder.py) e recorta faces (MTCNN)
+  preprocess_faces  → resize isotrópico + centralização de todas as faces num lote 380x380
+  predict_faces_batch → normalização vetorizada do lote + ensemble B7 (GPU)
+"""
+import os
+
+# Força CPU antes de importar torch (ex.: RunPod com GPU sm_120 não suportada pelo PyTorch)
+if os.environ.get("FORCE_CPU"):
+    os.environ["CUDA_VISIBLE_DEVICES"] = ""
+
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+import numpy as np
+import torch
+torch.set_default_device("cpu")
+
+import stub_models
+from stub_models import STUB_MODELS
+
+# Importa após clone do dfdc_deepfake_challenge em DFDCDIR
+DFDCDIR = os.environ.get("DFDC_DIR", "/app/dfdc_deepfake_challenge")
+sys_path = os.environ.get("PYTHONPATH", "")
+if DFDCDIR not in sys_path:
+    os.environ["PYTHONPATH"] = f"{DFDCDIR}:{sys_path}"
+
+WEIGHTS_DIR = os.environ.get("WEIGHTS_DIR", "/app/weights")
+MODEL_FILES = os.environ.get("MODEL_FILES", "final_111_DeepFakeClassifier_tf_efficientnet_b7_ns_0_36").split(",")
+
+FRAMES_PER_VIDEO = 32
+INPUT_SIZE = 380
+# predict_on_video usa lote de frames_per_video * 4 e descarta a última posição
+MAX_FACES = FRAMES_PER_VIDEO * 4 - 1
+# Lotes são completados com zeros até o próximo bucket: só essas formas chegam às GPUs,
+# então o autotuning do cuDNN (cudnn.benchmark) acontece uma vez por bucket, no warm-up.
+# O benchmark vale só durante o classificador: MTCNN (pirâmide de escalas) e wav2vec2 recebem
+# formas arbitrárias e re-autotunariam a cada tamanho novo
+FACE_BATCH_BUCKETS = sorted(int(b) for b in os.environ.get("FACE_BATCH_BUCKETS", "8,32,64,128").split(","))
+CUDNN_BENCHMARK = os.environ.get("CUDNN_BENCHMARK", "1") != "0"
+
+# Modelos carregados no startup; reload_models() troca a lista inteira (hot-swap) e cada
+# passada usa a lista que pegou no início, então requisições em andamento não são afetadas
+models = []
+models_version = None
+_reload_lock = threading.Lock()
+
+
+# GPU ou CPU: só usa CUDA se houver pelo menos uma GPU (evita "No CUDA GPUs are available")
+def _resolve_device():
+    if os.environ.get("FORCE_CPU"):
+        return "cpu"
+    dev = os.environ.get("DEVICE", "").strip().lower()
+    if dev in ("cpu", "cuda"):
+        return dev
+    if torch.cuda.is_available() and torch.cuda.device_count() > 0:
+        return "cuda"
+    return "cpu"
+
+
+DEVICE = _resolve_device()
+
+
+def _ensure_dfdc_path():
+    if DFDCDIR not in sys.path:
+        sys.path.insert(0, DFDCDIR)
+
+
+def _load_checkpoint(fpath):
+    """torch.load com mmap (pesos lidos sob demanda do page cache); formato antigo cai na leitura normal."""
+    try:
+        return torch.load(fpath, map_location="cpu", weights_only=False, mmap=True)
+    except (TypeError, RuntimeError):
+        return torch.load(fpath, map_location="cpu", weights_only=False)
+
+
+def _build_model(fpath, device: str):
+    from training.zoo.classifiers import DeepFakeClassifier
+
+    model = DeepFakeClassifier(encoder="tf_efficientnet_b7_ns").to(device)
+    ckpt = _load_checkpoint(fpath)
+    state = ckpt.get("state_dict", ckpt)
+    model.load_state_dict({re.sub(r"^module\.", "", k): v for k, v in state.items()}, strict=True)
+    model.eval()
+    del ckpt
+    return model
+
+
+def _weight_files(version: str = None) -> tuple:
+    """(versão, caminhos dos pesos): do registro local se MODEL_REGISTRY_DIR, senão WEIGHTS_DIR/MODEL_FILES."""
+    import model_registry
+
+    if model_registry.enabled():
+        version = model_registry.checked(version)
+        return version, [Path(p) for p in model_registry.dfdc_weights(version)]
+    weights_path = Path(WEIGHTS_DIR)
+    if not weights_path.exists():
+        raise RuntimeError(f"WEIGHTS_DIR não encontrado: {WEIGHTS_DIR}. Execute run_setup.sh primeiro.")
+    return None, [weights_path / fname.strip() for fname in MODEL_FILES]
+
+
+class _StubClassifier(torch.nn.Module):
+    """No lugar do B7 com STUB_MODELS=1: latência simulada por lote/face e logit derivado dos pixels."""
+
+    def forward(self, x):
+        stub_models.delay(stub_models.STUB_B7_MS_PER_BATCH + stub_models.STUB_B7_MS_PER_FACE * len(x))
+        return x.float().mean(dim=(1, 2, 3)).view(-1, 1)
+
+
+def _load_ensemble(version: str = None) -> tuple:
+    """Carrega EfficientNet B7 do selimsef/dfdc_deepfake_challenge. Retorna (versão, modelos)."""
+    global DEVICE
+
+    # Garante dispositivo válido (CPU se não houver GPU disponível)
+    DEVICE = _resolve_device()
+    if STUB_MODELS:
+        return "stub", [_StubClassifier()]
+    if DEVICE != "cuda":
+        print(f"ℹ️ Usando dispositivo: {DEVICE} (inferência mais lenta que GPU).")
+
+    _ensure_dfdc_path()
+    version, files = _weight_files(version)
+
+    loaded = []
+    use_half = DEVICE == "cuda"
+    for fpath in files:
+        if not fpath.exists():
+            print(f"⚠️ Peso não encontrado: {fpath}, pulando.")
+            continue
+        try:
+            model = _build_model(fpath, DEVICE)
+            if use_half:
+                model = model.half()
+            loaded.append(model)
+        except RuntimeError as e:
+            err_msg = str(e).lower()
+            if "cuda" in DEVICE and ("no kernel image" in err_msg or "cuda" in err_msg or "no cuda gpus" in err_msg):
+                print(f"⚠️ GPU indisponível ({e}). Usando CPU (inferência mais lenta).")
+                DEVICE = "cpu"
+                use_half = False
+                loaded.append(_build_model(fpath, "cpu"))
+            else:
+                raise
+
+    if not loaded:
+        raise RuntimeError("Nenhum modelo carregado. Verifique WEIGHTS_DIR e MODEL_FILES.")
+    return version, loaded
+
+
+def load_models():
+    """Carrega o ensemble uma vez (versão ativa do registro, ou WEIGHTS_DIR)."""
+    global models, models_version
+    with _reload_lock:
+        if models:
+            return
+        models_version, models = _load_ensemble()
+
+
+def reload_models(version: str = None, warm: bool = False) -> str:
+    """
+    Hot-swap: carrega a versão ao lado da atual e troca a referência. Requisições em andamento
+    terminam com os modelos antigos (liberados quando a última delas sai). Retorna a versão carregada.
+    warm: roda os buckets na versão nova antes da troca (a primeira requisição não paga o autotuning).
+    """
+    global models, models_version
+    with _reload_lock:
+        new_version, new_models = _load_ensemble(version)
+        if warm:
+            _warm_ensemble(new_models)
+        models_version, models = new_version, new_models
+    if DEVICE == "cuda":
+        torch.cuda.empty_cache()
+    return models_version
+
+
+# O patch troca atributos globais do torch e várias threads recortam faces ao mesmo tempo (requisições
+# e pool do lote): instalado pela primeira thread que entra e restaurado pela última que sai
+_cuda_patch_lock = threading.Lock()
+_cuda_patch_users = 0
+_cuda_patch_saved = None
+
+
+def _tensor_cuda_noop(self, device=None):
+    return self.to("cpu")
+
+
+def _module_cuda_noop(self, device=None):
+    return self.to("cpu")
+
+
+@contextmanager
+def _cuda_patch():
+    """
+    Quando rodamos em CPU, o dfdc_deepfake_challenge ainda chama .cuda() internamente.
+    Patch para .cuda() não falhar ("No CUDA GPUs are available").
+    """
+    global _cuda_patch_users, _cuda_patch_saved
+    if DEVICE != "cpu":
+        yield
+        return
+    with _cuda_patch_lock:
+        if _cuda_patch_users == 0:
+            _cuda_patch_saved = (torch.cuda.is_available, torch.Tensor.cuda, torch.nn.Module.cuda)
+            torch.cuda.is_available = lambda: False
+            torch.Tensor.cuda = _tensor_cuda_noop
+            torch.nn.Module.cuda = _module_cuda_noop
+        _cuda_patch_users += 1
+    try:
+        yield
+    finally:
+        with _cuda_patch_lock:
+            _cuda_patch_users -= 1
+            if _cuda_patch_users == 0:
+                torch.cuda.is_available, torch.Tensor.cuda, torch.nn.Module.cuda = _cuda_patch_saved
+                _cuda_patch_saved = None
+
+
+# FaceExtractors (MTCNN) prontos para uso: cada chamada pega um livre e devolve ao terminar.
+# O warm-up deixa o pool preenchido, então as threads das requisições não pagam a construção
+_face_extractors = []
+_face_extractors_lock = threading.Lock()
+
+
+def _acquire_face_extractor(video_read_fn):
+    from kernel_utils import FaceExtractor
+
+    with _face_extractors_lock:
+        face_extractor = _face_extractors.pop() if _face_extractors else None
+    if face_extractor is None:
+        face_extractor = FaceExtractor(video_read_fn)
+    face_extractor.video_read_fn = video_read_fn
+    return face_extractor
+
+
+def _release_face_extractor(face_extractor):
+    with _face_extractors_lock:
+        _face_extractors.append(face_extractor)
+
+
+@contextmanager
+def _cudnn_benchmark():
+    """cudnn.benchmark ligado só no trecho com formas fixas (lotes do classificador, já nos buckets)."""
+    if DEVICE != "cuda" or not CUDNN_BENCHMARK:
+        yield
+        return
+    prev = torch.backends.cudnn.benchmark
+    torch.backends.cudnn.benchmark = True
+    try:
+        yield
+    finally:
+        torch.backends.cudnn.benchmark = prev
+
+
+def _stub_faces(result) -> list:
+    """No lugar do MTCNN com STUB_MODELS=1: um crop central por frame."""
+    if result is None:
+        return []
+    frames, _ = result
+    stub_models.delay(stub_models.STUB_FACE_MS_PER_FRAME * len(frames))
+    faces = []
+    for frame in frames:
+        h, w = frame.shape[:2]
+        side = min(h, w) // 2
+        top, left = (h - side) // 2, (w - side) // 2
+        faces.append(frame[top:top + side, left:left + side])
+    return faces[:MAX_FACES]
+
+
+def _faces_from(video_read_fn, video_path: str) -> list:
+    if STUB_MODELS:
+        return _stub_faces(video_read_fn(video_path))
+    face_extractor = _acquire_face_extractor(video_read_fn)
+    try:
+        faces = []
+        for frame_data in face_extractor.process_video(video_path):
+            faces.extend(frame_data["faces"])
+        return faces[:MAX_FACES]
+    finally:
+        _release_face_extractor(face_extractor)
+
+
+def extract_faces(video_path: str, stats: dict = None) -> list:
+    """
+    Lê FRAMES_PER_VIDEO frames do vídeo e retorna os crops de face (RGB uint8) na ordem dos frames.
+    stats: se informado, recebe as métricas de decodificação (decoder, decode_ms, seeks, frames_sampled...).
+    """
+    from video_decoder import SampledVideoReader
+
+    with _cuda_patch():
+        _ensure_dfdc_path()
+        video_reader = SampledVideoReader()
+        video_read_fn = lambda x: video_reader.read_frames(x, num_frames=FRAMES_PER_VIDEO)
+        try:
+            return _faces_from(video_read_fn, video_path)
+        finally:
+            if stats is not None:
+                stats.update(video_reader.stats)
+
+
+def decode_video(video_path: str, stats: dict = None) -> list:
+    """Só a decodificação de extract_faces: FRAMES_PER_VIDEO frames amostrados (RGB uint8), [] se não houver."""
+    from video_decoder import SampledVideoReader
+
+    video_reader = SampledVideoReader()
+    try:
+        result = video_reader.read_frames(video_path, num_frames=FRAMES_PER_VIDEO)
+    finally:
+        if stats is not None:
+            stats.update(video_reader.stats)
+    return list(result[0]) if result is not None else []
+
+
+def extract_faces_from_frames(frames: list) -> list:
+    """Como extract_faces, mas a partir de frames já decodificados (RGB uint8), sem arquivo de vídeo."""
+    frames = frames[:FRAMES_PER_VIDEO]
+    if not frames:
+        return []
+    with _cuda_patch():
+        _ensure_dfdc_path()
+        return _faces_from(lambda _: (frames, list(range(len(frames)))), "frames")
+
+
+def _resized_shape(h: int, w: int, size: int = INPUT_SIZE) -> tuple:
+    """Mesmo cálculo de kernel_utils.isotropically_resize_image: maior lado = size."""
+    if max(w, h) == size:
+        return h, w
+    if w > h:
+        return int(h * (size / w)), size
+    return size, int(w * (size / h))
+
+
+def preprocess_faces(faces: list, out: np.ndarray = None) -> np.ndarray:
+    """
+    Resize isotrópico + centralização de todas as faces da requisição num único lote
+    uint8 (N, 380, 380, 3). Equivalente a isotropically_resize_image + put_to_center,
+    mas o lote é zerado de uma vez e cada face redimensionada é escrita direto na
+    posição central (sem imagem intermediária por face).
+    out: buffer (N, 380, 380, 3) onde escrever in-place (ex.: slot do shm_ring).
+    """
+    import cv2
+
+    faces = faces[:MAX_FACES]
+    if out is None:
+        x = np.zeros((len(faces), INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)
+    else:
+        x = out[:len(faces)]
+        x.fill(0)
+    for n, face in enumerate(faces):
+        h, w = face.shape[:2]
+        rh, rw = _resized_shape(h, w)
+        if (rh, rw) != (h, w):
+            interpolation = cv2.INTER_CUBIC if max(rh, rw) > max(h, w) else cv2.INTER_AREA
+            face = cv2.resize(face, (rw, rh), interpolation=interpolation)
+        rh, rw = min(rh, INPUT_SIZE), min(rw, INPUT_SIZE)
+        top, left = (INPUT_SIZE - rh) // 2, (INPUT_SIZE - rw) // 2
+        x[n, top:top + rh, left:left + rw] = face[:rh, :rw]
+    return x
+
+
+# Normalização ImageNet aplicada ao lote inteiro (uint8 → float), com /255 embutido
+_MEAN = torch.tensor([0.485, 0.456, 0.406]).view(1, 3, 1, 1) * 255.
+_STD = torch.tensor([0.229, 0.224, 0.225]).view(1, 3, 1, 1) * 255.
+# Buffer pinned (CUDA) reaproveitado entre lotes para cópia host → GPU assíncrona
+_staging = None
+_staging_lock = threading.Lock()
+
+
+def _bucket(n: int) -> int:
+    return next((b for b in FACE_BATCH_BUCKETS if b >= n), n)
+
+
+def _stage(batches: list, total: int) -> torch.Tensor:
+    """
+    Copia os lotes uint8 para um tensor (pinned em CUDA) sem np.concatenate intermediário,
+    completando com zeros até o bucket de FACE_BATCH_BUCKETS.
+    """
+    global _staging
+    padded = _bucket(total)
+    if DEVICE != "cuda":
+        staging = torch.empty((padded, INPUT_SIZE, INPUT_SIZE, 3), dtype=torch.uint8)
+    else:
+        if _staging is None or len(_staging) < padded:
+            _staging = torch.empty((max(padded, MAX_FACES + 1), INPUT_SIZE, INPUT_SIZE, 3), dtype=torch.uint8).pin_memory()
+        staging = _staging[:padded]
+    n = 0
+    for b in batches:
+        staging[n:n + len(b)].copy_(torch.from_numpy(np.ascontiguousarray(b)))
+        n += len(b)
+    staging[n:].zero_()
+    return staging
+
+
+def predict_faces_batch(batches: list, ensemble: list = None) -> list:
+    """
+    Roda o ensemble B7 sobre vários lotes de faces (um por vídeo) numa única passada.
+    Cada lote é uint8 (N, 380, 380, 3) vindo de preprocess_faces.
+    Retorna probabilidade de fake (0-1) por lote; lote vazio = 0.5 (sem face).
+    ensemble: modelos a usar (padrão: os ativos; o hot-swap aquece a versão nova antes da troca).
+    """
+    if STUB_MODELS:
+        confident_strategy = np.mean
+    else:
+        _ensure_dfdc_path()
+        from kernel_utils import confident_strategy
+
+    active_models = ensemble if ensemble is not None else models
+    results = [0.5] * len(batches)
+    idxs = [i for i, b in enumerate(batches) if len(b) > 0]
+    if not idxs or not active_models:
+        return results
+
+    sizes = [len(batches[i]) for i in idxs]
+    with _staging_lock, torch.no_grad():
+        staging = _stage([batches[i] for i in idxs], sum(sizes))
+        x = staging.to(DEVICE, non_blocking=True).permute((0, 3, 1, 2)).float()
+        x = (x - _MEAN.to(DEVICE)) / _STD.to(DEVICE)
+        if DEVICE == "cuda":
+            x = x.half()
+
+        per_model = []
+        with _cudnn_benchmark():
+            for model in active_models:
+                y_pred = torch.sigmoid(model(x).view(-1)[:sum(sizes)])
+                per_model.append(y_pred.float().cpu().numpy())
+
+    offsets = np.cumsum([0] + sizes)
+    for k, i in enumerate(idxs):
+        preds = [confident_strategy(p[offsets[k]:offsets[k + 1]]) for p in per_model]
+        results[i] = float(np.mean(preds))
+    return results
+
+
+def predict_faces(x: np.ndarray) -> float:
+    """Probabilidade de fake (0-1) para um lote de faces pré-processadas."""
+    return predict_faces_batch([x])[0]
+
+
+def predict_video(video_path: str, stats: dict = None) -> float:
+    """Retorna probabilidade de fake (0-1) para um vídeo (inferência no próprio processo)."""
+    try:
+        x = preprocess_faces(extract_faces(video_path, stats))
+        return predict_faces(x)
+    except Exception as e:
+        print("Prediction error on video %s: %s" % (video_path, str(e)))
+        return 0.5
+
+
+def _warm_ensemble(ensemble: list):
+    for b in FACE_BATCH_BUCKETS:
+        predict_faces_batch([np.zeros((b, INPUT_SIZE, INPUT_SIZE, 3), dtype=np.uint8)], ensemble)
+    if DEVICE == "cuda":
+        torch.cuda.synchronize()
+
+
+def _warm_face_extractors(count: int):
+    """Constrói FaceExtractors até o pool ter count livres, cada um aquecido com um frame sintético."""
+    frame = np.random.randint(0, 255, (720, 1280, 3), dtype=np.uint8)
+    if STUB_MODELS:
+        extract_faces_from_frames([frame])
+        return
+    with _cuda_patch():
+        _ensure_dfdc_path()
+        from kernel_utils import FaceExtractor
+
+        read_fn = lambda _: ([frame], [0])
+        while len(_face_extractors) < count:
+            face_extractor = FaceExtractor(read_fn)
+            list(face_extractor.process_video("warmup"))
+            _release_face_extractor(face_extractor)
+
+
+def warmup(face_extractors: int = 1) -> float:
+    """
+    Roda lotes sintéticos em todos os buckets de FACE_BATCH_BUCKETS (autotuning cuDNN, contexto CUDA)
+    e deixa face_extractors MTCNN prontos no pool usado pelas requisições, para a primeira requisição
+    real não pagar esse custo (0 no model server, que recebe as faces já recortadas).
+    Retorna o tempo gasto (s).
+    """
+    t0 = time.perf_counter()
+    if models:
+        _warm_ensemble(models)
+    if face_extractors > 0:
+        _warm_face_extractors(face_extractors)
+    if DEVICE == "cuda":
+        torch.cuda.synchronize()
+    return time.perf_counter() - t0
@@ -9,19 +9,35 @@ import subprocess
 import tempfile
 from pathlib import Path
 
+import stub_models
+from stub_models import STUB_MODELS
+
 SYNCNET_DIR = os.environ.get("SYNCNET_DIR", "/app/syncnet_python")
 
 
-def analyze_lipsync(video_path: str) -> dict:
+def analyze_lipsync(video_path: str, data_dir: str = None) -> dict:
     """
     Executa SyncNet no vídeo. Retorna offset, confidence, avg_distance.
     avg_distance baixo = boca não bate com áudio = suspeito fake.
+    data_dir: diretório de trabalho do SyncNet (ex.: do rascunho da requisição, que o contabiliza e apaga);
+    sem ele usa mkdtemp e apaga ao terminar.
     """
+    if STUB_MODELS:
+        stub_models.delay(stub_models.STUB_LIPSYNC_MS)
+        avg_dist = round(stub_models.file_score(video_path), 4)
+        suspicious = avg_dist > 0.5
+        return {
+            "ok": True,
+            "avg_distance": avg_dist,
+            "resultado": "dessincronia detectada - suspeito" if suspicious else "lip-sync aparenta correto",
+            "suspicious": suspicious,
+        }
     if not os.path.isdir(SYNCNET_DIR):
         return {"ok": False, "avg_distance": 1.0, "resultado": "SyncNet não instalado", "suspicious": False}
 
     ref = "sentry_" + str(hash(video_path) % 10**8)
-    data_dir = tempfile.mkdtemp(prefix="syncnet_")
+    owns_dir = data_dir is None
+    data_dir = data_dir or tempfile.mkdtemp(prefix="syncnet_")
     try:
         pipeline = Path(SYNCNET_DIR) / "run_pipeline.py"
         syncnet = Path(SYNCNET_DIR) / "run_syncnet.py"
@@ -60,5 +76,5 @@ def analyze_lipsync(video_path: str) -> dict:
         return {"ok": False, "avg_distance": 1.0, "resultado": str(e), "suspicious": False}
     finally:
         import shutil
-        if os.path.exists(data_dir):
+        if owns_dir and os.path.exists(data_dir):
             shutil.rmtree(data_dir, ignore_errors=True)
@@ -0,0 +1,290 @@
+"""
+Registro local de modelos: bundle offline, versionado e com checksum.
+- `python model_registry.py bundle <versão>` roda UMA VEZ (com rede, no build ou numa máquina de apoio)
+  e grava em MODEL_REGISTRY_DIR/<versão>/ os pesos DFDC, os checkpoints wav2vec2 (safetensors)
+  e os pesos do SyncNet, com manifest.json (sha256 + tamanho de cada arquivo)
+- Com MODEL_REGISTRY_DIR definido os serviços só carregam do registro: HF_HUB_OFFLINE (offline()),
+  local_files_only e leitura por mmap (torch.load(mmap=True) / safetensors). Modelo ausente é erro,
+  não download nem fallback
+- CURRENT aponta a versão ativa; a troca (hot-swap) carrega a nova versão ao lado da antiga e
+  troca a referência, então requisições em andamento terminam com a versão com que começaram
+
+Uso:
+  python model_registry.py bundle 2026.10 --dfdc-dir /app/weights --syncnet-dir /app/syncnet_python
+  python model_registry.py list | verify 2026.10 | activate 2026.10
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import time
+
+MODEL_REGISTRY_DIR = os.environ.get("MODEL_REGISTRY_DIR", "")
+# Confere sha256 de todos os arquivos ao ativar uma versão (também aquece o page cache para o mmap)
+MODEL_REGISTRY_VERIFY = os.environ.get("MODEL_REGISTRY_VERIFY", "1") != "0"
+
+DEFAULT_DFDC_FILES = ["final_111_DeepFakeClassifier_tf_efficientnet_b7_ns_0_36"]
+DEFAULT_VOICE_MODELS = [
+    "alexandreacff/wav2vec2-large-ft-fake-detection",
+    "nii-yamagishilab/wav2vec-large-anti-deepfake-nda",
+]
+# Caminhos relativos ao clone do syncnet_python (lidos pelos scripts a partir do cwd)
+SYNCNET_FILES = {
+    "syncnet_v2.model": "data/syncnet_v2.model",
+    "sfd_face.pth": "detectors/s3fd/weights/sfd_face.pth",
+}
+
+
+class RegistryError(RuntimeError):
+    pass
+
+
+def enabled() -> bool:
+    return bool(MODEL_REGISTRY_DIR)
+
+
+def offline():
+    """
+    Caminho de serviço com registro: nada de chamadas ao hub (chamar antes de importar transformers).
+    Não vale para o bundle, que precisa baixar os checkpoints.
+    """
+    if MODEL_REGISTRY_DIR:
+        os.environ.setdefault("HF_HUB_OFFLINE", "1")
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+
+
+def _root() -> str:
+    if not MODEL_REGISTRY_DIR:
+        raise RegistryError("MODEL_REGISTRY_DIR não definido.")
+    return MODEL_REGISTRY_DIR
+
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(8 * 1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _hf_alias(name: str) -> str:
+    return name.replace("/", "--")
+
+
+def versions() -> list:
+    root = _root()
+    if not os.path.isdir(root):
+        return []
+    return sorted(v for v in os.listdir(root) if os.path.isfile(os.path.join(root, v, "manifest.json")))
+
+
+def current_version() -> str:
+    """Versão ativa (arquivo CURRENT) ou RegistryError."""
+    try:
+        with open(os.path.join(_root(), "CURRENT")) as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        raise RegistryError(f"Nenhuma versão ativa em {MODEL_REGISTRY_DIR}. Rode model_registry.py activate.")
+    if version not in versions():
+        raise RegistryError(f"Versão ativa '{version}' não existe em {MODEL_REGISTRY_DIR}.")
+    return version
+
+
+def current_stamp():
+    """Identidade do arquivo CURRENT (inode, mtime) para detectar troca feita por outro processo; None se ausente."""
+    try:
+        st = os.stat(os.path.join(_root(), "CURRENT"))
+    except FileNotFoundError:
+        return None
+    return st.st_ino, st.st_mtime_ns
+
+
+def _resolve(version: str = None) -> str:
+    """Versão existente no registro (CURRENT se omitida); o nome só vira caminho depois de conferido."""
+    if not version:
+        return current_version()
+    if version not in versions():
+        raise RegistryError(f"Versão '{version}' não existe em {MODEL_REGISTRY_DIR}.")
+    return version
+
+
+def set_current(version: str):
+    version = _resolve(version)
+    tmp = os.path.join(_root(), f".CURRENT.{os.getpid()}")
+    with open(tmp, "w") as f:
+        f.write(version + "\n")
+    os.replace(tmp, os.path.join(_root(), "CURRENT"))
+
+
+def manifest(version: str = None) -> dict:
+    version = _resolve(version)
+    with open(os.path.join(_root(), version, "manifest.json")) as f:
+        return json.load(f)
+
+
+def verify(version: str = None, checksums: bool = True) -> list:
+    """Problemas encontrados na versão (arquivo ausente, tamanho ou sha256 divergente); [] se íntegra."""
+    version = _resolve(version)
+    base = os.path.join(_root(), version)
+    problems = []
+    for rel, meta in manifest(version)["files"].items():
+        path = os.path.join(base, rel)
+        if not os.path.isfile(path):
+            problems.append(f"{rel}: ausente")
+        elif os.path.getsize(path) != meta["bytes"]:
+            problems.append(f"{rel}: tamanho {os.path.getsize(path)} != {meta['bytes']}")
+        elif checksums and _sha256(path) != meta["sha256"]:
+            problems.append(f"{rel}: sha256 divergente")
+    return problems
+
+
+def checked(version: str = None) -> str:
+    """Versão pronta para carregar (resolve CURRENT e confere integridade conforme MODEL_REGISTRY_VERIFY)."""
+    version = _resolve(version)
+    problems = verify(version, checksums=MODEL_REGISTRY_VERIFY)
+    if problems:
+        raise RegistryError(f"Versão '{version}' corrompida: {'; '.join(problems[:5])}")
+    return version
+
+
+def dfdc_weights(version: str = None) -> list:
+    """Caminhos dos pesos do ensemble DFDC na versão."""
+    version = _resolve(version)
+    return [os.path.join(_root(), version, "dfdc", name) for name in manifest(version)["models"]["dfdc"]]
+
+
+def voice_model(name: str, version: str = None) -> str:
+    """Diretório local (save_pretrained) do checkpoint de voz `name` (id do HuggingFace)."""
+    version = _resolve(version)
+    voice = manifest(version)["models"]["voice"]
+    if name not in voice:
+        raise RegistryError(f"Modelo de voz '{name}' não está na versão '{version}' (tem: {', '.join(voice) or 'nenhum'}).")
+    return os.path.join(_root(), version, voice[name])
+
+
+def install_syncnet(syncnet_dir: str, version: str = None) -> bool:
+    """
+    Aponta os pesos do clone do SyncNet (data/, detectors/s3fd/weights/) para a versão via symlink.
+    Os scripts do SyncNet leem caminhos fixos relativos ao cwd. Retorna False se a versão não tem SyncNet.
+    """
+    version = _resolve(version)
+    files = manifest(version)["models"].get("syncnet") or {}
+    if not files or not os.path.isdir(syncnet_dir):
+        return False
+    for name, rel in files.items():
+        target = os.path.join(syncnet_dir, SYNCNET_FILES[name])
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp = f"{target}.{os.getpid()}.tmp"
+        os.symlink(os.path.join(_root(), version, rel), tmp)
+        os.replace(tmp, target)
+    return True
+
+
+def bundle(version: str, dfdc_dir: str, dfdc_files: list, voice_models: list, syncnet_dir: str = None) -> str:
+    """Monta a versão num diretório temporário e só então renomeia (versão parcial nunca aparece)."""
+    root = _root()
+    final = os.path.join(root, version)
+    if os.path.exists(final):
+        raise RegistryError(f"Versão '{version}' já existe (versões são imutáveis).")
+    tmp = os.path.join(root, f".{version}.partial")
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(os.path.join(tmp, "dfdc"))
+    models = {"dfdc": [], "voice": {}, "syncnet": {}}
+    try:
+        for name in dfdc_files:
+            src = os.path.join(dfdc_dir, name)
+            if not os.path.isfile(src):
+                raise RegistryError(f"Peso DFDC não encontrado: {src}")
+            print(f"📦 DFDC {name}")
+            shutil.copyfile(src, os.path.join(tmp, "dfdc", name))
+            models["dfdc"].append(name)
+
+        if voice_models:
+            from transformers import AutoFeatureExtractor, AutoModelForAudioClassification
+        for name in voice_models:
+            # Sem fallback para outro checkpoint: o head de classificação precisa vir treinado
+            print(f"📦 Voz {name}")
+            rel = os.path.join("hf", _hf_alias(name))
+            model = AutoModelForAudioClassification.from_pretrained(name)
+            model.save_pretrained(os.path.join(tmp, rel), safe_serialization=True)
+            AutoFeatureExtractor.from_pretrained(name).save_pretrained(os.path.join(tmp, rel))
+            models["voice"][name] = rel
+            del model
+
+        if syncnet_dir:
+            os.makedirs(os.path.join(tmp, "syncnet"))
+            for name, rel_src in SYNCNET_FILES.items():
+                src = os.path.join(syncnet_dir, rel_src)
+                if not os.path.isfile(src):
+                    raise RegistryError(f"Peso SyncNet não encontrado: {src} (rode download_model.sh)")
+                print(f"📦 SyncNet {name}")
+                shutil.copyfile(src, os.path.join(tmp, "syncnet", name))
+                models["syncnet"][name] = os.path.join("syncnet", name)
+
+        files = {}
+        for dirpath, _, names in os.walk(tmp):
+            for n in names:
+                path = os.path.join(dirpath, n)
+                files[os.path.relpath(path, tmp)] = {"sha256": _sha256(path), "bytes": os.path.getsize(path)}
+        with open(os.path.join(tmp, "manifest.json"), "w") as f:
+            json.dump({"version": version, "created": int(time.time()), "models": models, "files": files}, f, indent=2)
+        os.rename(tmp, final)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    return final
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Registro local de modelos RealityScan")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    b = sub.add_parser("bundle", help="baixa/copia todos os modelos para uma nova versão")
+    b.add_argument("version")
+    b.add_argument("--dfdc-dir", default=os.environ.get("WEIGHTS_DIR", "/app/weights"))
+    b.add_argument("--dfdc-file", action="append", dest="dfdc_files")
+    b.add_argument("--voice", action="append", dest="voice_models")
+    b.add_argument("--no-voice", action="store_true")
+    b.add_argument("--syncnet-dir", default=None)
+    b.add_argument("--activate", action="store_true", help="torna a versão ativa (CURRENT)")
+    sub.add_parser("list")
+    v = sub.add_parser("verify")
+    v.add_argument("version", nargs="?")
+    a = sub.add_parser("activate")
+    a.add_argument("version")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.cmd == "bundle":
+            voice = [] if args.no_voice else (args.voice_models or DEFAULT_VOICE_MODELS)
+            path = bundle(args.version, args.dfdc_dir, args.dfdc_files or DEFAULT_DFDC_FILES, voice, args.syncnet_dir)
+            print(f"✅ Versão {args.version} em {path}")
+            if args.activate:
+                set_current(args.version)
+        elif args.cmd == "list":
+            try:
+                active = current_version()
+            except RegistryError:
+                active = None
+            for version in versions():
+                print(("* " if version == active else "  ") + version)
+        elif args.cmd == "verify":
+            problems = verify(args.version)
+            for p in problems:
+                print(f"❌ {p}")
+            if problems:
+                return 1
+            print("✅ Íntegra.")
+        elif args.cmd == "activate":
+            checked(args.version)
+            set_current(args.version)
+            print(f"✅ Versão ativa: {args.version} (processos em execução: use a API de troca ou reinicie)")
+    except RegistryError as e:
+        print(f"❌ {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,245 @@
+"""
+RealityScan Model Server - processo local que mantém os pesos EfficientNet B7 na GPU.
+Os frontends FastAPI (app.py com MODEL_SERVER_ADDR) só fazem I/O, decodificação e crop
+das faces; escrevem o lote pré-processado no ring de memória compartilhada (shm_ring.py),
+enviam só o descritor por socket local e o servidor agrupa lotes de todos os frontends
+numa única passada pelos modelos.
+
+Uso:
+  MODEL_SERVER_ADDR=/tmp/realityscan-models.sock python model_server.py
+  MODEL_SERVER_ADDR=/tmp/realityscan-models.sock uvicorn app:app --workers 4
+
+multiprocessing.connection desserializa (pickle) o que recebe: quem conecta executa código aqui.
+O Unix socket é criado com permissão 0600 (só o mesmo usuário); TCP exige MODEL_SERVER_AUTHKEY.
+"""
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import Client, Listener
+
+import shm_ring
+from shm_ring import SHM_RING_SLOTS
+
+MODEL_SERVER_ADDR = os.environ.get("MODEL_SERVER_ADDR", "")
+# Obrigatória em TCP. Em Unix socket o controle de acesso é a permissão do arquivo
+MODEL_SERVER_AUTHKEY = os.environ.get("MODEL_SERVER_AUTHKEY", "")
+_LOCAL_AUTHKEY = b"realityscan-unix-socket"
+# Máximo de faces por passada no ensemble (soma dos lotes de todos os frontends)
+BATCH_MAX_FACES = int(os.environ.get("MODEL_SERVER_MAX_FACES", 128))
+# Tempo que o servidor espera por lotes de outros frontends antes de rodar
+BATCH_WAIT_MS = float(os.environ.get("MODEL_SERVER_BATCH_WAIT_MS", 5))
+CLIENT_TIMEOUT_S = float(os.environ.get("MODEL_SERVER_TIMEOUT_S", 120))
+# Carregar uma nova versão do registro (hot-swap) pode levar minutos
+RELOAD_TIMEOUT_S = float(os.environ.get("MODEL_SERVER_RELOAD_TIMEOUT_S", 900))
+
+
+def _address(addr: str):
+    """'host:porta' → TCP local; qualquer outro valor → caminho de Unix socket."""
+    if ":" in addr and not addr.startswith("/"):
+        host, port = addr.rsplit(":", 1)
+        return (host, int(port))
+    return addr
+
+
+def _authkey(address) -> bytes:
+    if MODEL_SERVER_AUTHKEY:
+        return MODEL_SERVER_AUTHKEY.encode()
+    if isinstance(address, tuple):
+        raise RuntimeError("Model server em TCP exige MODEL_SERVER_AUTHKEY (segredo longo, igual no servidor e nos frontends).")
+    return _LOCAL_AUTHKEY
+
+
+class ModelServerClient:
+    """Cliente usado pelos frontends. Mantém um pool de conexões (uma requisição por vez em cada)."""
+
+    def __init__(self, addr: str = MODEL_SERVER_ADDR):
+        self.addr = _address(addr)
+        self.authkey = _authkey(self.addr)
+        self._idle = queue.LifoQueue()
+        self.ring = None
+        if SHM_RING_SLOTS > 0:
+            import deepfake_detector
+
+            shm_ring.cleanup_orphans()
+            slot_bytes = deepfake_detector.MAX_FACES * deepfake_detector.INPUT_SIZE ** 2 * 3
+            slots = shm_ring.fitting_slots(slot_bytes, SHM_RING_SLOTS)
+            if slots < SHM_RING_SLOTS:
+                print(
+                    f"⚠️ /dev/shm sem espaço para {SHM_RING_SLOTS} slots de {slot_bytes // 2**20} MB: usando {slots}"
+                    f"{' (lotes pelo socket)' if not slots else ''}. Em Docker, aumente --shm-size."
+                )
+            if slots:
+                try:
+                    self.ring = shm_ring.ShmRing(slot_bytes, slots)
+                except OSError as e:
+                    print(f"⚠️ Ring de memória compartilhada indisponível ({e}); lotes pelo socket.")
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return Client(self.addr, authkey=self.authkey)
+
+    def _call(self, msg: dict, timeout: float = CLIENT_TIMEOUT_S) -> dict:
+        conn = self._acquire()
+        try:
+            conn.send(msg)
+            if not conn.poll(timeout):
+                raise TimeoutError("model server não respondeu a tempo")
+            reply = conn.recv()
+        except Exception:
+            conn.close()
+            raise
+        self._idle.put(conn)
+        if "error" in reply:
+            raise RuntimeError(f"model server: {reply['error']}")
+        return reply
+
+    def predict(self, faces) -> float:
+        """Envia lote uint8 (N, 380, 380, 3) e retorna probabilidade de fake (0-1)."""
+        if len(faces) == 0:
+            return 0.5
+        return float(self._call({"op": "predict", "faces": faces})["fake"])
+
+    def predict_crops(self, crops: list) -> float:
+        """
+        Pré-processa os crops de face direto num slot do ring de memória compartilhada e envia
+        só o descritor (sem pickle do lote). Sem ring (SHM_RING_SLOTS=0) cai no predict() normal.
+        """
+        import deepfake_detector
+
+        if self.ring is None or self.ring.live == 0:
+            return self.predict(deepfake_detector.preprocess_faces(crops))
+        crops = crops[:deepfake_detector.MAX_FACES]
+        if not crops:
+            return 0.5
+        slot = self.ring.acquire()
+        try:
+            shape = (len(crops), deepfake_detector.INPUT_SIZE, deepfake_detector.INPUT_SIZE, 3)
+            x = deepfake_detector.preprocess_faces(crops, out=self.ring.ndarray(slot, shape))
+            # O slot só é liberado após a resposta: o servidor lê direto dele
+            reply = self._call({"op": "predict", "shm": self.ring.descriptor(slot, x)})
+        except TimeoutError:
+            # Sem resposta o servidor pode ainda estar lendo o slot (a conexão já foi fechada em _call)
+            self.ring.retire(slot)
+            print(f"⚠️ Slot {slot} do ring retirado após timeout do model server ({self.ring.live} em uso).")
+            raise
+        except BaseException:
+            self.ring.release(slot)
+            raise
+        self.ring.release(slot)
+        return float(reply["fake"])
+
+    def health(self) -> dict:
+        return self._call({"op": "health"})
+
+    def reload(self, version: str = None) -> str:
+        """Hot-swap dos pesos no model server para a versão do registro local. Retorna a versão carregada."""
+        return self._call({"op": "reload", "version": version}, timeout=RELOAD_TIMEOUT_S)["version"]
+
+
+def _serve_connection(conn, jobs: queue.Queue):
+    """Lê requisições de um frontend. Predições vão para a fila do batcher; health responde direto."""
+    import deepfake_detector
+
+    try:
+        while True:
+            msg = conn.recv()
+            if msg.get("op") == "health":
+                conn.send({
+                    "models_loaded": len(deepfake_detector.models),
+                    "models_version": deepfake_detector.models_version,
+                    "device": deepfake_detector.DEVICE,
+                })
+                continue
+            if msg.get("op") == "reload":
+                # Roda nesta thread: o batcher segue atendendo com os modelos atuais até a troca
+                try:
+                    warm = os.environ.get("WARMUP", "1") != "0"
+                    version = deepfake_detector.reload_models(msg.get("version"), warm=warm)
+                    conn.send({"version": version})
+                except Exception as e:
+                    conn.send({"error": str(e)})
+                continue
+            # Lote via memória compartilhada: view sem cópia do slot do frontend
+            faces = shm_ring.view(msg["shm"]) if "shm" in msg else msg["faces"]
+            jobs.put((faces, conn))
+    except (EOFError, OSError):
+        pass
+    finally:
+        conn.close()
+
+
+def _batch_loop(jobs: queue.Queue):
+    """Agrupa lotes de vários frontends até BATCH_MAX_FACES ou BATCH_WAIT_MS e roda o ensemble."""
+    import deepfake_detector
+
+    carry = None
+    while True:
+        first = carry if carry is not None else jobs.get()
+        carry = None
+        batch = [first]
+        total = len(first[0])
+        deadline = time.monotonic() + BATCH_WAIT_MS / 1000.0
+        while total < BATCH_MAX_FACES:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                job = jobs.get(timeout=timeout)
+            except queue.Empty:
+                break
+            if total + len(job[0]) > BATCH_MAX_FACES:
+                carry = job
+                break
+            batch.append(job)
+            total += len(job[0])
+
+        try:
+            preds = deepfake_detector.predict_faces_batch([faces for faces, _ in batch])
+            replies = [{"fake": p} for p in preds]
+        except Exception as e:
+            replies = [{"error": str(e)}] * len(batch)
+        for (_, conn), reply in zip(batch, replies):
+            try:
+                conn.send(reply)
+            except (EOFError, OSError):
+                pass
+
+
+def serve(addr: str = MODEL_SERVER_ADDR):
+    import deepfake_detector
+
+    if not addr:
+        raise RuntimeError("Defina MODEL_SERVER_ADDR (ex.: /tmp/realityscan-models.sock).")
+    address = _address(addr)
+    authkey = _authkey(address)
+    if isinstance(address, str) and os.path.exists(address):
+        os.unlink(address)
+
+    deepfake_detector.load_models()
+    if os.environ.get("WARMUP", "1") != "0":
+        print(f"🔥 Warm-up EfficientNet: {deepfake_detector.warmup(face_extractors=0):.1f}s (buckets {deepfake_detector.FACE_BATCH_BUCKETS}).")
+    jobs = queue.Queue()
+    threading.Thread(target=_batch_loop, args=(jobs,), daemon=True).start()
+
+    # Socket criado já com 0600: nenhum outro usuário da máquina consegue conectar
+    umask = os.umask(0o177)
+    try:
+        listener = Listener(address, authkey=authkey)
+    finally:
+        os.umask(umask)
+    with listener:
+        print(f"✅ RealityScan Model Server em {addr}. Modelos EfficientNet B7 carregados ({deepfake_detector.DEVICE.upper()}).")
+        while True:
+            try:
+                conn = listener.accept()
+            except Exception as e:
+                print(f"⚠️ Conexão recusada: {e}")
+                continue
+            threading.Thread(target=_serve_connection, args=(conn, jobs), daemon=True).start()
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,327 @@
+"""
+Índice de hashes perceptuais de mídias já analisadas (near-duplicate de deepfakes conhecidos).
+Campanhas de golpe reutilizam o mesmo vídeo falso com pequenos re-encodes e crops:
+- pHash (DCT 64 bits) por keyframe + impressão digital de áudio (64 bits por janela de 2s)
+- BK-tree por distância de Hamming para busca rápida
+- Persistido em JSONL (PHASH_INDEX_PATH); vários workers compartilham o arquivo (append + releitura incremental)
+- Limitado a PHASH_MAX_RECORDS registros e PHASH_TTL_DAYS dias: acima disso o arquivo é compactado
+  (regravado só com os registros mais novos; os outros workers detectam a troca e relêem)
+- Hashes degenerados (frame preto/uniforme) são descartados: batem com qualquer tela vazia
+Um near-duplicate de um fake confirmado (fake >= PHASH_FAKE_THRESHOLD) é devolvido sem rodar o B7.
+"""
+import fcntl
+import json
+import os
+import subprocess
+import threading
+import time
+import uuid
+
+import cv2
+import numpy as np
+
+PHASH_INDEX_PATH = os.environ.get("PHASH_INDEX_PATH", "/app/data/phash_index.jsonl")
+PHASH_ENABLED = os.environ.get("PHASH_INDEX", "1") != "0"
+PHASH_KEYFRAMES = int(os.environ.get("PHASH_KEYFRAMES", 8))
+# Distância de Hamming máxima (em 64 bits) para considerar dois keyframes iguais
+PHASH_MAX_DISTANCE = int(os.environ.get("PHASH_MAX_DISTANCE", 10))
+# Fração mínima de keyframes (e de janelas de áudio) que precisam bater com o mesmo registro
+PHASH_MIN_MATCH = float(os.environ.get("PHASH_MIN_MATCH", 0.6))
+PHASH_FAKE_THRESHOLD = float(os.environ.get("PHASH_FAKE_THRESHOLD", 0.7))
+PHASH_AUDIO = os.environ.get("PHASH_AUDIO", "1") != "0"
+PHASH_MAX_RECORDS = int(os.environ.get("PHASH_MAX_RECORDS", 100000))
+PHASH_TTL_DAYS = float(os.environ.get("PHASH_TTL_DAYS", 90))
+
+# pHash de frame totalmente preto (DCT nula) e de frame uniforme (só o coeficiente DC acima da mediana)
+DEGENERATE_HASHES = frozenset((0x0, 0x8000000000000000))
+
+_AUDIO_SR = 8000
+_AUDIO_WINDOW_S = 2.0
+_AUDIO_HOP_S = 0.5
+_AUDIO_MAX_S = 60
+
+
+def phash(img: np.ndarray) -> int:
+    """pHash 64 bits: DCT do frame em cinza 32x32, bloco 8x8 de baixa frequência vs mediana."""
+    gray = img if img.ndim == 2 else cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low = cv2.dct(small)[:8, :8].flatten()
+    bits = low > np.median(low[1:])
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def frame_hashes(frames: list, keyframes: int = None, rgb: bool = False) -> list:
+    """
+    pHash dos frames (BGR, ou RGB com rgb=True), sem os hashes degenerados.
+    keyframes: usa só essa quantidade de frames igualmente espaçados (ex.: frames já amostrados para inferência).
+    """
+    frames = [f for f in frames if f is not None]
+    if keyframes and len(frames) > keyframes:
+        frames = [frames[i] for i in np.linspace(0, len(frames) - 1, keyframes, dtype=int)]
+    if rgb:
+        frames = [cv2.cvtColor(f, cv2.COLOR_RGB2GRAY) for f in frames]
+    return [h for h in map(phash, frames) if h not in DEGENERATE_HASHES]
+
+
+def audio_hashes(media_path: str) -> list:
+    """
+    Impressão digital de áudio: por janela de 2s (passo 0.5s), energia em 9 bandas log x 9 fatias;
+    cada bit = sinal da diferença entre bandas vizinhas variando no tempo (estilo Haitsma-Kalker).
+    Retorna [] se não houver áudio ou ffmpeg.
+    """
+    if not PHASH_AUDIO:
+        return []
+    try:
+        r = subprocess.run(
+            ["ffmpeg", "-v", "quiet", "-i", media_path, "-t", str(_AUDIO_MAX_S),
+             "-ac", "1", "-ar", str(_AUDIO_SR), "-f", "s16le", "-"],
+            capture_output=True, timeout=30,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return []
+    pcm = np.frombuffer(r.stdout, dtype=np.int16).astype(np.float32)
+    win, hop = int(_AUDIO_WINDOW_S * _AUDIO_SR), int(_AUDIO_HOP_S * _AUDIO_SR)
+    if r.returncode != 0 or len(pcm) < win or not np.any(pcm):
+        return []
+    edges = np.geomspace(300, 2000, 11)
+    freqs = np.fft.rfftfreq(win // 9, 1.0 / _AUDIO_SR)
+    band_idx = [(freqs >= lo) & (freqs < hi) for lo, hi in zip(edges[:-1], edges[1:])]
+    hashes = []
+    for start in range(0, len(pcm) - win + 1, hop):
+        slices = pcm[start:start + win][: (win // 9) * 9].reshape(9, -1)
+        spec = np.abs(np.fft.rfft(slices * np.hanning(slices.shape[1]), axis=1)) ** 2
+        energy = np.stack([spec[:, b].sum(axis=1) for b in band_idx[:9]], axis=1)
+        band_diff = energy[:, :-1] - energy[:, 1:]
+        bits = (band_diff[1:] - band_diff[:-1]) > 0
+        hashes.append(int(np.packbits(bits.flatten()).view(">u8")[0]))
+    return hashes
+
+
+def _hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+class BKTree:
+    """BK-tree sobre hashes de 64 bits; cada nó guarda os ids de registro com aquele hash."""
+
+    def __init__(self):
+        self.root = None
+
+    def add(self, h: int, rid: str):
+        if self.root is None:
+            self.root = [h, [rid], {}]
+            return
+        node = self.root
+        while True:
+            d = _hamming(h, node[0])
+            if d == 0:
+                node[1].append(rid)
+                return
+            child = node[2].get(d)
+            if child is None:
+                node[2][d] = [h, [rid], {}]
+                return
+            node = child
+
+    def search(self, h: int, max_dist: int) -> list:
+        """Retorna [(distância, id)] de todos os hashes a até max_dist de h."""
+        if self.root is None:
+            return []
+        found, stack = [], [self.root]
+        while stack:
+            node = stack.pop()
+            d = _hamming(h, node[0])
+            if d <= max_dist:
+                found.extend((d, rid) for rid in node[1])
+            for cd, child in node[2].items():
+                if d - max_dist <= cd <= d + max_dist:
+                    stack.append(child)
+        return found
+
+
+class PerceptualIndex:
+    def __init__(self, path: str = PHASH_INDEX_PATH, max_records: int = PHASH_MAX_RECORDS, ttl_days: float = PHASH_TTL_DAYS):
+        self.path = path
+        self.max_records = max_records
+        self.ttl_s = ttl_days * 86400 if ttl_days > 0 else None
+        self._lock = threading.Lock()
+        self._reset()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._lock:
+            self._refresh()
+
+    def _reset(self, ino: int = None):
+        self.records = {}
+        self.frames = BKTree()
+        self.audio = BKTree()
+        self._offset = 0
+        self._ino = ino
+
+    def _expired(self, rec: dict) -> bool:
+        return self.ttl_s is not None and rec.get("ts", 0) < time.time() - self.ttl_s
+
+    def _index(self, rec: dict):
+        rid = rec["id"]
+        self.records[rid] = rec
+        for h in rec.get("frames", []):
+            h = int(h, 16)
+            if h not in DEGENERATE_HASHES:
+                self.frames.add(h, rid)
+        for h in rec.get("audio", []):
+            self.audio.add(int(h, 16), rid)
+
+    def _refresh(self):
+        """Lê registros adicionados ao arquivo (inclusive por outros workers) desde a última leitura."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return
+        if st.st_ino != self._ino or st.st_size < self._offset:
+            # Arquivo compactado por outro worker: relê do início
+            self._reset(st.st_ino)
+        if st.st_size <= self._offset:
+            return
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                self._offset += len(line)
+                try:
+                    self._index(json.loads(line))
+                except (ValueError, KeyError):
+                    continue
+
+    def _best(self, tree: BKTree, hashes: list):
+        """Registro vigente com mais hashes da consulta dentro de PHASH_MAX_DISTANCE → (id, fração, dist média)."""
+        hits = {}
+        for h in hashes:
+            best_per_rid = {}
+            for d, rid in tree.search(h, PHASH_MAX_DISTANCE):
+                rec = self.records.get(rid)
+                if rec is None or self._expired(rec):
+                    continue
+                best_per_rid[rid] = min(d, best_per_rid.get(rid, d))
+            for rid, d in best_per_rid.items():
+                hits.setdefault(rid, []).append(d)
+        if not hits:
+            return None, 0.0, None
+        rid, dists = max(hits.items(), key=lambda kv: (len(kv[1]), -sum(kv[1])))
+        return rid, len(dists) / len(hashes), sum(dists) / len(dists)
+
+    def lookup(self, frames: list, audio=None):
+        """
+        Near-duplicate de fake confirmado, ou None. Áudio (se houver nos dois lados) precisa bater também.
+        audio: lista de hashes, ou função que os calcula — só chamada se algum registro com áudio bater nos frames.
+        """
+        frames = [h for h in frames if h not in DEGENERATE_HASHES]
+        if not frames:
+            return None
+        with self._lock:
+            self._refresh()
+            rid, score, dist = self._best(self.frames, frames)
+            if rid is None or score < PHASH_MIN_MATCH:
+                return None
+            rec = self.records[rid]
+            if rec.get("fake", 0) < PHASH_FAKE_THRESHOLD:
+                return None
+        audio_score = None
+        if rec.get("audio"):
+            if callable(audio):
+                # ffmpeg (até 30 s) fora do lock: consultas e registros dos outros threads seguem
+                audio = audio()
+            if audio:
+                with self._lock:
+                    arid, audio_score, _ = self._best(self.audio, audio)
+                if arid != rid or audio_score < PHASH_MIN_MATCH:
+                    return None
+        return {
+            "id": rid,
+            "fake": rec["fake"],
+            "resultado": rec.get("resultado"),
+            "analisado_em": rec.get("ts"),
+            "similaridade_frames": round(score, 3),
+            "similaridade_audio": round(audio_score, 3) if audio_score is not None else None,
+            "distancia_media": round(dist, 2),
+        }
+
+    def add(self, frames: list, audio, fake: float, resultado: str, tipo: str) -> str:
+        """
+        Registra a análise. Só fakes confirmados são indexados (os únicos que lookup devolve).
+        audio: lista de hashes ou função que os calcula (só chamada se o registro for gravado).
+        """
+        frames = [h for h in frames if h not in DEGENERATE_HASHES]
+        if not frames or fake < PHASH_FAKE_THRESHOLD:
+            return None
+        if callable(audio):
+            audio = audio()
+        rec = {
+            "id": uuid.uuid4().hex[:16],
+            "ts": int(time.time()),
+            "tipo": tipo,
+            "fake": round(fake, 4),
+            "resultado": resultado,
+            "frames": [f"{h:016x}" for h in frames],
+            "audio": [f"{h:016x}" for h in audio or []],
+        }
+        with self._lock:
+            f = self._open_locked()
+            try:
+                f.write((json.dumps(rec) + "\n").encode("utf-8"))
+                f.flush()
+                self._refresh()
+                if self._needs_compaction():
+                    self._compact()
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+                f.close()
+        return rec["id"]
+
+    def _open_locked(self):
+        """Abre o arquivo para append com flock exclusivo, garantindo que não foi trocado por uma compactação."""
+        while True:
+            f = open(self.path, "ab")
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                if os.fstat(f.fileno()).st_ino == os.stat(self.path).st_ino:
+                    return f
+            except FileNotFoundError:
+                pass
+            fcntl.flock(f, fcntl.LOCK_UN)
+            f.close()
+
+    def _needs_compaction(self) -> bool:
+        if len(self.records) > self.max_records:
+            return True
+        oldest = next(iter(self.records.values()), None)
+        return oldest is not None and self._expired(oldest)
+
+    def _compact(self):
+        """Regrava o arquivo (chamado com o flock tomado) só com os registros vigentes mais novos."""
+        keep = [rec for rec in self.records.values() if not self._expired(rec)]
+        # Sobra folga (10%) para não compactar a cada registro novo
+        keep = keep[len(keep) - int(self.max_records * 0.9):] if len(keep) > self.max_records else keep
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as out:
+            for rec in keep:
+                out.write((json.dumps(rec) + "\n").encode("utf-8"))
+        os.replace(tmp, self.path)
+        self._reset()
+        self._refresh()
+        print(f"🧹 Índice pHash compactado: {len(keep)} registros.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._refresh()
+            return {"registros": len(self.records), "max_registros": self.max_records}
+
+
+def open_index():
+    """Índice configurado pelo ambiente, ou None (desativado / caminho inacessível)."""
+    if not PHASH_ENABLED:
+        return None
+    try:
+        return PerceptualIndex(PHASH_INDEX_PATH)
+    except OSError as e:
+        print(f"⚠️ Índice pHash desativado ({e}).")
+        return None
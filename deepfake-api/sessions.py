@@ -0,0 +1,193 @@
+"""
+Fusão incremental de scores por sessão do Sentry ao vivo (cabeçalho X-Session-Id ou campo "sessao").
+Cada tick da chamada (frames / voz / lip-sync) é uma amostra de evidência:
+- Estatística acumulada por modalidade (média e desvio por Welford) e razão de log-verossimilhança
+  (SPRT de Wald: cada score p soma w·log(p/(1-p)); limites log((1-β)/α) e log(β/(1-α)))
+- Decidida a modalidade, os ticks seguintes não rodam modelo ("pausada"); a cada SESSION_RECHECK_S
+  roda uma verificação leve (1 frame / 2 s de áudio) que reabre a análise se discordar
+- Mudança de cena (pHash do frame) ou de locutor (espectro médio do áudio) zera a modalidade e volta
+  à amostragem completa
+O veredito da sessão soma as evidências das modalidades (independentes) vistas por este serviço.
+Estado em memória do processo: com vários workers, use afinidade de sessão no balanceador.
+"""
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SESSION_TTL_S = float(os.environ.get("SESSION_TTL_S", 600))
+SESSION_MAX = int(os.environ.get("SESSION_MAX", 10000))
+SPRT_ALPHA = float(os.environ.get("SPRT_ALPHA", 0.01))
+SPRT_BETA = float(os.environ.get("SPRT_BETA", 0.01))
+# Ticks consecutivos são correlacionados: cada um vale só uma fração de uma observação independente
+SESSION_EVIDENCE_WEIGHT = float(os.environ.get("SESSION_EVIDENCE_WEIGHT", 0.5))
+SESSION_MIN_SAMPLES = int(os.environ.get("SESSION_MIN_SAMPLES", 3))
+SESSION_RECHECK_S = float(os.environ.get("SESSION_RECHECK_S", 30))
+SESSION_SCENE_DISTANCE = int(os.environ.get("SESSION_SCENE_DISTANCE", 20))
+SESSION_SPEAKER_DISTANCE = float(os.environ.get("SESSION_SPEAKER_DISTANCE", 0.25))
+SESSION_LIGHT_FRAMES = int(os.environ.get("SESSION_LIGHT_FRAMES", 1))
+SESSION_LIGHT_AUDIO_S = float(os.environ.get("SESSION_LIGHT_AUDIO_S", 2))
+
+UPPER = math.log((1 - SPRT_BETA) / SPRT_ALPHA)
+LOWER = math.log(SPRT_BETA / (1 - SPRT_ALPHA))
+# Um único tick não decide sozinho (score 0.999 valeria ~7 nats)
+_MAX_STEP = 2.0
+
+FULL, LIGHT, SKIP = "completa", "leve", "pausada"
+
+
+def session_id(request, body: dict = None):
+    sid = request.headers.get("x-session-id")
+    if not sid and isinstance(body, dict):
+        sid = body.get("sessao") or body.get("sessionId")
+    return str(sid)[:128] if sid else None
+
+
+def hamming(a: int, b: int) -> int:
+    return bin(a ^ b).count("1")
+
+
+def speaker_signature(audio: np.ndarray, sr: int = 16000) -> np.ndarray:
+    """Espectro médio de longo prazo em 24 bandas log (timbre do locutor), centrado e normalizado."""
+    n_fft = 512
+    if len(audio) < n_fft:
+        return None
+    frames = np.lib.stride_tricks.sliding_window_view(audio, n_fft)[:: n_fft // 2]
+    spec = np.abs(np.fft.rfft(frames * np.hanning(n_fft), axis=1)) ** 2
+    freqs = np.fft.rfftfreq(n_fft, 1.0 / sr)
+    edges = np.geomspace(80, min(7600, sr / 2 - 1), 25)
+    bands = np.stack([spec[:, (freqs >= lo) & (freqs < hi)].sum(axis=1) for lo, hi in zip(edges[:-1], edges[1:])], axis=1)
+    ltas = np.log(bands.mean(axis=0) + 1e-10)
+    ltas -= ltas.mean()
+    norm = np.linalg.norm(ltas)
+    return ltas / norm if norm else None
+
+
+def cosine_distance(a: np.ndarray, b: np.ndarray) -> float:
+    return float(1.0 - np.dot(a, b))
+
+
+class Track:
+    """Evidência acumulada de uma modalidade numa sessão."""
+
+    __slots__ = ("n", "mean", "m2", "llr", "verdict", "signature", "last_run")
+
+    def __init__(self):
+        self.reset()
+        self.signature = None
+
+    def reset(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.llr = 0.0
+        self.verdict = None
+        self.last_run = 0.0
+
+    def update(self, p: float):
+        self.n += 1
+        delta = p - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (p - self.mean)
+        p = min(max(p, 1e-3), 1 - 1e-3)
+        step = SESSION_EVIDENCE_WEIGHT * math.log(p / (1 - p))
+        self.llr += max(-_MAX_STEP, min(_MAX_STEP, step))
+        if self.n >= SESSION_MIN_SAMPLES:
+            if self.llr >= UPPER:
+                self.verdict = "fake"
+            elif self.llr <= LOWER:
+                self.verdict = "real"
+
+    def summary(self) -> dict:
+        return {
+            "amostras": self.n,
+            "media": round(self.mean, 4),
+            "desvio": round(math.sqrt(self.m2 / (self.n - 1)), 4) if self.n > 1 else None,
+            "llr": round(self.llr, 3),
+            "veredito": self.verdict,
+        }
+
+
+class Session:
+    __slots__ = ("tracks", "ts")
+
+    def __init__(self):
+        self.tracks = {}
+        self.ts = time.monotonic()
+
+
+class SessionStore:
+    def __init__(self):
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {FULL: 0, LIGHT: 0, SKIP: 0, "mudancas": 0, "reaberturas": 0}
+
+    def _get(self, sid: str) -> Session:
+        now = time.monotonic()
+        session = self._sessions.get(sid)
+        if session is None:
+            while self._sessions:
+                oldest = next(iter(self._sessions.values()))
+                if len(self._sessions) < SESSION_MAX and now - oldest.ts < SESSION_TTL_S:
+                    break
+                self._sessions.popitem(last=False)
+            session = self._sessions[sid] = Session()
+        self._sessions.move_to_end(sid)
+        session.ts = now
+        return session
+
+    def plan(self, sid: str, modality: str, signature=None, distance=None, threshold=None) -> str:
+        """
+        Quanto analisar neste tick: FULL (modalidade indecisa ou cena/locutor mudou), LIGHT (decidida,
+        verificação periódica) ou SKIP (decidida; devolve o acumulado sem rodar modelo).
+        """
+        with self._lock:
+            track = self._get(sid).tracks.setdefault(modality, Track())
+            if signature is not None:
+                if track.signature is not None and distance(signature, track.signature) > threshold:
+                    track.reset()
+                    self.counters["mudancas"] += 1
+                track.signature = signature
+            if track.verdict is None:
+                mode = FULL
+            elif SESSION_RECHECK_S > 0 and time.monotonic() - track.last_run >= SESSION_RECHECK_S:
+                mode = LIGHT
+            else:
+                mode = SKIP
+            self.counters[mode] += 1
+            return mode
+
+    def record(self, sid: str, modality: str, score: float, mode: str):
+        """Soma o score do tick. Verificação leve que contradiz o veredito reabre a amostragem completa."""
+        with self._lock:
+            track = self._get(sid).tracks.setdefault(modality, Track())
+            if mode == LIGHT and track.verdict is not None and (score >= 0.5) != (track.verdict == "fake"):
+                track.reset()
+                self.counters["reaberturas"] += 1
+            track.update(score)
+            track.last_run = time.monotonic()
+
+    def modality_score(self, sid: str, modality: str) -> float:
+        with self._lock:
+            track = self._get(sid).tracks.get(modality)
+            return track.mean if track and track.n else 0.5
+
+    def summary(self, sid: str, mode: str = None) -> dict:
+        """Bloco "sessao" da resposta: veredito fundido (soma dos LLR) e estado de cada modalidade."""
+        with self._lock:
+            tracks = self._get(sid).tracks
+            llr = sum(t.llr for t in tracks.values())
+            verdict = "fake" if llr >= UPPER else "real" if llr <= LOWER else None
+            return {
+                "id": sid,
+                "amostragem": mode,
+                "veredito": verdict,
+                "fake": round(1.0 / (1.0 + math.exp(-llr)), 4),
+                "modalidades": {name: t.summary() for name, t in tracks.items() if t.n},
+            }
+
+    def stats(self) -> dict:
+        return {"ativas": len(self._sessions), **self.counters}
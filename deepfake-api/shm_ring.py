@@ -0,0 +1,163 @@
+"""
+Ring buffer em memória compartilhada (multiprocessing.shared_memory) para lotes de faces.
+O frontend escreve o lote pré-processado direto num slot e envia ao model server só um
+descritor { name, offset, shape, dtype }; o servidor lê o slot sem cópia nem pickle.
+Quando todos os slots estão ocupados, acquire() bloqueia (backpressure) até SHM_RING_TIMEOUT_S.
+O /dev/shm é tmpfs: escrever além do espaço livre mata o processo com SIGBUS. Por isso o ring
+só usa os slots que cabem (fitting_slots) e reserva as páginas na criação (ENOSPC vira OSError).
+"""
+import atexit
+import os
+import queue
+import secrets
+import threading
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+
+SHM_PREFIX = "realityscan-ring-"
+SHM_RING_SLOTS = int(os.environ.get("SHM_RING_SLOTS", 2))
+SHM_RING_TIMEOUT_S = float(os.environ.get("SHM_RING_TIMEOUT_S", 30))
+SHM_DIR = "/dev/shm"
+# Fração do espaço livre do /dev/shm que um ring pode reservar: o tmpfs é dividido com os
+# outros workers e com o rascunho das requisições (SCRATCH_TMPFS_DIR)
+SHM_RING_FREE_FRACTION = 0.5
+
+
+def _untrack(shm: shared_memory.SharedMemory):
+    """Evita que o resource_tracker de um processo que só anexou o segmento o apague ao sair."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.unregister(shm._name, "shared_memory")
+    except Exception:
+        pass
+
+
+def fitting_slots(slot_bytes: int, slots: int = SHM_RING_SLOTS) -> int:
+    """Quantos dos `slots` cabem em SHM_RING_FREE_FRACTION do espaço livre do /dev/shm (0 = usar o socket)."""
+    try:
+        st = os.statvfs(SHM_DIR)
+    except OSError:
+        return 0
+    budget = int(st.f_bavail * st.f_frsize * SHM_RING_FREE_FRACTION)
+    return max(0, min(slots, budget // slot_bytes))
+
+
+class ShmRing:
+    """Ring de slots de tamanho fixo, criado e liberado pelo processo produtor (frontend)."""
+
+    def __init__(self, slot_bytes: int, slots: int = SHM_RING_SLOTS):
+        self.slot_bytes = slot_bytes
+        self.slots = slots
+        # Nome único por ring (não só o pid): o consumidor guarda segmentos anexados pelo nome, e um
+        # ring recriado (ou um pid reaproveitado) com o mesmo nome seria lido do segmento antigo
+        self.shm = shared_memory.SharedMemory(
+            create=True, size=slot_bytes * slots, name=f"{SHM_PREFIX}{os.getpid()}-{secrets.token_hex(4)}"
+        )
+        try:
+            # Reserva as páginas agora: sem espaço é OSError aqui, não SIGBUS no meio de uma inferência
+            os.posix_fallocate(self.shm._fd, 0, slot_bytes * slots)
+        except OSError:
+            self.close()
+            raise
+        # Slots ainda em circulação (retire() tira de vez os que o consumidor pode estar lendo)
+        self.live = slots
+        self._live_lock = threading.Lock()
+        self._free = queue.Queue()
+        for i in range(slots):
+            self._free.put(i)
+        atexit.register(self.close)
+
+    @property
+    def name(self) -> str:
+        return self.shm.name
+
+    def acquire(self, timeout: float = SHM_RING_TIMEOUT_S) -> int:
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            raise TimeoutError("Sem slots livres na memória compartilhada (servidor sobrecarregado).")
+
+    def release(self, slot: int):
+        self._free.put(slot)
+
+    def retire(self, slot: int):
+        """
+        Tira o slot de circulação em vez de liberar: sem resposta do consumidor (timeout) ele pode
+        ainda estar lendo o slot, e reescrevê-lo trocaria as faces de outra análise.
+        """
+        with self._live_lock:
+            self.live -= 1
+
+    @contextmanager
+    def slot(self, timeout: float = SHM_RING_TIMEOUT_S):
+        idx = self.acquire(timeout)
+        try:
+            yield idx
+        finally:
+            self.release(idx)
+
+    def ndarray(self, slot: int, shape: tuple, dtype=np.uint8) -> np.ndarray:
+        """View numpy sobre o slot (escrita in-place pelo produtor)."""
+        dtype = np.dtype(dtype)
+        if int(np.prod(shape)) * dtype.itemsize > self.slot_bytes:
+            raise ValueError(f"Lote {shape} não cabe no slot ({self.slot_bytes} bytes).")
+        return np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=slot * self.slot_bytes)
+
+    def descriptor(self, slot: int, arr: np.ndarray) -> dict:
+        return {
+            "name": self.name,
+            "offset": slot * self.slot_bytes,
+            "shape": tuple(arr.shape),
+            "dtype": arr.dtype.str,
+        }
+
+    def close(self):
+        try:
+            self.shm.close()
+            self.shm.unlink()
+        except (FileNotFoundError, BufferError):
+            pass
+
+
+# Segmentos anexados pelo consumidor (model server), por nome
+_attached = {}
+_attached_lock = threading.Lock()
+_MAX_ATTACHED = 32
+
+
+def view(desc: dict) -> np.ndarray:
+    """Consumidor: retorna view numpy (sem cópia) do lote descrito por desc."""
+    with _attached_lock:
+        shm = _attached.get(desc["name"])
+        if shm is None:
+            if len(_attached) >= _MAX_ATTACHED:
+                old = _attached.pop(next(iter(_attached)))
+                try:
+                    old.close()
+                except BufferError:
+                    pass
+            shm = shared_memory.SharedMemory(name=desc["name"])
+            _untrack(shm)
+            _attached[desc["name"]] = shm
+    return np.ndarray(tuple(desc["shape"]), dtype=np.dtype(desc["dtype"]), buffer=shm.buf, offset=desc["offset"])
+
+
+def cleanup_orphans():
+    """Remove rings de frontends que morreram sem liberar o segmento (pid no início do nome)."""
+    if not os.path.isdir(SHM_DIR):
+        return
+    for fname in os.listdir(SHM_DIR):
+        if not fname.startswith(SHM_PREFIX):
+            continue
+        try:
+            pid = int(fname[len(SHM_PREFIX):].split("-", 1)[0])
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            try:
+                os.unlink(os.path.join(SHM_DIR, fname))
+            except OSError:
+                pass
+        except (ValueError, PermissionError):
+            pass
@@ -0,0 +1,146 @@
+"""
+Decodificação de vídeo só dos frames amostrados (substitui kernel_utils.VideoReader).
+- PyAV (se instalado): decodificador com threads, seek para o keyframe anterior a cada amostra
+  distante e conversão/redução de resolução no próprio swscale
+- Fallback OpenCV: grab() sem conversão nos frames pulados, retrieve() só nos amostrados,
+  seek (CAP_PROP_POS_FRAMES) quando a próxima amostra está longe
+Frames maiores que DECODE_MAX_SIDE são reduzidos (faces em vídeos 4K continuam bem acima de 380px).
+O limite é fixo, não depende do tamanho das faces (que só se conhece depois do MTCNN).
+Cada leitura registra decoder, decode_ms, seeks e frames_sampled em self.stats, mais:
+- PyAV: frames_decoded, contagem real de frames que passaram pelo decodificador
+- OpenCV: frames_grabbed, só os grab() feitos aqui; o CAP_PROP_POS_FRAMES decodifica a partir do
+  keyframe anterior por dentro do OpenCV e esses frames não são visíveis (por isso não é frames_decoded)
+"""
+import os
+import time
+
+import cv2
+import numpy as np
+
+VIDEO_DECODER = os.environ.get("VIDEO_DECODER", "auto").strip().lower()
+DECODE_MAX_SIDE = int(os.environ.get("DECODE_MAX_SIDE", 1920))
+DECODE_THREADS = int(os.environ.get("DECODE_THREADS", 0))
+# Distância (s) a partir da qual compensa buscar o keyframe em vez de decodificar em sequência
+SEEK_MIN_GAP_S = float(os.environ.get("DECODE_SEEK_MIN_GAP_S", 2.0))
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def _target_size(w: int, h: int) -> tuple:
+    if DECODE_MAX_SIDE <= 0 or max(w, h) <= DECODE_MAX_SIDE:
+        return w, h
+    scale = DECODE_MAX_SIDE / max(w, h)
+    # swscale exige dimensões pares em vários formatos
+    return max(2, int(w * scale) // 2 * 2), max(2, int(h * scale) // 2 * 2)
+
+
+class SampledVideoReader:
+    """Interface compatível com kernel_utils.VideoReader.read_frames: retorna (frames RGB, índices)."""
+
+    def __init__(self):
+        self.stats = {}
+
+    def read_frames(self, path: str, num_frames: int):
+        t0 = time.perf_counter()
+        use_av = av is not None and VIDEO_DECODER in ("auto", "pyav")
+        result = None
+        if use_av:
+            self.stats = {"decoder": "pyav", "frames_decoded": 0, "seeks": 0, "frames_sampled": 0}
+            try:
+                result = self._read_pyav(path, num_frames)
+            except Exception as e:
+                print(f"⚠️ PyAV falhou ({e}); usando OpenCV.")
+        if result is None:
+            self.stats = {"decoder": "opencv", "frames_grabbed": 0, "seeks": 0, "frames_sampled": 0}
+            result = self._read_opencv(path, num_frames)
+        self.stats["decode_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        if result is not None:
+            self.stats["frames_sampled"] = len(result[1])
+        return result
+
+    def _read_pyav(self, path: str, num_frames: int):
+        with av.open(path) as container:
+            stream = container.streams.video[0]
+            stream.thread_type = "AUTO"
+            if DECODE_THREADS > 0:
+                stream.thread_count = DECODE_THREADS
+            rate = float(stream.average_rate or stream.guessed_rate or 25)
+            tb = float(stream.time_base)
+            total = stream.frames
+            if total <= 0:
+                duration = stream.duration * tb if stream.duration else (container.duration or 0) / 1e6
+                total = int(duration * rate)
+            if total <= 0:
+                return None
+            targets = np.unique(np.linspace(0, total - 1, num_frames, endpoint=True, dtype=int))
+            w, h = _target_size(stream.codec_context.width, stream.codec_context.height)
+
+            frames, idxs = [], []
+            decoder = None
+            pos_t = -1.0
+            start_pts = stream.start_time or 0
+            for idx in targets:
+                t = idx / rate
+                if decoder is None or t - pos_t > SEEK_MIN_GAP_S:
+                    # Seek para o keyframe anterior à amostra (backward) e recomeça a decodificação
+                    container.seek(start_pts + int(t / tb), stream=stream, backward=True, any_frame=False)
+                    self.stats["seeks"] += 1
+                    decoder = container.decode(stream)
+                for frame in decoder:
+                    self.stats["frames_decoded"] += 1
+                    if frame.pts is None:
+                        continue
+                    pos_t = (frame.pts - start_pts) * tb
+                    if pos_t + 0.5 / rate < t:
+                        continue
+                    frames.append(frame.to_ndarray(format="rgb24", width=w, height=h))
+                    idxs.append(int(idx))
+                    break
+                else:
+                    break
+            if not frames:
+                return None
+            return np.stack(frames), idxs
+
+    def _read_opencv(self, path: str, num_frames: int):
+        cap = cv2.VideoCapture(path)
+        try:
+            total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+            if total <= 0:
+                return None
+            fps = cap.get(cv2.CAP_PROP_FPS) or 25
+            seek_gap = int(SEEK_MIN_GAP_S * fps)
+            targets = np.unique(np.linspace(0, total - 1, num_frames, endpoint=True, dtype=int))
+            frames, idxs = [], []
+            pos = 0
+            for idx in targets:
+                if idx - pos > seek_gap:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, int(idx))
+                    self.stats["seeks"] += 1
+                    pos = int(idx)
+                while pos < idx:
+                    if not cap.grab():
+                        break
+                    self.stats["frames_grabbed"] += 1
+                    pos += 1
+                if pos != idx or not cap.grab():
+                    break
+                self.stats["frames_grabbed"] += 1
+                pos += 1
+                ok, frame = cap.retrieve()
+                if not ok:
+                    continue
+                h, w = frame.shape[:2]
+                tw, th = _target_size(w, h)
+                if (tw, th) != (w, h):
+                    frame = cv2.resize(frame, (tw, th), interpolation=cv2.INTER_AREA)
+                frames.append(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                idxs.append(int(idx))
+            if not frames:
+                return None
+            return np.stack(frames), idxs
+        finally:
+            cap.release()
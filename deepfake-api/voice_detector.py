@@ -3,79 +3,213 @@ Detector de voz sintética / deepfake de áudio.
 wav2vec2 + modelo anti-deepfake (HuggingFace).
 """
 
+import os
 import tempfile
+import threading
 from pathlib import Path
 
-# Lazy load para não travar startup se deps não estiverem
-_voice_model = None
-_processor = None
+import model_registry
+import stub_models
+from stub_models import STUB_MODELS
 
+VOICE_MODEL = os.environ.get("DEEPFAKE_VOICE_MODEL", "alexandreacff/wav2vec2-large-ft-fake-detection")
 
-def _ensure_voice_model():
-    global _voice_model, _processor
-    if _voice_model is not None:
-        return _voice_model, _processor
-    try:
-        from transformers import Wav2Vec2ForSequenceClassification, Wav2Vec2FeatureExtractor
-        import torch
-        model_name = "alexandreacff/wav2vec2-large-ft-fake-detection"
+# Lazy load para não travar startup se deps não estiverem.
+# (modelo, processor) numa única referência: o hot-swap troca os dois juntos
+_voice = None
+_voice_version = None
+_voice_lock = threading.Lock()
+# CURRENT visto na última checagem (model_registry.current_stamp): outro worker pode ter trocado a versão
+_current_seen = None
+
+
+def _load_voice(version: str = None):
+    if STUB_MODELS:
+        return version or "stub", ("stub", "stub")
+    model_registry.offline()
+    from transformers import Wav2Vec2ForSequenceClassification, Wav2Vec2FeatureExtractor
+    import torch
+
+    if model_registry.enabled():
+        # Só do registro local (safetensors via mmap); sem fallback para outro checkpoint
+        version = model_registry.checked(version)
+        path = model_registry.voice_model(VOICE_MODEL, version)
+        model = Wav2Vec2ForSequenceClassification.from_pretrained(path, local_files_only=True)
+        processor = Wav2Vec2FeatureExtractor.from_pretrained(path, local_files_only=True)
+    else:
+        model_name = VOICE_MODEL
         try:
-            _voice_model = Wav2Vec2ForSequenceClassification.from_pretrained(model_name)
-            _processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
+            model = Wav2Vec2ForSequenceClassification.from_pretrained(model_name)
+            processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
         except Exception:
             model_name = "facebook/wav2vec2-base-960h"
-            _voice_model = Wav2Vec2ForSequenceClassification.from_pretrained(model_name, num_labels=2)
-            _processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
-        _voice_model.eval()
-        if torch.cuda.is_available():
-            _voice_model = _voice_model.cuda()
-        return _voice_model, _processor
-    except ImportError:
-        return None, None
+            model = Wav2Vec2ForSequenceClassification.from_pretrained(model_name, num_labels=2)
+            processor = Wav2Vec2FeatureExtractor.from_pretrained(model_name)
+    model.eval()
+    if torch.cuda.is_available():
+        model = model.cuda()
+    return version, (model, processor)
 
 
-def analyze_audio_synthetic(audio_path: str) -> dict:
+def _follow_current():
     """
-    Analisa áudio e retorna probabilidade de ser sintético/fake.
-    Returns: { "synthetic": float 0-1, "real": float, "resultado": str }
+    Com vários workers (frontends do model server) só o que atendeu /admin/modelos/ativar roda
+    reload_voice; os demais veem o CURRENT mudar aqui e trocam o wav2vec2 antes da próxima inferência.
+    Enquanto um thread recarrega, os outros seguem com a versão antiga em vez de esperar.
     """
-    import librosa
+    global _current_seen
+    stamp = model_registry.current_stamp()
+    if stamp is None or stamp == _current_seen or not _voice_lock.acquire(blocking=False):
+        return
+    try:
+        version = model_registry.current_version()
+        if version != _voice_version:
+            _swap_voice(version, ())
+            print(f"🔄 wav2vec2 trocado para a versão {version} (CURRENT).")
+    except Exception as e:
+        print(f"⚠️ Troca do wav2vec2 para o CURRENT falhou ({e}); seguindo com a versão {_voice_version}.")
+    finally:
+        _current_seen = stamp
+        _voice_lock.release()
+
+
+def _ensure_voice_model():
+    global _voice, _voice_version
+    voice = _voice
+    if voice is not None:
+        if model_registry.enabled():
+            _follow_current()
+            voice = _voice
+        return voice
+    with _voice_lock:
+        if _voice is None:
+            try:
+                _voice_version, _voice = _load_voice()
+            except ImportError:
+                return None, None
+            except model_registry.RegistryError:
+                # Registro ativo sem o modelo (ou corrompido): erro, nunca o resultado "indisponível"
+                raise
+            except Exception as e:
+                print(f"⚠️ Modelo de voz indisponível ({e}).")
+                return None, None
+        return _voice
+
+
+def reload_voice(version: str = None, warm_seconds=()) -> str:
+    """
+    Hot-swap do wav2vec2: carrega a versão, aquece com áudio sintético de warm_seconds e só então
+    troca a referência; análises em andamento usam a antiga.
+    """
+    with _voice_lock:
+        return _swap_voice(version, warm_seconds)
+
+
+def _swap_voice(version: str, warm_seconds) -> str:
+    """Corpo de reload_voice; chamar com _voice_lock."""
+    import numpy as np
+
+    global _voice, _voice_version
+    new_version, (model, processor) = _load_voice(version)
+    for sec in warm_seconds:
+        _score(model, processor, np.random.uniform(-0.1, 0.1, int(16000 * sec)).astype(np.float32))
+    _voice_version, _voice = new_version, (model, processor)
+    return _voice_version
+
+
+def _score(model, processor, audio) -> float:
+    """Probabilidade de voz sintética para áudio mono 16kHz (np.ndarray)."""
+    if model == "stub":
+        stub_models.delay(stub_models.STUB_VOICE_MS_PER_S * len(audio) / 16000)
+        return stub_models.score(audio.tobytes())
     import torch
 
+    inputs = processor(audio, sampling_rate=16000, return_tensors="pt", padding=True, truncation=True, max_length=16000*30)
+    device = next(model.parameters()).device
+    inputs = {k: v.to(device) for k, v in inputs.items()}
+
+    with torch.no_grad():
+        logits = model(**inputs).logits
+        probs = torch.softmax(logits, dim=-1).cpu().numpy()[0]
+
+    return float(probs[1]) if len(probs) > 1 else float(probs[0])
+
+
+def warmup(seconds: list) -> float:
+    """Carrega o wav2vec2 e roda áudio sintético nas durações informadas. Retorna o tempo gasto (s)."""
+    import time
+    import numpy as np
+
+    t0 = time.perf_counter()
+    model, processor = _ensure_voice_model()
+    if model is not None and processor is not None:
+        for sec in seconds:
+            _score(model, processor, np.random.uniform(-0.1, 0.1, int(16000 * sec)).astype(np.float32))
+    return time.perf_counter() - t0
+
+
+def load_audio(audio_path: str):
+    """Áudio mono 16kHz (até 30 s)."""
+    import librosa
+
+    audio, _ = librosa.load(audio_path, sr=16000, mono=True, duration=30)
+    return audio
+
+
+def score_audio(audio) -> float:
+    """Probabilidade de voz sintética, ou None se o modelo não está disponível / áudio curto demais."""
+    model, processor = _ensure_voice_model()
+    if model is None or processor is None or len(audio) < 1600:
+        return None
+    return _score(model, processor, audio)
+
+
+def voice_result(synthetic: float) -> dict:
+    if synthetic >= 0.7:
+        resultado = "voz provavelmente sintética/IA"
+    elif synthetic >= 0.5:
+        resultado = "suspeito de voz sintética"
+    elif synthetic >= 0.3:
+        resultado = "indeterminado"
+    else:
+        resultado = "voz aparenta ser real"
+
+    return {
+        "synthetic": round(synthetic, 4),
+        "real": round(1.0 - synthetic, 4),
+        "resultado": resultado,
+        "score_synthetic_pct": round(synthetic * 100, 1),
+    }
+
+
+def error_result(e: Exception) -> dict:
+    """Resposta de analyze_audio_synthetic quando o áudio não carrega ou o modelo falha."""
+    return {"synthetic": 0.5, "real": 0.5, "resultado": f"erro: {str(e)}", "score_synthetic_pct": 50}
+
+
+def analyze_audio(audio) -> dict:
+    """Como analyze_audio_synthetic, para áudio já carregado (load_audio)."""
     model, processor = _ensure_voice_model()
     if model is None or processor is None:
         return {"synthetic": 0.5, "real": 0.5, "resultado": "módulo de voz não disponível", "score_synthetic_pct": 50}
+    if len(audio) < 1600:
+        return {"synthetic": 0.5, "real": 0.5, "resultado": "áudio muito curto", "score_synthetic_pct": 50}
+    try:
+        return voice_result(_score(model, processor, audio))
+    except Exception as e:
+        return error_result(e)
 
+
+def analyze_audio_synthetic(audio_path: str) -> dict:
+    """
+    Analisa áudio e retorna probabilidade de ser sintético/fake.
+    Returns: { "synthetic": float 0-1, "real": float, "resultado": str }
+    """
+    model, processor = _ensure_voice_model()
+    if model is None or processor is None:
+        return {"synthetic": 0.5, "real": 0.5, "resultado": "módulo de voz não disponível", "score_synthetic_pct": 50}
     try:
-        audio, sr = librosa.load(audio_path, sr=16000, mono=True, duration=30)
-        if len(audio) < 1600:
-            return {"synthetic": 0.5, "real": 0.5, "resultado": "áudio muito curto", "score_synthetic_pct": 50}
-
-        inputs = processor(audio, sampling_rate=16000, return_tensors="pt", padding=True, truncation=True, max_length=16000*30)
-        device = next(model.parameters()).device
-        inputs = {k: v.to(device) for k, v in inputs.items()}
-
-        with torch.no_grad():
-            logits = model(**inputs).logits
-            probs = torch.softmax(logits, dim=-1).cpu().numpy()[0]
-
-        synthetic = float(probs[1]) if len(probs) > 1 else float(probs[0])
-        real = 1.0 - synthetic
-
-        if synthetic >= 0.7:
-            resultado = "voz provavelmente sintética/IA"
-        elif synthetic >= 0.5:
-            resultado = "suspeito de voz sintética"
-        elif synthetic >= 0.3:
-            resultado = "indeterminado"
-        else:
-            resultado = "voz aparenta ser real"
-
-        return {
-            "synthetic": round(synthetic, 4),
-            "real": round(real, 4),
-            "resultado": resultado,
-            "score_synthetic_pct": round(synthetic * 100, 1),
-        }
+        audio = load_audio(audio_path)
     except Exception as e:
-        return {"synthetic": 0.5, "real": 0.5, "resultado": f"erro: {str(e)}", "score_synthetic_pct": 50}
+        return error_result(e)
+    return analyze_audio(audio)
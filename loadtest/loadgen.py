@@ -0,0 +1,428 @@
+"""
+Gerador de carga para deepfake-api e voice-api (dimensionamento de RunPod / Cloud Run).
+Reproduz o padrão de chamadas do proxy Node (proxy.py) em malha aberta: as chegadas seguem o
+trace no tempo, independente de quanto o servidor demora, então a fila aparece como latência.
+
+Tráfego:
+  sintético  --rates 0.5,1,2,4   chegadas Poisson de ações de usuário por segundo, conforme --mix:
+             sentry  = sessão ao vivo; a cada --tick-s: frames (deepfake-api) + áudio (voice-api),
+                       lip-sync a cada --lipsync-every ticks (como o /api/scan do server.js);
+                       com --sessions os ticks levam X-Session-Id e repetem a mesma cena/locutor
+             video / audio / lipsync = upload avulso; bulk = /analisar-lote com --bulk-items vídeos
+  gravado    --trace trafego.jsonl --speeds 1,2,4   linhas do TRAFFIC_TRACE_PATH dos serviços
+
+Relatório por degrau: carga oferecida, vazão útil, p50/p90/p99, 429/503/504, coalescidas e pico
+de memória dos serviços (com --spawn). Ao final: vazão de saturação e joelho da curva.
+
+Uso:
+  python loadtest/loadgen.py --spawn --rates 0.2,0.5,1,2 --duration 60
+  python loadtest/loadgen.py --deepfake-url http://gpu:8000 --voice-url http://gpu:8001 --trace t.jsonl --speeds 1,4
+  python loadtest/loadgen.py --write-trace sintetico.jsonl --rates 1 --duration 300
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import payloads  # noqa: E402
+from proxy import NodeProxy  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MIX = "sentry=0.6,video=0.2,audio=0.1,lipsync=0.05,bulk=0.05"
+# Variantes de vídeo geradas (caro); o conteúdo de cada requisição é único via bytes extras no fim
+VIDEO_VARIANTS = 8
+# Rota gravada pelos serviços → chamada do proxy
+PATH_CALLS = {
+    "/analisar": "video",
+    "/analisar-frames": "frames",
+    "/analisar-audio": "audio",
+    "/analisar-audio-base64": "audio_b64",
+    "/analisar-lipsync": "lipsync",
+    "/analisar-lipsync-sentry": "lipsync_sentry",
+    "/analisar-lote": "bulk",
+}
+
+
+def parse_mix(spec: str) -> dict:
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        mix[name.strip()] = float(weight or 1)
+    total = sum(mix.values())
+    return {k: v / total for k, v in mix.items()}
+
+
+def synthetic_trace(rate: float, duration: float, mix: dict, args, rng: random.Random) -> list:
+    """Eventos {t, call, seed, user} de chegadas Poisson de ações de usuário."""
+    events = []
+    kinds, weights = list(mix), list(mix.values())
+    t, n = 0.0, 0
+    while True:
+        t += rng.expovariate(rate)
+        if t >= duration:
+            break
+        n += 1
+        user = f"u{n}"
+        kind = rng.choices(kinds, weights)[0]
+        viral = rng.random() < args.duplicate_ratio
+        if kind == "sentry":
+            tick = 0
+            while t + tick * args.tick_s < min(duration, t + args.session_s):
+                at = t + tick * args.tick_s
+                # Com --sessions a chamada fica na mesma cena/locutor (a sessão pode pausar os modelos)
+                seed = n * 1000 + (0 if args.sessions else tick)
+                extra = {"session": user} if args.sessions else {}
+                events.append({"t": at, "call": "frames", "seed": seed, "user": user, **extra})
+                events.append({"t": at, "call": "audio_b64", "seed": seed, "user": user, **extra})
+                if tick % args.lipsync_every == 0:
+                    events.append({"t": at, "call": "lipsync_sentry", "seed": seed, "user": user, **extra})
+                tick += 1
+        else:
+            call = kind
+            events.append({"t": t, "call": call, "seed": -1 if viral else n, "user": user})
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def recorded_trace(path: str) -> list:
+    """Linhas JSONL do TRAFFIC_TRACE_PATH (ou de --write-trace) → eventos com t relativo ao primeiro."""
+    events = []
+    with open(path) as f:
+        for i, line in enumerate(f):
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            call = rec.get("call") or PATH_CALLS.get(rec.get("path"))
+            if call:
+                events.append({
+                    "t": float(rec["t"]),
+                    "call": call,
+                    "seed": rec.get("seed", i),
+                    "user": rec.get("user") or rec.get("client"),
+                    "bytes": rec.get("bytes", 0),
+                    "session": rec.get("session"),
+                })
+    if events:
+        t0 = min(e["t"] for e in events)
+        for e in events:
+            e["t"] -= t0
+    events.sort(key=lambda e: e["t"])
+    return events
+
+
+def _video(ev: dict) -> bytes:
+    seed = ev["seed"]
+    if seed < 0:
+        return payloads.video_bytes(0)  # mesmo arquivo para todos: coalescência / índice pHash
+    base = payloads.scaled_video(seed % VIDEO_VARIANTS, ev["bytes"]) if ev.get("bytes") else payloads.video_bytes(seed % VIDEO_VARIANTS)
+    return base + seed.to_bytes(8, "little")
+
+
+def _audio(ev: dict) -> bytes:
+    if ev.get("bytes"):
+        return payloads.scaled_audio(ev["seed"], ev["bytes"])
+    return payloads.wav_bytes(max(ev["seed"], 0))
+
+
+def fire(proxy: NodeProxy, ev: dict, args):
+    call, seed, user, session = ev["call"], ev["seed"], ev.get("user"), ev.get("session")
+    if call == "frames":
+        return proxy.analyze_frames_deepfake(payloads.jpeg_frames(seed, args.frames), user, session)
+    if call == "audio_b64":
+        return proxy.analyze_audio_voice(payloads.audio_data_url(seed), user, session)
+    if call == "lipsync_sentry":
+        frames = payloads.jpeg_frames(seed, args.frames)
+        return proxy.analyze_lipsync_sentry(frames, payloads.audio_data_url(seed), user, session)
+    if call == "video":
+        return proxy.analyze_video_deepfake(_video(ev), user)
+    if call == "audio":
+        return proxy.analyze_audio_synthetic(_audio(ev), user)
+    if call == "lipsync":
+        return proxy.analyze_lipsync(_video(ev), user)
+    if call == "bulk":
+        return proxy.analyze_bulk([_video(dict(ev, seed=seed * 100 + i)) for i in range(args.bulk_items)], user)
+    raise ValueError(f"chamada desconhecida: {call}")
+
+
+def _proc_tree(pid: int) -> list:
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    tree, stack = [], [pid]
+    while stack:
+        p = stack.pop()
+        tree.append(p)
+        stack.extend(children.get(p, []))
+    return tree
+
+
+def _mem_kb(pid: int) -> tuple:
+    """(VmRSS, VmHWM) em kB."""
+    rss = hwm = 0
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    rss = int(line.split()[1])
+                elif line.startswith("VmHWM:"):
+                    hwm = int(line.split()[1])
+    except OSError:
+        pass
+    return rss, hwm
+
+
+class MemorySampler(threading.Thread):
+    """Pico de RSS (soma da árvore de processos, inclui workers e ffmpeg) e maior VmHWM por serviço."""
+
+    def __init__(self, pids: dict, interval: float = 0.5):
+        super().__init__(daemon=True)
+        self.pids = pids
+        self.interval = interval
+        self.peak = {name: {"rss_mb": 0.0, "hwm_mb": 0.0} for name in pids}
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.is_set():
+            for name, pid in self.pids.items():
+                mems = [_mem_kb(p) for p in _proc_tree(pid)]
+                rss = sum(m[0] for m in mems) / 1024
+                hwm = max((m[1] for m in mems), default=0) / 1024
+                peak = self.peak[name]
+                peak["rss_mb"] = round(max(peak["rss_mb"], rss), 1)
+                peak["hwm_mb"] = round(max(peak["hwm_mb"], hwm), 1)
+            self._done.wait(self.interval)
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+def _percentile(values: list, q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(q * len(values)))], 1)
+
+
+def run_step(events: list, proxy: NodeProxy, args, pids: dict) -> dict:
+    """Dispara os eventos no tempo (malha aberta) e resume resultados."""
+    for ev in events:
+        fire_prepare(ev, args)
+    sampler = MemorySampler(pids) if pids else None
+    if sampler:
+        sampler.start()
+    results = []
+    lock = threading.Lock()
+
+    def task(ev, scheduled):
+        lag = time.monotonic() - scheduled
+        r = fire(proxy, ev, args)
+        with lock:
+            results.append((r, lag))
+
+    start = time.monotonic()
+    with ThreadPoolExecutor(max_workers=args.max_concurrency) as pool:
+        for ev in events:
+            delay = start + ev["t"] - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(task, ev, start + ev["t"])
+    elapsed = time.monotonic() - start
+    if sampler:
+        sampler.stop()
+
+    span = max((ev["t"] for ev in events), default=0) or 1.0
+    ok = [r for r, _ in results if 200 <= r.status < 300]
+    summary = {
+        "requests": len(results),
+        "offered_rps": round(len(events) / span, 2),
+        "goodput_rps": round(len(ok) / elapsed, 2) if elapsed else 0.0,
+        "ok": len(ok),
+        "rate_limited_429": sum(r.status == 429 for r, _ in results),
+        "fallback_502_503": sum(r.fallback for r, _ in results),
+        "deadline_504": sum(r.status == 504 for r, _ in results),
+        "errors": sum(r.status == 0 or (r.status >= 400 and r.status not in (429, 502, 503, 504)) for r, _ in results),
+        "coalesced": sum(r.coalesced for r, _ in results),
+        "p50_ms": _percentile([r.ms for r in ok], 0.5),
+        "p90_ms": _percentile([r.ms for r in ok], 0.9),
+        "p99_ms": _percentile([r.ms for r in ok], 0.99),
+        "client_lag_p99_ms": _percentile([lag * 1000 for _, lag in results], 0.99),
+        "per_call": {},
+    }
+    for call in sorted({r.call for r, _ in results}):
+        lat = [r.ms for r in ok if r.call == call]
+        summary["per_call"][call] = {
+            "n": sum(r.call == call for r, _ in results),
+            "ok": len(lat),
+            "p50_ms": _percentile(lat, 0.5),
+            "p99_ms": _percentile(lat, 0.99),
+        }
+    if sampler:
+        summary["memory"] = sampler.peak
+    return summary
+
+
+def fire_prepare(ev: dict, args):
+    """Gera (e deixa em cache) a mídia do evento antes de cronometrar o degrau."""
+    call, seed = ev["call"], ev["seed"]
+    if call in ("frames", "lipsync_sentry"):
+        payloads.jpeg_frames(seed, args.frames)
+    if call in ("audio_b64", "lipsync_sentry"):
+        payloads.audio_data_url(seed)
+    if call in ("video", "lipsync", "bulk"):
+        _video(ev)
+    if call == "audio":
+        _audio(ev)
+
+
+def _wait_ready(url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url + "/ready", timeout=2) as res:
+                if res.status == 200:
+                    return
+        except Exception:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"{url} não ficou pronto em {timeout:.0f}s")
+
+
+def spawn(args) -> tuple:
+    """Sobe deepfake-api e voice-api locais com STUB_MODELS=1 (CPU, offline). Retorna (procs, urls)."""
+    env = dict(os.environ, STUB_MODELS="1", FORCE_CPU="1", PHASH_INDEX="1" if args.phash else "0")
+    # O gerador faz o papel do proxy Node: X-Device-Id vale como identidade vindo de 127.0.0.1
+    env["TRUSTED_PROXY_IPS"] = "127.0.0.1"
+    if args.no_rate_limit:
+        env.update(RATE_LIMIT_PER_MIN="1000000", RATE_LIMIT_BURST="1000000")
+    procs, urls = {}, {}
+    for name, port in (("deepfake-api", args.deepfake_port), ("voice-api", args.voice_port)):
+        cmd = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(args.workers), "--log-level", "warning"]
+        procs[name] = subprocess.Popen(cmd, cwd=os.path.join(ROOT, name), env=env)
+        urls[name] = f"http://127.0.0.1:{port}"
+    for name, url in urls.items():
+        _wait_ready(url, args.ready_timeout)
+    return procs, urls
+
+
+def _print_step(label: str, s: dict):
+    print(
+        f"{label:>10} | oferecido {s['offered_rps']:>6.2f}/s | útil {s['goodput_rps']:>6.2f}/s | "
+        f"p50 {s['p50_ms']:>7.0f} p90 {s['p90_ms']:>7.0f} p99 {s['p99_ms']:>7.0f} ms | "
+        f"429 {s['rate_limited_429']} 503 {s['fallback_502_503']} 504 {s['deadline_504']} "
+        f"erro {s['errors']} coal {s['coalesced']}"
+        + "".join(f" | {n} pico {m['rss_mb']:.0f}MB" for n, m in s.get("memory", {}).items())
+    )
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Teste de carga deepfake-api / voice-api")
+    p.add_argument("--deepfake-url", default=os.environ.get("DEEPFAKE_API_URL", ""))
+    p.add_argument("--voice-url", default=os.environ.get("VOICE_API_URL", ""))
+    p.add_argument("--spawn", action="store_true", help="sobe os dois serviços locais com STUB_MODELS=1")
+    p.add_argument("--workers", type=int, default=1)
+    p.add_argument("--deepfake-port", type=int, default=18000)
+    p.add_argument("--voice-port", type=int, default=18001)
+    p.add_argument("--ready-timeout", type=float, default=120)
+    p.add_argument("--phash", action="store_true", help="mantém o índice pHash ligado nos serviços locais")
+    p.add_argument("--no-rate-limit", action="store_true", help="desliga o rate limit nos serviços locais")
+    p.add_argument("--single-client", action="store_true", help="não envia X-Device-Id (um balde para todo o tráfego)")
+    p.add_argument("--rates", default="0.2,0.5,1,2", help="ações de usuário por segundo (sintético)")
+    p.add_argument("--duration", type=float, default=60, help="segundos por degrau (sintético)")
+    p.add_argument("--mix", default=DEFAULT_MIX)
+    p.add_argument("--tick-s", type=float, default=5.0, help="intervalo entre análises de uma sessão Sentry")
+    p.add_argument("--session-s", type=float, default=60.0, help="duração de uma sessão Sentry")
+    p.add_argument("--lipsync-every", type=int, default=5)
+    p.add_argument("--sessions", action="store_true", help="envia X-Session-Id nos ticks do Sentry (fusão por sessão)")
+    p.add_argument("--frames", type=int, default=3, help="frames por tick (captureFrames usa 3)")
+    p.add_argument("--bulk-items", type=int, default=5)
+    p.add_argument("--duplicate-ratio", type=float, default=0.0, help="fração de uploads com o mesmo arquivo (viral)")
+    p.add_argument("--trace", help="JSONL gravado (TRAFFIC_TRACE_PATH) ou gerado por --write-trace")
+    p.add_argument("--speeds", default="1", help="fatores de aceleração do trace gravado")
+    p.add_argument("--write-trace", help="só grava o trace sintético do primeiro degrau e sai")
+    p.add_argument("--max-concurrency", type=int, default=256, help="conexões simultâneas do proxy")
+    p.add_argument("--slo-ms", type=float, default=10000, help="p99 acima disso marca o joelho")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--json", help="grava o relatório completo em JSON")
+    args = p.parse_args(argv)
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    if args.trace:
+        base = recorded_trace(args.trace)
+        steps = [(f"x{s}", [dict(e, t=e["t"] / float(s)) for e in base]) for s in args.speeds.split(",")]
+    else:
+        steps = [(f"{r}/s", synthetic_trace(float(r), args.duration, mix, args, rng)) for r in args.rates.split(",")]
+
+    if args.write_trace:
+        with open(args.write_trace, "w") as f:
+            for ev in steps[0][1]:
+                f.write(json.dumps(ev) + "\n")
+        print(f"✅ {len(steps[0][1])} eventos em {args.write_trace}")
+        return 0
+
+    procs, pids = {}, {}
+    try:
+        if args.spawn:
+            procs, urls = spawn(args)
+            args.deepfake_url, args.voice_url = urls["deepfake-api"], urls["voice-api"]
+            pids = {name: proc.pid for name, proc in procs.items()}
+        if not args.deepfake_url:
+            p.error("informe --deepfake-url (ou DEEPFAKE_API_URL) ou use --spawn")
+        proxy = NodeProxy(args.deepfake_url, args.voice_url, single_client=args.single_client)
+
+        report = []
+        for label, events in steps:
+            if not events:
+                continue
+            summary = run_step(events, proxy, args, pids)
+            summary["step"] = label
+            report.append(summary)
+            _print_step(label, summary)
+
+        if report:
+            saturation = max(report, key=lambda s: s["goodput_rps"])
+            knee = next(
+                (s for s in report if s["goodput_rps"] < 0.9 * s["offered_rps"] or s["p99_ms"] > args.slo_ms),
+                None,
+            )
+            print(f"\nSaturação: {saturation['goodput_rps']:.2f} req/s úteis (degrau {saturation['step']})")
+            print(f"Joelho: {knee['step'] if knee else 'não atingido'} (vazão útil < 90% da oferecida ou p99 > {args.slo_ms:.0f} ms)")
+            if args.json:
+                with open(args.json, "w") as f:
+                    json.dump({
+                        "steps": report,
+                        "saturation_rps": saturation["goodput_rps"],
+                        "knee": knee["step"] if knee else None,
+                        "latency_curve": [(s["offered_rps"], s["p50_ms"], s["p99_ms"]) for s in report],
+                    }, f, indent=2)
+    finally:
+        for proc in procs.values():
+            proc.terminate()
+        for proc in procs.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,89 @@
+"""
+Mídias sintéticas para o teste de carga (sem arquivos de clientes no repositório).
+Cada payload depende de uma semente: sementes diferentes geram conteúdo diferente (não coalescem
+nem batem no índice pHash); a mesma semente repete o mesmo arquivo (simula vídeo viralizando).
+Os payloads são gerados uma vez e reaproveitados (cache em memória).
+"""
+import base64
+import io
+import os
+import tempfile
+import wave
+from functools import lru_cache
+
+import cv2
+import numpy as np
+
+FRAME_W, FRAME_H = 640, 360
+
+
+def _frame(rng: np.random.Generator, t: float) -> np.ndarray:
+    """Frame BGR com fundo em gradiente, ruído e uma elipse clara (rosto) que se move."""
+    base = rng.integers(40, 200, 3)
+    x = np.linspace(0, 1, FRAME_W, dtype=np.float32)
+    img = (base[None, None, :] * (0.6 + 0.4 * x[None, :, None])).repeat(FRAME_H, axis=0)
+    img = (img + rng.normal(0, 6, img.shape)).clip(0, 255).astype(np.uint8)
+    cx = int(FRAME_W / 2 + 80 * np.sin(t))
+    cv2.ellipse(img, (cx, FRAME_H // 2), (60, 80), 0, 0, 360, (180, 200, 230), -1)
+    return img
+
+
+@lru_cache(maxsize=256)
+def jpeg_frames(seed: int, count: int = 3) -> tuple:
+    """Data URLs JPEG como os capturados pelo Sentry (captureFrames)."""
+    rng = np.random.default_rng(seed)
+    urls = []
+    for i in range(count):
+        ok, buf = cv2.imencode(".jpg", _frame(rng, i * 0.5), [cv2.IMWRITE_JPEG_QUALITY, 80])
+        urls.append("data:image/jpeg;base64," + base64.b64encode(buf.tobytes()).decode("ascii"))
+    return tuple(urls)
+
+
+@lru_cache(maxsize=64)
+def video_bytes(seed: int, seconds: float = 6.0, fps: int = 25) -> bytes:
+    """MP4 (mp4v) sem áudio; tamanho aproximado de um upload curto de celular."""
+    rng = np.random.default_rng(seed)
+    fd, path = tempfile.mkstemp(suffix=".mp4")
+    os.close(fd)
+    try:
+        writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (FRAME_W, FRAME_H))
+        for i in range(int(seconds * fps)):
+            writer.write(_frame(rng, i / fps))
+        writer.release()
+        with open(path, "rb") as f:
+            return f.read()
+    finally:
+        os.unlink(path)
+
+
+@lru_cache(maxsize=64)
+def wav_bytes(seed: int, seconds: float = 4.5, sr: int = 16000) -> bytes:
+    """WAV mono 16 bits: tom com vibrato + ruído (duração padrão = captura de áudio do Sentry)."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sr)) / sr
+    f0 = 120 + 60 * rng.random()
+    signal = 0.3 * np.sin(2 * np.pi * f0 * t + 3 * np.sin(2 * np.pi * 5 * t)) + 0.05 * rng.normal(size=t.size)
+    pcm = (signal.clip(-1, 1) * 32767).astype("<i2")
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(sr)
+        w.writeframes(pcm.tobytes())
+    return buf.getvalue()
+
+
+def audio_data_url(seed: int, seconds: float = 4.5) -> str:
+    return "data:audio/wav;base64," + base64.b64encode(wav_bytes(seed, seconds)).decode("ascii")
+
+
+def scaled_video(seed: int, nbytes: int) -> bytes:
+    """Vídeo com duração escolhida para se aproximar de nbytes (replay de traces gravados)."""
+    per_second = len(video_bytes(0, 2.0)) / 2.0
+    seconds = min(60.0, max(1.0, round(nbytes / per_second)))
+    return video_bytes(seed, seconds)
+
+
+def scaled_audio(seed: int, nbytes: int) -> bytes:
+    seconds = min(60.0, max(1.0, round(nbytes / 32000)))
+    return wav_bytes(seed, seconds)
@@ -0,0 +1,125 @@
+"""
+Substituto local do proxy Node (services/deepfakeService.js e services/voiceService.js).
+Mesmas rotas, formatos de corpo, timeouts, cabeçalhos (pythonApiHeaders) e tratamento de erro do
+lado Node: 502/503 viram fallback silencioso (null no JS); timeout é abortado como o AbortController.
+Cada chamada retorna um Result com status, latência e bytes enviados para o relatório.
+
+Diferença deliberada: voiceService.analyzeLipsyncSentry manda /analisar-lipsync-sentry para
+VOICE_API_URL, que só existe no deepfake-api; aqui a chamada vai para o deepfake-api.
+"""
+import json
+import os
+import time
+import urllib.error
+import urllib.request
+import uuid
+from dataclasses import dataclass
+
+# Timeouts do lado Node (ms → s)
+TIMEOUTS = {
+    "video": 120,
+    "frames": 90,
+    "audio": 60,
+    "audio_b64": 60,
+    "lipsync": 120,
+    "lipsync_sentry": 120,
+    "bulk": 600,
+}
+
+
+@dataclass
+class Result:
+    call: str
+    status: int  # 0 = erro de rede / timeout
+    ms: float
+    sent: int
+    fallback: bool = False
+    coalesced: bool = False
+    error: str = ""
+
+
+def _multipart(field: str, files: list) -> tuple:
+    """Corpo multipart/form-data como o pacote form-data do Node. files: [(nome, bytes, content-type)]."""
+    boundary = "----realityscan" + uuid.uuid4().hex
+    parts = []
+    for name, data, ctype in files:
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{field}"; filename="{name}"\r\n'
+            f"Content-Type: {ctype}\r\n\r\n".encode("utf-8")
+        )
+        parts.append(data)
+        parts.append(b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+class NodeProxy:
+    def __init__(self, deepfake_url: str, voice_url: str = "", single_client: bool = False):
+        """single_client: não envia X-Device-Id (todo o tráfego vira um cliente só, como o Node antigo)."""
+        self.deepfake_url = deepfake_url.rstrip("/")
+        self.voice_url = (voice_url or deepfake_url).rstrip("/")
+        self.single_client = single_client
+        self.secret = os.environ.get("PROXY_SHARED_SECRET", "")
+
+    def _post(self, call: str, url: str, body: bytes, ctype: str, user: str = None, session: str = None) -> Result:
+        headers = {"Content-Type": ctype, "X-Timeout-Ms": str(TIMEOUTS[call] * 1000)}
+        if self.secret:
+            headers["X-Proxy-Secret"] = self.secret
+        if user and not self.single_client:
+            headers["X-Device-Id"] = user
+        if session:
+            headers["X-Session-Id"] = session
+        req = urllib.request.Request(url, data=body, headers=headers, method="POST")
+        t0 = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=TIMEOUTS[call]) as res:
+                payload = res.read()
+                status = res.status
+        except urllib.error.HTTPError as e:
+            e.read()
+            ms = (time.perf_counter() - t0) * 1000
+            return Result(call, e.code, ms, len(body), fallback=e.code in (502, 503))
+        except Exception as e:
+            return Result(call, 0, (time.perf_counter() - t0) * 1000, len(body), error=type(e).__name__)
+        ms = (time.perf_counter() - t0) * 1000
+        coalesced = False
+        if call != "bulk":
+            try:
+                coalesced = bool(json.loads(payload).get("coalescido"))
+            except (ValueError, AttributeError):
+                pass
+        return Result(call, status, ms, len(body), coalesced=coalesced)
+
+    # deepfakeService.js
+    def analyze_video_deepfake(self, video: bytes, user: str = None) -> Result:
+        body, ctype = _multipart("video", [("video.mp4", video, "video/mp4")])
+        return self._post("video", self.deepfake_url + "/analisar", body, ctype, user)
+
+    def analyze_frames_deepfake(self, frames: list, user: str = None, session: str = None) -> Result:
+        body = json.dumps({"frames": list(frames)[:32]}).encode("utf-8")
+        return self._post("frames", self.deepfake_url + "/analisar-frames", body, "application/json", user, session)
+
+    def analyze_audio_synthetic(self, audio: bytes, user: str = None) -> Result:
+        body, ctype = _multipart("audio", [("audio.wav", audio, "audio/wav")])
+        return self._post("audio", self.deepfake_url + "/analisar-audio", body, ctype, user)
+
+    def analyze_lipsync(self, video: bytes, user: str = None) -> Result:
+        body, ctype = _multipart("video", [("video.mp4", video, "video/mp4")])
+        return self._post("lipsync", self.voice_url + "/analisar-lipsync", body, ctype, user)
+
+    # voiceService.js
+    def analyze_audio_voice(self, audio_data_url: str, user: str = None, session: str = None) -> Result:
+        body = json.dumps({"audio": audio_data_url, "audioBase64": audio_data_url}).encode("utf-8")
+        return self._post("audio_b64", self.voice_url + "/analisar-audio-base64", body, "application/json", user, session)
+
+    def analyze_lipsync_sentry(self, frames: list, audio_data_url: str, user: str = None, session: str = None) -> Result:
+        body = json.dumps({"frames": list(frames)[:32], "audio": audio_data_url, "audioBase64": audio_data_url})
+        return self._post(
+            "lipsync_sentry", self.deepfake_url + "/analisar-lipsync-sentry", body.encode("utf-8"), "application/json",
+            user, session,
+        )
+
+    # BulkSummary / API corporativa
+    def analyze_bulk(self, videos: list, user: str = None) -> Result:
+        body, ctype = _multipart("itens", [(f"item{i}.mp4", v, "video/mp4") for i, v in enumerate(videos)])
+        return self._post("bulk", self.deepfake_url + "/analisar-lote", body, ctype, user)
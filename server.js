@@ -799,7 +799,8 @@ app.post("/api/scan", scanLimiter, upload.single("file"), async (req, res) => {
           const df = await analyzeVideoDeepfake(
             req.file.buffer,
             req.file.mimetype,
-            req.file.originalname || "video.mp4"
+            req.file.originalname || "video.mp4",
+            { deviceId: deviceId || userId }
           );
           if (df) {
             const score = Math.round(df.fake * 100);
@@ -823,7 +824,7 @@ app.post("/api/scan", scanLimiter, upload.single("file"), async (req, res) => {
         try {
           const audioBase64 = req.file.buffer.toString("base64");
           const dataUrl = `data:${req.file.mimetype};base64,${audioBase64}`;
-          const voiceResult = await analyzeAudioVoice(dataUrl, req.file.mimetype);
+          const voiceResult = await analyzeAudioVoice(dataUrl, req.file.mimetype, { deviceId: deviceId || userId });
           if (voiceResult) {
             const pct = voiceResult.score_synthetic_pct ?? (voiceResult.synthetic != null ? voiceResult.synthetic * 100 : (voiceResult.fake != null ? voiceResult.fake * 100 : 0));
             const score = Math.round(Number(pct));
@@ -968,6 +969,13 @@ REGRAS:
 
       // EfficientNet (análise principal visual) + Voice (wav2vec) + SyncNet (lip-sync) em paralelo
       const sentryAudio = req.body?.audio;
+      // Id do compartilhamento (MediaStream.id) prefixado pelo dispositivo: Python acumula evidência
+      // entre os ticks e pausa modelos já decididos
+      const sentryDevice = deviceId || userId || "anon";
+      const sentrySession = typeof req.body?.sessionId === "string"
+        ? `${sentryDevice}:${req.body.sessionId}`.slice(0, 128)
+        : null;
+      const sentryCtx = { deviceId: sentryDevice, sessionId: sentrySession };
       const hasSentryAudio = sentryAudio && typeof sentryAudio === "string" && sentryAudio.includes("base64,");
       const apiUrl = process.env.VOICE_API_URL || process.env.DEEPFAKE_API_URL;
       if (hasEfficientNetInput && !apiUrl) {
@@ -975,19 +983,19 @@ REGRAS:
       }
       const [dfResult, voiceResult, lipsyncResult] = await Promise.all([
         hasEfficientNetInput && apiUrl
-          ? analyzeFramesDeepfake(framesForEfficientNet).catch((err) => {
+          ? analyzeFramesDeepfake(framesForEfficientNet, sentryCtx).catch((err) => {
               console.warn("⚠️ [Sentry] Deepfake API falhou:", err.message);
               return null;
             })
           : Promise.resolve(null),
         hasSentryAudio && apiUrl
-          ? analyzeAudioVoice(sentryAudio, "audio/webm").catch((err) => {
+          ? analyzeAudioVoice(sentryAudio, "audio/webm", sentryCtx).catch((err) => {
               console.warn("⚠️ [Sentry] Voice API falhou:", err.message);
               return null;
             })
           : Promise.resolve(null),
         sentryFrames.length >= 2 && hasSentryAudio && apiUrl
-          ? analyzeLipsyncSentry(sentryFrames, sentryAudio).catch((err) => {
+          ? analyzeLipsyncSentry(sentryFrames, sentryAudio, sentryCtx).catch((err) => {
               console.warn("⚠️ [Sentry] Lipsync API falhou:", err.message);
               return null;
             })
@@ -180,7 +180,8 @@ async function sendToApi(
   userId: string | null | undefined,
   audioDataUrl: string | null = null,
   retryCount: number = 0,
-  videoLink?: string | null
+  videoLink?: string | null,
+  sessionId?: string | null
 ): Promise<AnalysisResult> {
   const body: Record<string, unknown> = {
     type: 'sentry',
@@ -192,6 +193,8 @@ async function sendToApi(
   };
   if (audioDataUrl) body.audio = audioDataUrl;
   if (videoLink && typeof videoLink === 'string' && videoLink.trim()) body.videoLink = videoLink.trim();
+  // Mesma sessão enquanto durar o compartilhamento: a API acumula evidência entre os ticks
+  if (sessionId) body.sessionId = sessionId;
   const bodyStr = JSON.stringify(body);
 
   const doRequest = async () => {
@@ -243,7 +246,7 @@ async function sendToApi(
       retryCount < MAX_RETRIES;
     if (isRetryable) {
       await new Promise((r) => setTimeout(r, RETRY_DELAY_MS));
-      return sendToApi(frames, userId, audioDataUrl, retryCount + 1, videoLink);
+      return sendToApi(frames, userId, audioDataUrl, retryCount + 1, videoLink, sessionId);
     }
     throw e;
   }
@@ -398,7 +401,7 @@ export async function runSentryScan(options: SentryScanOptions): Promise<Analysi
   ]);
   if (frames.length < 1) throw new Error('Nenhum frame capturado.');
 
-  return sendToApi(frames, userId, audioDataUrl, 0, videoLink);
+  return sendToApi(frames, userId, audioDataUrl, 0, videoLink, stream.id);
 }
 
 export interface SentryScanFromVideoOptions {
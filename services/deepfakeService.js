@@ -7,13 +7,31 @@
 import FormData from 'form-data';
 import fetch from 'node-fetch';
 
+/**
+ * Cabeçalhos das chamadas às APIs Python.
+ * - X-Device-Id: o rate limit e a fila justa passam a ser por usuário, não pelo proxy inteiro
+ * - X-Timeout-Ms: o Python descarta (504) o que este lado já abortou
+ * - X-Proxy-Secret: sem ele (PROXY_SHARED_SECRET) a API ignora a identidade e usa o IP
+ * @param {{ deviceId?: string, sessionId?: string }} ctx
+ * @param {number} timeoutMs - timeout do AbortController da chamada
+ * @param {object} [base] - cabeçalhos da chamada (Content-Type / multipart)
+ */
+export function pythonApiHeaders(ctx, timeoutMs, base = {}) {
+  const headers = { ...base, 'X-Timeout-Ms': String(timeoutMs) };
+  if (process.env.PROXY_SHARED_SECRET) headers['X-Proxy-Secret'] = process.env.PROXY_SHARED_SECRET;
+  if (ctx?.deviceId) headers['X-Device-Id'] = String(ctx.deviceId).slice(0, 128);
+  if (ctx?.sessionId) headers['X-Session-Id'] = ctx.sessionId;
+  return headers;
+}
+
 /**
  * @param {Buffer} videoBuffer - buffer do vídeo
  * @param {string} mimeType - ex: video/mp4, video/webm
  * @param {string} [fileName] - nome do arquivo
+ * @param {{ deviceId?: string }} [ctx] - identificação do usuário (pythonApiHeaders)
  * @returns {Promise<{ fake: number, real: number, resultado: string, score_fake_pct?: number } | null>}
  */
-export async function analyzeVideoDeepfake(videoBuffer, mimeType, fileName = 'video.mp4') {
+export async function analyzeVideoDeepfake(videoBuffer, mimeType, fileName = 'video.mp4', ctx = {}) {
   const baseUrl = process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl) {
     console.warn('⚠️ DEEPFAKE_API_URL não configurada. Deepfake por vídeo desativado.');
@@ -31,7 +49,7 @@ export async function analyzeVideoDeepfake(videoBuffer, mimeType, fileName = 'vi
     const res = await fetch(url, {
       method: 'POST',
       body: form,
-      headers: form.getHeaders(),
+      headers: pythonApiHeaders(ctx, 120000, form.getHeaders()),
       signal: controller.signal,
     });
     clearTimeout(timeout);
@@ -64,9 +82,11 @@ export async function analyzeVideoDeepfake(videoBuffer, mimeType, fileName = 'vi
 /**
  * Analisa frames do Sentry Mini HUD com EfficientNet.
  * @param {string[]} frames - array de data URLs (base64)
- * @returns {Promise<{ fake: number, real: number, resultado: string, score_fake_pct: number } | null>}
+ * @param {{ deviceId?: string, sessionId?: string }} [ctx] - usuário e sessão do Sentry (a API acumula
+ *   evidência entre chamadas da mesma sessão)
+ * @returns {Promise<{ fake: number, real: number, resultado: string, score_fake_pct: number, sessao?: object } | null>}
  */
-export async function analyzeFramesDeepfake(frames) {
+export async function analyzeFramesDeepfake(frames, ctx = {}) {
   const baseUrl = process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl || !Array.isArray(frames) || frames.length < 1) {
     return null;
@@ -79,7 +99,7 @@ export async function analyzeFramesDeepfake(frames) {
   try {
     const res = await fetch(url, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: pythonApiHeaders(ctx, 90000, { 'Content-Type': 'application/json' }),
       body: JSON.stringify({ frames: frames.slice(0, 32) }),
       signal: controller.signal,
     });
@@ -101,6 +121,7 @@ export async function analyzeFramesDeepfake(frames) {
       real: json.real ?? 1,
       resultado: json.resultado ?? 'indeterminado',
       score_fake_pct: json.score_fake_pct ?? (json.fake != null ? json.fake * 100 : 0),
+      sessao: json.sessao ?? null,
     };
   } catch (err) {
     clearTimeout(timeout);
@@ -116,9 +137,10 @@ export async function analyzeFramesDeepfake(frames) {
  * @param {Buffer} audioBuffer - buffer do áudio (webm, wav, mp3)
  * @param {string} mimeType - ex: audio/webm, audio/wav
  * @param {string} [fileName] - nome do arquivo
+ * @param {{ deviceId?: string }} [ctx] - identificação do usuário (pythonApiHeaders)
  * @returns {Promise<{ synthetic: number, real: number, resultado: string, score_synthetic_pct: number } | null>}
  */
-export async function analyzeAudioSynthetic(audioBuffer, mimeType, fileName = 'audio.webm') {
+export async function analyzeAudioSynthetic(audioBuffer, mimeType, fileName = 'audio.webm', ctx = {}) {
   const baseUrl = process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl) return null;
 
@@ -133,7 +155,7 @@ export async function analyzeAudioSynthetic(audioBuffer, mimeType, fileName = 'a
     const res = await fetch(url, {
       method: 'POST',
       body: form,
-      headers: form.getHeaders(),
+      headers: pythonApiHeaders(ctx, 60000, form.getHeaders()),
       signal: controller.signal,
     });
     clearTimeout(timeout);
@@ -157,9 +179,10 @@ export async function analyzeAudioSynthetic(audioBuffer, mimeType, fileName = 'a
  * @param {Buffer} videoBuffer - buffer do vídeo
  * @param {string} mimeType - ex: video/mp4, video/webm
  * @param {string} [fileName] - nome do arquivo
+ * @param {{ deviceId?: string }} [ctx] - identificação do usuário (pythonApiHeaders)
  * @returns {Promise<{ ok: boolean, avg_distance: number, resultado: string, suspicious: boolean } | null>}
  */
-export async function analyzeLipsync(videoBuffer, mimeType, fileName = 'video.mp4') {
+export async function analyzeLipsync(videoBuffer, mimeType, fileName = 'video.mp4', ctx = {}) {
   const baseUrl = process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl) return null;
 
@@ -174,7 +197,7 @@ export async function analyzeLipsync(videoBuffer, mimeType, fileName = 'video.mp
     const res = await fetch(url, {
       method: 'POST',
       body: form,
-      headers: form.getHeaders(),
+      headers: pythonApiHeaders(ctx, 120000, form.getHeaders()),
       signal: controller.signal,
     });
     clearTimeout(timeout);
@@ -192,9 +215,10 @@ export async function analyzeLipsync(videoBuffer, mimeType, fileName = 'video.mp
  * @param {Buffer} audioBuffer - buffer do áudio (webm, wav, mp3)
  * @param {string} mimeType - ex: audio/webm
  * @param {string} [fileName] - nome do arquivo
+ * @param {{ deviceId?: string }} [ctx] - identificação do usuário (pythonApiHeaders)
  * @returns {Promise<{ synthetic: number, real: number, resultado: string, score_synthetic_pct: number } | null>}
  */
-export async function analyzeAudioDeepfake(audioBuffer, mimeType, fileName = 'audio.webm') {
+export async function analyzeAudioDeepfake(audioBuffer, mimeType, fileName = 'audio.webm', ctx = {}) {
   const baseUrl = process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl || !audioBuffer || audioBuffer.length < 1000) return null;
 
@@ -209,7 +233,7 @@ export async function analyzeAudioDeepfake(audioBuffer, mimeType, fileName = 'au
     const res = await fetch(url, {
       method: 'POST',
       body: form,
-      headers: form.getHeaders(),
+      headers: pythonApiHeaders(ctx, 60000, form.getHeaders()),
       signal: controller.signal,
     });
     clearTimeout(timeout);
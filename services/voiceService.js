@@ -4,6 +4,7 @@
  */
 
 import fetch from 'node-fetch';
+import { pythonApiHeaders } from './deepfakeService.js';
 
 const VOICE_API_URL = process.env.VOICE_API_URL || process.env.DEEPFAKE_API_URL || '';
 
@@ -11,9 +12,11 @@ const VOICE_API_URL = process.env.VOICE_API_URL || process.env.DEEPFAKE_API_URL
  * Analisa áudio para detectar voz sintética.
  * @param {Buffer|string} audio - buffer do áudio ou base64/data URL
  * @param {string} [mimeType] - ex: audio/webm, audio/wav
- * @returns {Promise<{ fake: number, real: number, resultado: string, score_fake_pct: number } | null>}
+ * @param {{ deviceId?: string, sessionId?: string }} [ctx] - usuário e sessão do Sentry (a API acumula
+ *   evidência entre chamadas da mesma sessão)
+ * @returns {Promise<{ fake: number, real: number, resultado: string, score_fake_pct: number, sessao?: object } | null>}
  */
-export async function analyzeAudioVoice(audio, mimeType = 'audio/webm') {
+export async function analyzeAudioVoice(audio, mimeType = 'audio/webm', ctx = {}) {
   const baseUrl = VOICE_API_URL || process.env.VOICE_API_URL || '';
   if (!baseUrl) return null;
 
@@ -31,7 +34,7 @@ export async function analyzeAudioVoice(audio, mimeType = 'audio/webm') {
   try {
     const res = await fetch(url, {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: pythonApiHeaders(ctx, 60000, { 'Content-Type': 'application/json' }),
       body: JSON.stringify({ audio: dataUrl, audioBase64: dataUrl }),
       signal: controller.signal,
     });
@@ -49,9 +52,10 @@ export async function analyzeAudioVoice(audio, mimeType = 'audio/webm') {
  * Analisa lip-sync (vídeo com áudio).
  * @param {Buffer} videoBuffer - buffer do vídeo
  * @param {string} mimeType
+ * @param {{ deviceId?: string }} [ctx] - identificação do usuário (pythonApiHeaders)
  * @returns {Promise<{ lip_sync_ok: boolean|null, confidence: number|null, distance: number|null, resultado: string } | null>}
  */
-export async function analyzeLipsync(videoBuffer, mimeType = 'video/webm') {
+export async function analyzeLipsync(videoBuffer, mimeType = 'video/webm', ctx = {}) {
   const baseUrl = VOICE_API_URL || process.env.VOICE_API_URL || '';
   if (!baseUrl) return null;
 
@@ -66,7 +70,7 @@ export async function analyzeLipsync(videoBuffer, mimeType = 'video/webm') {
     const res = await fetch(baseUrl.replace(/\/$/, '') + '/analisar-lipsync', {
       method: 'POST',
       body: form,
-      headers: form.getHeaders(),
+      headers: pythonApiHeaders(ctx, 120000, form.getHeaders()),
       signal: controller.signal,
     });
     clearTimeout(timeout);
@@ -84,8 +88,9 @@ export async function analyzeLipsync(videoBuffer, mimeType = 'video/webm') {
  * API cria vídeo, mescla áudio, executa SyncNet.
  * @param {string[]} frames - data URLs
  * @param {string} audioDataUrl - data URL base64 do áudio
+ * @param {{ deviceId?: string, sessionId?: string }} [ctx] - usuário e sessão do Sentry
  */
-export async function analyzeLipsyncSentry(frames, audioDataUrl) {
+export async function analyzeLipsyncSentry(frames, audioDataUrl, ctx = {}) {
   const baseUrl = VOICE_API_URL || process.env.VOICE_API_URL || process.env.DEEPFAKE_API_URL || '';
   if (!baseUrl || !Array.isArray(frames) || frames.length < 1 || !audioDataUrl) return null;
 
@@ -95,7 +100,7 @@ export async function analyzeLipsyncSentry(frames, audioDataUrl) {
   try {
     const res = await fetch(baseUrl.replace(/\/$/, '') + '/analisar-lipsync-sentry', {
       method: 'POST',
-      headers: { 'Content-Type': 'application/json' },
+      headers: pythonApiHeaders(ctx, 120000, { 'Content-Type': 'application/json' }),
       body: JSON.stringify({ frames: frames.slice(0, 32), audio: audioDataUrl, audioBase64: audioDataUrl }),
       signal: controller.signal,
     });
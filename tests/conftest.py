@@ -0,0 +1,37 @@
+"""
+Testes dos módulos Python dos serviços (rodar na raiz do repositório: python -m pytest tests).
+Os módulos compartilhados são cópias idênticas em deepfake-api/ e voice-api/ (ver test_shared_modules.py),
+então basta importar de deepfake-api/.
+Dependências: pytest, fastapi, numpy e opencv-python-headless; os testes que importam app.py
+ou deepfake_detector.py precisam também de torch e python-multipart (pulados sem eles).
+"""
+import os
+import sys
+
+import pytest
+from starlette.requests import Request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "deepfake-api"))
+
+# app.py lê a configuração no import: modelos simulados, sem warm-up e sem índice pHash em /app/data
+os.environ.setdefault("STUB_MODELS", "1")
+os.environ.setdefault("WARMUP", "0")
+os.environ.setdefault("PHASH_INDEX", "0")
+
+
+@pytest.fixture
+def make_request():
+    """Request do Starlette sem servidor: rota, cabeçalhos e IP do cliente."""
+
+    def make(path: str = "/analisar", headers: dict = None, host: str = "203.0.113.7") -> Request:
+        return Request({
+            "type": "http",
+            "method": "POST",
+            "path": path,
+            "query_string": b"",
+            "headers": [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()],
+            "client": (host, 40000),
+        })
+
+    return make
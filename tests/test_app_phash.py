@@ -0,0 +1,41 @@
+"""/analisar com o índice pHash: a impressão digital de áudio é calculada uma vez por requisição."""
+import asyncio
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("multipart")
+
+import app
+import phash_index
+from phash_index import PerceptualIndex
+
+
+def _video(path) -> bytes:
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*"mp4v"), 10.0, (64, 64))
+    rng = np.random.default_rng(0)
+    for _ in range(30):
+        writer.write(rng.integers(0, 255, (64, 64, 3), dtype=np.uint8))
+    writer.release()
+    return path.read_bytes()
+
+
+def test_fingerprint_is_shared_by_lookup_and_add(monkeypatch, tmp_path, make_request):
+    content = _video(tmp_path / "v.mp4")
+    idx = PerceptualIndex(str(tmp_path / "i.jsonl"))
+    # Registro com os mesmos frames e outro áudio: a consulta precisa do fingerprint e não bate
+    (tmp_path / "copia.mp4").write_bytes(content)
+    frames = app.decode_video(str(tmp_path / "copia.mp4"), {})
+    idx.add(phash_index.frame_hashes(frames, phash_index.PHASH_KEYFRAMES, rgb=True), [0x0123456789ABCDEF] * 4, 0.9, "x", "video")
+    calls = []
+    monkeypatch.setattr(phash_index, "audio_hashes", lambda path: calls.append(path) or [0xFEDCBA9876543210] * 4)
+    monkeypatch.setattr(app, "phash_idx", idx)
+    monkeypatch.setattr(app, "predict_video", lambda frames: 0.95)
+
+    response = asyncio.run(app._analisar_video(make_request("/analisar"), content, ".mp4"))
+    assert "duplicado_de" not in response
+    assert response["resultado"] == "provável deepfake"
+    assert response["analise_id"]
+    assert len(calls) == 1
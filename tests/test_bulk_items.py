@@ -0,0 +1,68 @@
+"""Expansão de .zip em /analisar-lote: limites de itens e de bytes descompactados."""
+import io
+import zipfile
+
+import pytest
+from fastapi.testclient import TestClient
+
+pytest.importorskip("torch")
+pytest.importorskip("multipart")
+
+import app
+from app import HTTPException, _bulk_items
+
+
+def _zip(entries: dict) -> bytes:
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+        for name, data in entries.items():
+            zf.writestr(name, data)
+    return buf.getvalue()
+
+
+def test_plain_upload_is_one_item():
+    assert _bulk_items("a.mp4", b"v", 1, 10) == [("a.mp4", b"v")]
+
+
+def test_zip_expands_only_media_entries():
+    data = _zip({"a.MP4": b"v" * 10, "fotos/b.jpg": b"i" * 5, "leia-me.txt": b"x", "fotos/": b""})
+    assert _bulk_items("lote.ZIP", data, 2, 100) == [("a.MP4", b"v" * 10), ("fotos/b.jpg", b"i" * 5)]
+
+
+def test_zip_with_too_many_items_is_refused_before_unpacking(monkeypatch):
+    data = _zip({f"{i}.jpg": b"i" for i in range(4)})
+    opened = []
+    monkeypatch.setattr(zipfile.ZipFile, "open", lambda self, *a, **k: opened.append(a))
+    with pytest.raises(HTTPException) as exc:
+        _bulk_items("lote.zip", data, 3, 100)
+    assert exc.value.status_code == 400
+    assert opened == []
+
+
+def test_unpacked_bytes_budget_stops_reading():
+    # 20 MB de zeros comprimem para ~20 KB: o orçamento vale para o descompactado, não para o upload
+    data = _zip({"a.mp4": b"v" * 60, "b.mp4": b"\0" * (20 * 1024 * 1024)})
+    assert len(data) < 100 * 1024
+    with pytest.raises(HTTPException) as exc:
+        _bulk_items("lote.zip", data, 10, 1000)
+    assert exc.value.status_code == 400
+    assert _bulk_items("lote.zip", _zip({"a.mp4": b"v" * 60, "b.mp4": b"w" * 40}), 10, 100)[1] == ("b.mp4", b"w" * 40)
+
+
+@pytest.mark.parametrize("uploads, detail", [
+    ([("a.zip", {"1.jpg": b"i", "2.jpg": b"i"}), ("b.zip", {"3.jpg": b"i", "4.jpg": b"i"})], "Máximo de 3 itens"),
+    ([("a.zip", {"1.mp4": b"v" * 600}), ("b.zip", {"2.mp4": b"v" * 600})], "descompactado"),
+])
+def test_limits_cover_the_whole_request(monkeypatch, uploads, detail):
+    """Vários zips na mesma requisição dividem os limites: cada um só recebe o que sobrou."""
+    monkeypatch.setattr(app, "BULK_MAX_ITEMS", 3)
+    monkeypatch.setattr(app, "BULK_MAX_BYTES", 1000)
+    files = [("itens", (name, _zip(entries), "application/zip")) for name, entries in uploads]
+    r = TestClient(app.app).post("/analisar-lote", files=files)
+    assert r.status_code == 400
+    assert detail in r.json()["detail"]
+
+
+def test_invalid_zip_is_a_client_error():
+    r = TestClient(app.app).post("/analisar-lote", files=[("itens", ("a.zip", b"PK\x03\x04lixo", "application/zip"))])
+    assert r.status_code == 400
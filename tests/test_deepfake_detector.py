@@ -0,0 +1,104 @@
+import threading
+
+import cv2
+import numpy as np
+import pytest
+
+torch = pytest.importorskip("torch")
+
+import deepfake_detector
+
+try:
+    from kernel_utils import isotropically_resize_image, put_to_center
+except ImportError:
+    # Cópia de kernel_utils.py do dfdc_deepfake_challenge (clonado só no build da imagem)
+    def isotropically_resize_image(img, size, interpolation_down=cv2.INTER_AREA, interpolation_up=cv2.INTER_CUBIC):
+        h, w = img.shape[:2]
+        if max(w, h) == size:
+            return img
+        if w > h:
+            scale = size / w
+            h = h * scale
+            w = size
+        else:
+            scale = size / h
+            w = w * scale
+            h = size
+        interpolation = interpolation_up if scale > 1 else interpolation_down
+        resized = cv2.resize(img, (int(w), int(h)), interpolation=interpolation)
+        return resized
+
+    def put_to_center(img, input_size):
+        img = img[:input_size, :input_size]
+        image = np.zeros((input_size, input_size, 3), dtype=np.uint8)
+        start_w = (input_size - img.shape[1]) // 2
+        start_h = (input_size - img.shape[0]) // 2
+        image[start_h:start_h + img.shape[0], start_w: start_w + img.shape[1], :] = img
+        return image
+
+
+# Menor e maior que 380, quadradas, largas, altas, ímpares e já no tamanho final
+FACE_SHAPES = [(120, 90), (90, 120), (200, 200), (381, 379), (380, 250), (250, 380), (600, 413), (413, 600), (37, 211), (1080, 720)]
+
+
+def _faces(shapes: list) -> list:
+    rng = np.random.default_rng(0)
+    return [rng.integers(0, 255, (h, w, 3), dtype=np.uint8) for h, w in shapes]
+
+
+def _dfdc(faces: list) -> np.ndarray:
+    size = deepfake_detector.INPUT_SIZE
+    return np.stack([put_to_center(isotropically_resize_image(f, size), size) for f in faces])
+
+
+def test_preprocess_faces_matches_dfdc_kernel_utils():
+    faces = _faces(FACE_SHAPES)
+    x = deepfake_detector.preprocess_faces(faces)
+    assert x.dtype == np.uint8
+    assert np.array_equal(x, _dfdc(faces))
+
+
+def test_preprocess_faces_into_dirty_buffer():
+    """Escrita in-place (slot do shm_ring): o que sobrou do lote anterior não pode vazar."""
+    faces = _faces(FACE_SHAPES[:4])
+    out = np.full((deepfake_detector.MAX_FACES, deepfake_detector.INPUT_SIZE, deepfake_detector.INPUT_SIZE, 3), 255, dtype=np.uint8)
+    x = deepfake_detector.preprocess_faces(faces, out=out)
+    assert np.shares_memory(x, out)
+    assert np.array_equal(x, _dfdc(faces))
+    assert np.array_equal(deepfake_detector.preprocess_faces([], out=out), np.zeros((0, 380, 380, 3), np.uint8))
+
+
+def test_cpu_patch_survives_overlapping_threads(monkeypatch):
+    """Duas extrações sobrepostas: a primeira a sair não pode desfazer o patch da outra."""
+    monkeypatch.setattr(deepfake_detector, "DEVICE", "cpu")
+    original = torch.Tensor.cuda
+    a, b = deepfake_detector._cuda_patch(), deepfake_detector._cuda_patch()
+    a.__enter__()
+    b.__enter__()
+    a.__exit__(None, None, None)
+    assert torch.Tensor.cuda is deepfake_detector._tensor_cuda_noop
+    assert torch.zeros(1).cuda().device.type == "cpu"
+    b.__exit__(None, None, None)
+    assert torch.Tensor.cuda is original
+
+
+def test_cpu_patch_is_restored_after_concurrent_use(monkeypatch):
+    monkeypatch.setattr(deepfake_detector, "DEVICE", "cpu")
+    originals = (torch.cuda.is_available, torch.Tensor.cuda, torch.nn.Module.cuda)
+    errors = []
+    start = threading.Barrier(8)
+
+    def work():
+        start.wait()
+        for _ in range(200):
+            with deepfake_detector._cuda_patch():
+                if torch.Tensor.cuda is not deepfake_detector._tensor_cuda_noop:
+                    errors.append("patch removido por outra thread")
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == []
+    assert (torch.cuda.is_available, torch.Tensor.cuda, torch.nn.Module.cuda) == originals
@@ -0,0 +1,94 @@
+"""SyncNet grava frames/crops no diretório do rascunho: isso precisa contar na cota da requisição."""
+import asyncio
+import os
+import pickle
+import textwrap
+
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("multipart")
+
+import app
+import lipsync_detector
+import scratch
+from scratch import ScratchManager
+
+SYNCNET_OUTPUT_BYTES = 50_000
+
+
+@pytest.fixture
+def fake_syncnet(monkeypatch, tmp_path):
+    """run_pipeline.py / run_syncnet.py que só escrevem no data_dir o que o SyncNet real escreveria."""
+    root = tmp_path / "syncnet"
+    root.mkdir()
+    (root / "run_pipeline.py").write_text(textwrap.dedent(f"""
+        import argparse, os
+        p = argparse.ArgumentParser()
+        p.add_argument("--videofile"); p.add_argument("--reference"); p.add_argument("--data_dir")
+        a = p.parse_args()
+        os.makedirs(os.path.join(a.data_dir, "pycrop", a.reference), exist_ok=True)
+        with open(os.path.join(a.data_dir, "pycrop", a.reference, "00000.avi"), "wb") as f:
+            f.write(b"x" * {SYNCNET_OUTPUT_BYTES})
+    """))
+    (root / "run_syncnet.py").write_text(textwrap.dedent("""
+        import argparse, os, pickle
+        p = argparse.ArgumentParser()
+        p.add_argument("--videofile"); p.add_argument("--reference"); p.add_argument("--data_dir")
+        a = p.parse_args()
+        os.makedirs(os.path.join(a.data_dir, "pywork", a.reference), exist_ok=True)
+        with open(os.path.join(a.data_dir, "pywork", a.reference, "activesd.pckl"), "wb") as f:
+            pickle.dump([0.3, 0.4], f)
+    """))
+    monkeypatch.setattr(lipsync_detector, "STUB_MODELS", False)
+    monkeypatch.setattr(lipsync_detector, "SYNCNET_DIR", str(root))
+    return root
+
+
+@pytest.fixture
+def scratch_space(monkeypatch, tmp_path):
+    monkeypatch.setattr(scratch, "SCRATCH_TMPFS_DIR", str(tmp_path / "sem-tmpfs"))
+    monkeypatch.setattr(scratch, "SCRATCH_DIR", str(tmp_path))
+    manager = ScratchManager("teste-lipsync")
+    monkeypatch.setattr(app, "scratch_space", manager)
+    return manager
+
+
+def _run(make_request, content: bytes):
+    return asyncio.run(app._analisar_lipsync(make_request("/analisar-lipsync"), content, ".mp4"))
+
+
+def test_syncnet_output_counts_toward_request_quota(monkeypatch, fake_syncnet, scratch_space, make_request):
+    content = b"v" * 1000
+    monkeypatch.setattr(scratch, "SCRATCH_REQUEST_BYTES", len(content) + SYNCNET_OUTPUT_BYTES // 2)
+    with pytest.raises(app.HTTPException) as exc:
+        _run(make_request, content)
+    assert exc.value.status_code == 507
+    assert scratch_space._used == 0
+
+
+def test_syncnet_dir_is_kept_until_the_request_closes(monkeypatch, fake_syncnet, scratch_space, make_request):
+    reserved = []
+    account = scratch.Scratch.account
+
+    def spy(self, path):
+        result = account(self, path)
+        reserved.append(self.used)
+        return result
+
+    monkeypatch.setattr(scratch.Scratch, "account", spy)
+    result = _run(make_request, b"v" * 1000)
+    assert result["ok"] and result["avg_distance"] == pytest.approx(0.35)
+    assert reserved[-1] >= 1000 + SYNCNET_OUTPUT_BYTES
+    # scratch.close() apagou tudo e devolveu a cota
+    assert os.listdir(scratch_space.disk_root) == []
+    assert scratch_space._used == 0
+
+
+def test_runner_cleans_only_its_own_dir(fake_syncnet, tmp_path):
+    data_dir = tmp_path / "do-chamador"
+    data_dir.mkdir()
+    video = tmp_path / "v.mp4"
+    video.write_bytes(b"v")
+    assert lipsync_detector.analyze_lipsync(str(video), str(data_dir))["ok"]
+    assert (data_dir / "pywork").is_dir()
@@ -0,0 +1,40 @@
+"""Distância do SyncNet não é probabilidade de fake: lip-sync do Sentry fica fora da fusão da sessão."""
+import asyncio
+import base64
+
+import cv2
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("multipart")
+
+import app
+import lipsync_detector
+import sessions
+
+
+@pytest.fixture
+def merged(monkeypatch):
+    """ffmpeg simulado: grava a saída mesclada; SyncNet simulado com distância típica de conteúdo real."""
+
+    def fake_ffmpeg(cmd, **kwargs):
+        with open(cmd[-1], "wb") as f:
+            f.write(b"m" * 2000)
+
+    monkeypatch.setattr(app.subprocess, "run", fake_ffmpeg)
+    monkeypatch.setattr(lipsync_detector, "analyze_lipsync", lambda path, data_dir=None: {
+        "ok": True, "avg_distance": 1.8, "resultado": "lip-sync aparenta correto", "suspicious": False,
+    })
+    monkeypatch.setattr(app, "session_store", sessions.SessionStore())
+
+
+def test_lipsync_ticks_do_not_feed_the_session(merged, make_request):
+    ok, jpg = cv2.imencode(".jpg", np.random.default_rng(0).integers(0, 255, (64, 64, 3), dtype=np.uint8))
+    frames = ["data:image/jpeg;base64," + base64.b64encode(jpg.tobytes()).decode()] * 2
+    audio = "data:audio/webm;base64," + base64.b64encode(b"a" * 100).decode()
+    for _ in range(5):
+        result = asyncio.run(app._analisar_lipsync_sentry(make_request("/analisar-lipsync-sentry"), frames, audio, "s"))
+        assert result["avg_distance"] == 1.8
+        assert result["sessao"]["veredito"] is None
+        assert "lipsync" not in result["sessao"]["modalidades"]
@@ -0,0 +1,50 @@
+import json
+import os
+
+import pytest
+
+import model_registry
+import voice_detector
+from model_registry import RegistryError
+
+
+@pytest.fixture
+def registry(monkeypatch, tmp_path):
+    """Registro com duas versões vazias (manifest sem arquivos) e a 2026.09 ativa; ao lado, um diretório com manifest fora dele."""
+    root = tmp_path / "registro"
+    monkeypatch.setattr(model_registry, "MODEL_REGISTRY_DIR", str(root))
+    for version in ("2026.09", "2026.10"):
+        os.makedirs(root / version)
+        (root / version / "manifest.json").write_text(json.dumps(
+            {"version": version, "models": {"dfdc": [], "voice": {}, "syncnet": {}}, "files": {}}
+        ))
+    (tmp_path / "outside").mkdir()
+    (tmp_path / "outside" / "manifest.json").write_text("{}")
+    model_registry.set_current("2026.09")
+    return root
+
+
+@pytest.mark.parametrize("version", ["../outside", "/etc", "2026.09/../outside", "nao-existe"])
+def test_unknown_version_never_becomes_a_path(registry, version):
+    for fn in (model_registry.checked, model_registry.manifest, model_registry.verify, model_registry.set_current):
+        with pytest.raises(RegistryError):
+            fn(version)
+    assert model_registry.current_version() == "2026.09"
+
+
+def test_known_version_resolves(registry):
+    assert model_registry.checked("2026.10") == "2026.10"
+    assert model_registry.checked() == "2026.09"
+
+
+def test_voice_follows_current_changed_by_another_worker(monkeypatch, registry):
+    monkeypatch.setattr(voice_detector, "_voice", None)
+    monkeypatch.setattr(voice_detector, "_voice_version", None)
+    monkeypatch.setattr(voice_detector, "_current_seen", None)
+    voice_detector._ensure_voice_model()
+    voice_detector._ensure_voice_model()
+    assert voice_detector._voice_version == "2026.09"
+    # Outro worker atendeu /admin/modelos/ativar: este só vê o CURRENT mudar
+    model_registry.set_current("2026.10")
+    assert voice_detector._ensure_voice_model() == ("stub", "stub")
+    assert voice_detector._voice_version == "2026.10"
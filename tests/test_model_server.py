@@ -0,0 +1,133 @@
+import os
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+
+import deepfake_detector
+import model_server
+import shm_ring
+from model_server import ModelServerClient
+
+
+@pytest.fixture
+def small_ring(monkeypatch):
+    """Ring de 2 slots de 2 faces (em vez de ~55 MB cada)."""
+    monkeypatch.setattr(deepfake_detector, "MAX_FACES", 2)
+    monkeypatch.setattr(model_server, "SHM_RING_SLOTS", 2)
+
+
+@pytest.fixture(scope="module")
+def server(tmp_path_factory):
+    """model_server.py de verdade em outro processo, com o classificador simulado e sem latência."""
+    addr = str(tmp_path_factory.mktemp("ms") / "models.sock")
+    env = dict(os.environ, MODEL_SERVER_ADDR=addr, STUB_MODELS="1", WARMUP="0", STUB_B7_MS_PER_BATCH="0", STUB_B7_MS_PER_FACE="0")
+    proc = subprocess.Popen([sys.executable, "model_server.py"], cwd=os.path.dirname(model_server.__file__), env=env)
+    deadline = time.monotonic() + 60
+    while not os.path.exists(addr):
+        if proc.poll() is not None or time.monotonic() > deadline:
+            proc.kill()
+            pytest.fail("model server não subiu")
+        time.sleep(0.1)
+    yield addr
+    proc.terminate()
+    proc.wait(timeout=10)
+
+
+def _local(crops: list) -> float:
+    """O mesmo lote no próprio processo: o que o servidor precisa devolver."""
+    x = deepfake_detector.preprocess_faces(crops)
+    return deepfake_detector.predict_faces_batch([x], [deepfake_detector._StubClassifier()])[0]
+
+
+def _faces(n: int) -> list:
+    rng = np.random.default_rng(n)
+    return [rng.integers(0, 255, (120, 90, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def test_client_without_shm_space_uses_the_socket(monkeypatch, small_ring):
+    monkeypatch.setattr(shm_ring, "fitting_slots", lambda slot_bytes, slots: 0)
+    client = ModelServerClient("/tmp/inexistente.sock")
+    assert client.ring is None
+
+
+def test_timeout_retires_the_slot(monkeypatch, small_ring):
+    client = ModelServerClient("/tmp/inexistente.sock")
+    try:
+        def no_reply(msg, timeout=None):
+            raise TimeoutError("model server não respondeu a tempo")
+
+        monkeypatch.setattr(client, "_call", no_reply)
+        for _ in range(2):
+            with pytest.raises(TimeoutError):
+                client.predict_crops(_faces(2))
+        assert client.ring.live == 0
+        # Sem slot em circulação o lote vai pelo socket, não espera por um slot que nunca volta
+        sent = []
+        monkeypatch.setattr(client, "_call", lambda msg, timeout=None: sent.append(msg) or {"fake": 0.3})
+        assert client.predict_crops(_faces(2)) == 0.3
+        assert "faces" in sent[0]
+    finally:
+        client.ring.close()
+
+
+def test_error_reply_releases_the_slot(monkeypatch, small_ring):
+    client = ModelServerClient("/tmp/inexistente.sock")
+    try:
+        def error(msg, timeout=None):
+            raise RuntimeError("model server: CUDA out of memory")
+
+        monkeypatch.setattr(client, "_call", error)
+        for _ in range(3):
+            with pytest.raises(RuntimeError):
+                client.predict_crops(_faces(1))
+        assert client.ring.live == 2
+        assert client.ring._free.qsize() == 2
+    finally:
+        client.ring.close()
+
+
+def test_round_trip_through_the_shm_ring(small_ring, server):
+    client = ModelServerClient(server)
+    try:
+        assert client.health()["models_version"] == "stub"
+        for n in (1, 2):
+            assert client.predict_crops(_faces(n)) == pytest.approx(_local(_faces(n)))
+        assert client.predict_crops([]) == 0.5
+        assert client.ring._free.qsize() == 2
+    finally:
+        client.ring.close()
+
+
+def test_round_trip_through_the_socket(monkeypatch, server):
+    monkeypatch.setattr(model_server, "SHM_RING_SLOTS", 0)
+    client = ModelServerClient(server)
+    assert client.ring is None
+    assert client.predict_crops(_faces(3)) == pytest.approx(_local(_faces(3)))
+
+
+def test_concurrent_frontends_get_their_own_results(small_ring, server):
+    """O servidor agrupa lotes de várias conexões numa passada: cada resposta volta para quem pediu."""
+    client = ModelServerClient(server)
+    # Lotes diferentes por thread; metade pelo ring, metade pelo socket
+    batches = {n: _faces(n)[:2] for n in range(1, 9)}
+    results = {}
+
+    def work(n):
+        crops = batches[n]
+        results[n] = client.predict_crops(crops) if n % 2 else client.predict(deepfake_detector.preprocess_faces(crops))
+
+    try:
+        threads = [threading.Thread(target=work, args=(n,)) for n in batches]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join(timeout=30)
+        assert results == {n: pytest.approx(_local(crops)) for n, crops in batches.items()}
+    finally:
+        client.ring.close()
@@ -0,0 +1,108 @@
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip("cv2")
+
+import phash_index
+from phash_index import BKTree, PerceptualIndex
+
+
+def _random_frames(seed: int, n: int = 4) -> list:
+    rng = np.random.default_rng(seed)
+    return [rng.integers(0, 255, (64, 64, 3), dtype=np.uint8) for _ in range(n)]
+
+
+def test_bktree_matches_brute_force():
+    rnd = random.Random(0)
+    hashes = [rnd.getrandbits(64) for _ in range(500)]
+    tree = BKTree()
+    for i, h in enumerate(hashes):
+        tree.add(h, str(i))
+    for query in hashes[:20] + [rnd.getrandbits(64) for _ in range(20)]:
+        expected = {(phash_index._hamming(query, h), str(i)) for i, h in enumerate(hashes) if phash_index._hamming(query, h) <= 24}
+        assert set(tree.search(query, 24)) == expected
+
+
+def test_bktree_keeps_duplicate_ids():
+    tree = BKTree()
+    tree.add(0xABC, "a")
+    tree.add(0xABC, "b")
+    assert sorted(tree.search(0xABC, 0)) == [(0, "a"), (0, "b")]
+
+
+def test_degenerate_frames_are_dropped():
+    black = np.zeros((64, 64, 3), dtype=np.uint8)
+    gray = np.full((64, 64, 3), 128, dtype=np.uint8)
+    assert phash_index.phash(black) in phash_index.DEGENERATE_HASHES
+    assert phash_index.phash(gray) in phash_index.DEGENERATE_HASHES
+    assert phash_index.frame_hashes([black, gray, None]) == []
+    assert len(phash_index.frame_hashes(_random_frames(0, 10), keyframes=4)) == 4
+
+
+def test_lookup_returns_only_confirmed_fakes(tmp_path):
+    idx = PerceptualIndex(str(tmp_path / "i.jsonl"))
+    fake, real = phash_index.frame_hashes(_random_frames(1)), phash_index.frame_hashes(_random_frames(2))
+    assert idx.add(real, [], 0.2, "real", "video") is None
+    rid = idx.add(fake, [], 0.9, "provável deepfake", "video")
+    match = idx.lookup(fake)
+    assert match["id"] == rid
+    assert match["similaridade_frames"] == 1.0
+    assert idx.lookup(real) is None
+    assert idx.lookup([0x0, 0x8000000000000000]) is None
+
+
+def test_audio_fingerprint_is_lazy(tmp_path):
+    idx = PerceptualIndex(str(tmp_path / "i.jsonl"))
+    frames = phash_index.frame_hashes(_random_frames(3))
+    calls = []
+    idx.add(frames, lambda: calls.append("add") or [], 0.9, "x", "video")
+    assert idx.lookup(phash_index.frame_hashes(_random_frames(4)), lambda: calls.append("miss") or []) is None
+    assert idx.lookup(frames, lambda: calls.append("hit") or [])
+    # Registro sem áudio: o ffmpeg nunca precisa rodar na consulta
+    assert calls == ["add"]
+
+
+def test_workers_share_the_file(tmp_path):
+    path = str(tmp_path / "i.jsonl")
+    a, b = PerceptualIndex(path), PerceptualIndex(path)
+    frames = phash_index.frame_hashes(_random_frames(5))
+    a.add(frames, [], 0.95, "x", "video")
+    assert b.lookup(frames) is not None
+
+
+def test_cap_compacts_and_other_workers_reload(tmp_path):
+    path = str(tmp_path / "i.jsonl")
+    a, b = PerceptualIndex(path, max_records=5), PerceptualIndex(path, max_records=5)
+    first = phash_index.frame_hashes(_random_frames(100))
+    a.add(first, [], 0.9, "x", "video")
+    for seed in range(101, 107):
+        a.add(phash_index.frame_hashes(_random_frames(seed)), [], 0.9, "x", "video")
+    assert a.stats()["registros"] <= 5
+    assert a.lookup(first) is None
+    assert b.stats()["registros"] == a.stats()["registros"]
+    assert b.lookup(first) is None
+
+
+def test_expired_records_are_ignored(tmp_path):
+    idx = PerceptualIndex(str(tmp_path / "i.jsonl"), ttl_days=1)
+    frames = phash_index.frame_hashes(_random_frames(6))
+    rid = idx.add(frames, [], 0.9, "x", "video")
+    idx.records[rid]["ts"] -= 2 * 86400
+    assert idx.lookup(frames) is None
+
+
+def test_audio_fingerprint_runs_outside_the_lock(tmp_path):
+    idx = PerceptualIndex(str(tmp_path / "i.jsonl"))
+    frames = phash_index.frame_hashes(_random_frames(7))
+    audio = [random.Random(7).getrandbits(64) for _ in range(8)]
+    idx.add(frames, audio, 0.9, "x", "video")
+    held = []
+
+    def fingerprint():
+        held.append(idx._lock.locked())
+        return audio
+
+    assert idx.lookup(frames, fingerprint)["similaridade_audio"] == 1.0
+    assert held == [False]
@@ -0,0 +1,218 @@
+import asyncio
+import time
+
+import pytest
+from fastapi import FastAPI, HTTPException
+from fastapi.responses import StreamingResponse
+from fastapi.testclient import TestClient
+
+import scheduler
+from scheduler import Scheduler, TokenBucket, client_key
+from singleflight import SingleFlight
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_PER_MIN", 60.0)
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_BURST", 3.0)
+    monkeypatch.setattr(scheduler, "MAX_INFLIGHT", 1)
+    monkeypatch.setitem(scheduler.WEIGHTS, "interactive", 4.0)
+    monkeypatch.setitem(scheduler.WEIGHTS, "batch", 1.0)
+    monkeypatch.setattr(scheduler, "TRUSTED_PROXY_IPS", set())
+    monkeypatch.setattr(scheduler, "PROXY_SHARED_SECRET", "")
+    monkeypatch.setattr(scheduler, "RATE_LIMIT_BY_IP", False)
+
+
+def test_token_bucket_burst_then_wait():
+    bucket = TokenBucket()
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    wait = bucket.take()
+    assert 0 < wait <= 1.0
+
+
+def test_token_bucket_refills_up_to_burst():
+    bucket = TokenBucket()
+    for _ in range(3):
+        bucket.take()
+    bucket.ts -= 120  # 2 minutos parado: encheria 120 tokens, mas o teto é a rajada
+    assert [bucket.take() for _ in range(3)] == [0.0, 0.0, 0.0]
+    assert bucket.take() > 0
+    assert bucket.full(time.monotonic() + 60)
+
+
+def test_client_key_ignores_identity_headers_from_untrusted_caller(make_request):
+    req = make_request(headers={"X-Device-Id": "abc", "X-API-Key": "k"})
+    assert client_key(req) == "ip:203.0.113.7"
+
+
+def test_client_key_trusts_proxy_secret(monkeypatch, make_request):
+    monkeypatch.setattr(scheduler, "PROXY_SHARED_SECRET", "s3cret")
+    assert client_key(make_request(headers={"X-Proxy-Secret": "s3cret", "X-Device-Id": "abc"})) == "dev:abc"
+    assert client_key(make_request(headers={"X-Proxy-Secret": "errado", "X-Device-Id": "abc"})) == "ip:203.0.113.7"
+
+
+def test_client_key_trusts_proxy_ip(monkeypatch, make_request):
+    monkeypatch.setattr(scheduler, "TRUSTED_PROXY_IPS", {"10.0.0.2"})
+    headers = {"X-API-Key": "k", "X-Device-Id": "abc"}
+    assert client_key(make_request(headers=headers, host="10.0.0.2")) == "key:k"
+    assert client_key(make_request(headers={"X-Device-Id": "d" * 500}, host="10.0.0.2")) == "dev:" + "d" * 128
+    assert client_key(make_request(host="10.0.0.2")) == "ip:10.0.0.2"
+
+
+def _run_queue(make_request, jobs: list) -> list:
+    """Ocupa o único slot, enfileira jobs [(rota, nome)] na ordem e devolve a ordem de atendimento."""
+    sched = Scheduler({"/i": "interactive", "/b": "batch"})
+    order = []
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sched.slot(make_request("/b")):
+                await gate.wait()
+
+        async def job(path, name):
+            async with sched.slot(make_request(path)):
+                order.append(name)
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        tasks = [asyncio.ensure_future(job(path, name)) for path, name in jobs]
+        await asyncio.sleep(0)
+        assert sched.stats()["queued"] == {
+            "interactive": sum(p == "/i" for p, _ in jobs),
+            "batch": sum(p == "/b" for p, _ in jobs),
+        }
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+
+    asyncio.run(scenario())
+    assert sched.stats()["inflight"] == 0
+    return order
+
+
+def test_wfq_serves_classes_by_weight(make_request):
+    # Batch chega antes, mas com peso 4:1 o interativo passa quatro vezes para cada batch
+    jobs = [("/b", f"b{i}") for i in range(8)] + [("/i", f"i{i}") for i in range(8)]
+    order = _run_queue(make_request, jobs)
+    assert order == ["i0", "i1", "i2", "i3", "b0", "i4", "i5", "i6", "i7", "b1", "b2", "b3", "b4", "b5", "b6", "b7"]
+
+
+def test_wfq_keeps_fifo_within_class(make_request):
+    order = _run_queue(make_request, [("/b", f"b{i}") for i in range(5)])
+    assert order == ["b0", "b1", "b2", "b3", "b4"]
+
+
+def test_expired_deadline_is_shed_before_inference(make_request):
+    sched = Scheduler({"/b": "batch"})
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sched.slot(make_request("/b")):
+                await gate.wait()
+
+        expired = make_request("/b")
+        expired.state.deadline = time.time() - 1
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+
+        async def late():
+            async with sched.slot(expired):
+                pytest.fail("inferência rodou com o prazo vencido")
+
+        waiter = asyncio.ensure_future(late())
+        await asyncio.sleep(0)
+        gate.set()
+        await holder
+        with pytest.raises(HTTPException) as exc:
+            await waiter
+        assert exc.value.status_code == 504
+
+    asyncio.run(scenario())
+    assert sched.counters["shed_deadline"] == 1
+    assert sched.stats()["inflight"] == 0
+
+
+def _app_with(sched: Scheduler, seen: list):
+    app = FastAPI()
+    app.middleware("http")(sched.middleware)
+
+    @app.post("/b")
+    def simple():
+        return {"ok": True}
+
+    @app.post("/lote")
+    def stream():
+        def lines():
+            for i in range(3):
+                seen.append(sched.stats()["pending"])
+                yield f"{i}\n"
+        return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+    return app
+
+
+def test_rate_limit_off_without_identity_source():
+    client = TestClient(_app_with(Scheduler({"/b": "batch"}), []))
+    assert [client.post("/b").status_code for _ in range(5)] == [200] * 5
+
+
+@pytest.mark.parametrize("setting", [("PROXY_SHARED_SECRET", "s3cret"), ("RATE_LIMIT_BY_IP", True)])
+def test_rate_limit_on_with_identity_source_or_opt_in(monkeypatch, setting):
+    monkeypatch.setattr(scheduler, *setting)
+    client = TestClient(_app_with(Scheduler({"/b": "batch"}), []))
+    codes = [client.post("/b").status_code for _ in range(5)]
+    assert codes[:3] == [200] * 3 and codes[3:] == [429, 429]
+
+
+def test_pending_covers_the_whole_stream():
+    seen = []
+    sched = Scheduler({"/lote": "batch"})
+    client = TestClient(_app_with(sched, seen))
+    assert client.post("/lote").text == "0\n1\n2\n"
+    assert seen == [1, 1, 1]
+    assert sched.stats()["pending"] == 0
+
+
+@pytest.mark.parametrize("leader, follower, expected", [(10.0, 20.0, 20.0), (20.0, 10.0, 20.0), (10.0, None, None), (None, 10.0, None)])
+def test_join_deadline_keeps_the_latest(make_request, leader, follower, expected):
+    a, b = make_request(), make_request()
+    a.state.deadline, b.state.deadline = leader, follower
+    scheduler.join_deadline(a, b)
+    assert a.state.deadline == expected
+
+
+def test_follower_deadline_keeps_shared_analysis_alive(make_request):
+    """Leader com prazo vencido na fila: o follower coalescido, com prazo válido, ainda recebe o resultado."""
+    sched = Scheduler({"/b": "batch"})
+    flight = SingleFlight(join=scheduler.join_deadline)
+
+    async def scenario():
+        gate = asyncio.Event()
+
+        async def hold():
+            async with sched.slot(make_request("/b")):
+                await gate.wait()
+
+        leader, follower = make_request("/b"), make_request("/b")
+        leader.state.deadline = time.time() + 0.01
+        follower.state.deadline = time.time() + 60
+
+        async def analyze():
+            async with sched.slot(leader):
+                return {"fake": 0.2}
+
+        holder = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        first = asyncio.ensure_future(flight.do("k", analyze, leader))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("k", analyze, follower))
+        await asyncio.sleep(0.05)
+        gate.set()
+        await holder
+        return await asyncio.gather(first, second)
+
+    assert asyncio.run(scenario()) == [{"fake": 0.2}, {"fake": 0.2, "coalescido": True}]
+    assert sched.counters["shed_deadline"] == 0
@@ -0,0 +1,83 @@
+import os
+
+import pytest
+from fastapi import HTTPException
+
+import scratch
+from scratch import ScratchManager
+
+
+@pytest.fixture
+def manager(monkeypatch, tmp_path):
+    tmpfs, disk = tmp_path / "shm", tmp_path / "disk"
+    tmpfs.mkdir()
+    disk.mkdir()
+    monkeypatch.setattr(scratch, "SCRATCH_TMPFS_DIR", str(tmpfs))
+    monkeypatch.setattr(scratch, "SCRATCH_DIR", str(disk))
+    monkeypatch.setattr(scratch, "SCRATCH_MEMORY_MAX_BYTES", 100)
+    monkeypatch.setattr(scratch, "SCRATCH_REQUEST_BYTES", 1000)
+    monkeypatch.setattr(scratch, "SCRATCH_TOTAL_BYTES", 1500)
+    return ScratchManager("teste")
+
+
+def test_small_files_go_to_tmpfs_large_to_disk(manager):
+    with manager.request() as s:
+        assert s.write(b"x" * 10, ".bin").startswith(manager.tmpfs_root)
+        assert s.write(b"x" * 200, ".bin").startswith(manager.disk_root)
+
+
+def test_full_tmpfs_falls_back_to_disk(manager, monkeypatch):
+    monkeypatch.setattr(manager, "tmpfs_has_room", lambda: False)
+    with manager.request() as s:
+        assert s.write(b"x" * 10).startswith(manager.disk_root)
+        assert s.path(".wav").startswith(manager.disk_root)
+
+
+def test_request_quota(manager):
+    with manager.request() as s:
+        s.write(b"x" * 900)
+        with pytest.raises(HTTPException) as exc:
+            s.write(b"x" * 200)
+        assert exc.value.status_code == 507
+    assert manager.stats()["used_mb"] == 0
+
+
+def test_process_quota_and_release(manager):
+    a, b = manager.new(), manager.new()
+    a.write(b"x" * 900)
+    with pytest.raises(HTTPException) as exc:
+        b.write(b"x" * 700)
+    assert exc.value.status_code == 507
+    a.close()
+    b.write(b"x" * 700)
+    b.close()
+    assert manager._used == 0
+
+
+def test_account_directory_counts_toward_quota(manager):
+    with manager.request() as s:
+        d = s.mkdtemp("syncnet_")
+        os.makedirs(os.path.join(d, "crops"))
+        for i in range(3):
+            with open(os.path.join(d, "crops", f"{i}.jpg"), "wb") as f:
+                f.write(b"x" * 400)
+        with pytest.raises(HTTPException):
+            s.account(d)
+
+
+def test_close_removes_files(manager):
+    s = manager.new()
+    paths = [s.write(b"x" * 10), s.write(b"x" * 200), s.mkdtemp()]
+    s.close()
+    assert not any(os.path.exists(p) for p in paths)
+
+
+def test_orphans_of_dead_workers_are_removed(manager, tmp_path):
+    parent = os.path.dirname(manager.disk_root)
+    orphan = os.path.join(parent, "teste-999999999")
+    other_service = os.path.join(parent, "outro-999999999")
+    os.makedirs(orphan)
+    os.makedirs(other_service)
+    manager.cleanup_orphans()
+    assert not os.path.exists(orphan)
+    assert os.path.exists(other_service)
@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pytest
+
+import sessions
+from sessions import FULL, LIGHT, SKIP, SessionStore
+
+
+@pytest.fixture(autouse=True)
+def defaults(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_EVIDENCE_WEIGHT", 0.5)
+    monkeypatch.setattr(sessions, "SESSION_MIN_SAMPLES", 3)
+    monkeypatch.setattr(sessions, "SESSION_RECHECK_S", 30.0)
+    monkeypatch.setattr(sessions, "SESSION_TTL_S", 600.0)
+    monkeypatch.setattr(sessions, "SESSION_MAX", 10000)
+
+
+def _feed(store, sid, modality, scores):
+    for score in scores:
+        mode = store.plan(sid, modality)
+        store.record(sid, modality, score, mode)
+
+
+def test_single_tick_cannot_decide():
+    store = SessionStore()
+    _feed(store, "s", "frames", [0.999])
+    assert store.plan("s", "frames") == FULL
+    assert store.summary("s")["modalidades"]["frames"]["veredito"] is None
+
+
+def test_consistent_fake_ticks_decide_and_pause():
+    store = SessionStore()
+    _feed(store, "s", "frames", [0.99] * 5)
+    track = store.summary("s")["modalidades"]["frames"]
+    assert track["veredito"] == "fake"
+    assert track["amostras"] == 5
+    assert store.plan("s", "frames") == SKIP
+    assert store.modality_score("s", "frames") == pytest.approx(0.99)
+
+
+def test_consistent_real_ticks_decide_real():
+    store = SessionStore()
+    _feed(store, "s", "voz", [0.01] * 5)
+    assert store.summary("s")["modalidades"]["voz"]["veredito"] == "real"
+
+
+def test_fused_verdict_sums_modalities():
+    store = SessionStore()
+    # Nenhuma modalidade decide sozinha com 2 ticks, mas a soma dos LLR passa do limite
+    _feed(store, "s", "frames", [0.99, 0.99])
+    _feed(store, "s", "voz", [0.99, 0.99])
+    _feed(store, "s", "lipsync", [0.99])
+    summary = store.summary("s")
+    assert all(t["veredito"] is None for t in summary["modalidades"].values())
+    assert summary["veredito"] == "fake"
+    assert summary["fake"] > 0.99
+
+
+def test_periodic_light_check_reopens_on_disagreement():
+    store = SessionStore()
+    _feed(store, "s", "frames", [0.99] * 5)
+    store._sessions["s"].tracks["frames"].last_run = time.monotonic() - 31
+    mode = store.plan("s", "frames")
+    assert mode == LIGHT
+    store.record("s", "frames", 0.1, mode)
+    assert store.counters["reaberturas"] == 1
+    assert store.plan("s", "frames") == FULL
+
+
+def test_scene_change_resets_modality():
+    store = SessionStore()
+    for _ in range(5):
+        mode = store.plan("s", "frames", 0x0F0F, sessions.hamming, 20)
+        store.record("s", "frames", 0.99, mode)
+    assert store.plan("s", "frames", 0x0F0F, sessions.hamming, 20) == SKIP
+    assert store.plan("s", "frames", (1 << 64) - 1 - 0x0F0F, sessions.hamming, 20) == FULL
+    assert store.counters["mudancas"] == 1
+
+
+def test_speaker_signature_distance():
+    rng = np.random.default_rng(0)
+    t = np.arange(16000 * 2) / 16000
+    low = np.sin(2 * np.pi * 150 * t) + 0.01 * rng.standard_normal(len(t))
+    high = np.sin(2 * np.pi * 3000 * t) + 0.01 * rng.standard_normal(len(t))
+    a, b = sessions.speaker_signature(low), sessions.speaker_signature(high)
+    assert sessions.cosine_distance(a, sessions.speaker_signature(low[: 16000])) < 0.05
+    assert sessions.cosine_distance(a, b) > sessions.SESSION_SPEAKER_DISTANCE
+    assert sessions.speaker_signature(np.zeros(100)) is None
+
+
+def test_session_id_from_header_or_body(make_request):
+    assert sessions.session_id(make_request(headers={"X-Session-Id": "abc"})) == "abc"
+    assert sessions.session_id(make_request(), {"sessao": "x" * 500}) == "x" * 128
+    assert sessions.session_id(make_request(), {}) is None
+
+
+def test_oldest_sessions_are_evicted(monkeypatch):
+    monkeypatch.setattr(sessions, "SESSION_MAX", 2)
+    store = SessionStore()
+    for sid in ("a", "b", "c"):
+        store.plan(sid, "frames")
+    assert list(store._sessions) == ["b", "c"]
+    assert store.stats()["ativas"] == 2
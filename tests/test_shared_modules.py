@@ -0,0 +1,18 @@
+"""As duas APIs carregam os mesmos módulos de infraestrutura: as cópias não podem divergir."""
+import filecmp
+import os
+
+import pytest
+
+from conftest import ROOT
+
+SHARED_MODULES = ["scheduler.py", "scratch.py", "sessions.py", "singleflight.py", "model_registry.py", "stub_models.py"]
+
+
+@pytest.mark.parametrize("name", SHARED_MODULES)
+def test_copies_are_identical(name):
+    deepfake = os.path.join(ROOT, "deepfake-api", name)
+    voice = os.path.join(ROOT, "voice-api", name)
+    assert filecmp.cmp(deepfake, voice, shallow=False), (
+        f"{name} divergiu entre deepfake-api/ e voice-api/: edite um e copie para o outro"
+    )
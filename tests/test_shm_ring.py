@@ -0,0 +1,101 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+import numpy as np
+import pytest
+
+import shm_ring
+from shm_ring import ShmRing
+
+pytestmark = pytest.mark.skipif(not os.path.isdir(shm_ring.SHM_DIR), reason="sem /dev/shm")
+
+StatVfs = namedtuple("StatVfs", "f_bavail f_frsize")
+
+
+@pytest.fixture
+def ring():
+    r = ShmRing(4096, 2)
+    yield r
+    r.close()
+
+
+def test_descriptor_round_trip(ring):
+    slot = ring.acquire()
+    x = ring.ndarray(slot, (2, 8, 8, 3))
+    x[:] = np.arange(x.size, dtype=np.uint8).reshape(x.shape)
+    assert np.array_equal(shm_ring.view(ring.descriptor(slot, x)), x)
+    with pytest.raises(ValueError):
+        ring.ndarray(slot, (1, 64, 64, 3))
+
+
+def test_exhausted_ring_blocks_then_times_out(ring):
+    a, b = ring.acquire(), ring.acquire()
+    assert {a, b} == {0, 1}
+    t0 = time.monotonic()
+    with pytest.raises(TimeoutError):
+        ring.acquire(timeout=0.05)
+    assert time.monotonic() - t0 >= 0.05
+
+
+def test_backpressure_waits_for_release(ring):
+    held = [ring.acquire(), ring.acquire()]
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(ring.acquire(timeout=5)))
+    waiter.start()
+    time.sleep(0.05)
+    assert got == []
+    ring.release(held[1])
+    waiter.join(timeout=5)
+    assert got == [held[1]]
+
+
+def test_retired_slot_never_comes_back(ring):
+    ring.retire(ring.acquire())
+    assert ring.live == 1
+    ring.acquire()
+    with pytest.raises(TimeoutError):
+        ring.acquire(timeout=0.05)
+
+
+@pytest.mark.parametrize("free_mb, expected", [(1024, 2), (120, 1), (64, 0)])
+def test_fitting_slots_follows_free_space(monkeypatch, free_mb, expected):
+    monkeypatch.setattr(shm_ring.os, "statvfs", lambda path: StatVfs(free_mb * 256, 4096))
+    assert shm_ring.fitting_slots(55 * 2**20, 2) == expected
+
+
+def test_no_space_is_an_error_at_creation(monkeypatch):
+    def enospc(fd, offset, size):
+        raise OSError(28, "No space left on device")
+
+    monkeypatch.setattr(shm_ring.os, "posix_fallocate", enospc)
+    with pytest.raises(OSError):
+        ShmRing(4096, 2)
+    assert not [f for f in os.listdir(shm_ring.SHM_DIR) if f.startswith(f"{shm_ring.SHM_PREFIX}{os.getpid()}-")]
+
+
+def test_recreated_ring_is_not_read_from_the_old_segment():
+    """O consumidor guarda segmentos anexados pelo nome: um ring novo do mesmo processo não pode reaproveitá-lo."""
+    first = ShmRing(4096, 1)
+    x = first.ndarray(0, (4,))
+    x[:] = 1
+    assert shm_ring.view(first.descriptor(0, x)).tolist() == [1, 1, 1, 1]
+    first.close()
+    second = ShmRing(4096, 1)
+    try:
+        y = second.ndarray(0, (4,))
+        y[:] = 2
+        assert shm_ring.view(second.descriptor(0, y)).tolist() == [2, 2, 2, 2]
+    finally:
+        second.close()
+
+
+def test_orphans_of_dead_processes_are_removed(monkeypatch, tmp_path):
+    monkeypatch.setattr(shm_ring, "SHM_DIR", str(tmp_path))
+    alive = f"{shm_ring.SHM_PREFIX}{os.getpid()}-aaaa"
+    dead = f"{shm_ring.SHM_PREFIX}{2**22 + 1}-bbbb"
+    for name in (alive, dead, "outro-segmento"):
+        (tmp_path / name).write_bytes(b"")
+    shm_ring.cleanup_orphans()
+    assert sorted(os.listdir(tmp_path)) == sorted([alive, "outro-segmento"])
@@ -0,0 +1,100 @@
+import asyncio
+
+import pytest
+
+import singleflight
+from singleflight import SingleFlight, content_key
+
+
+@pytest.fixture(autouse=True)
+def enabled(monkeypatch):
+    monkeypatch.setattr(singleflight, "SINGLEFLIGHT_ENABLED", True)
+
+
+def test_content_key_separates_parts():
+    assert content_key("/a", "ab", "c") != content_key("/a", "a", "bc")
+    assert content_key("/a", b"x") == content_key("/a", "x")
+    assert content_key("/a", b"x") != content_key("/b", b"x")
+
+
+def test_concurrent_identical_calls_run_once():
+    flight = SingleFlight()
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"fake": 0.9}
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", analyze) for _ in range(5)))
+
+    results = asyncio.run(scenario())
+    assert len(calls) == 1
+    assert results[0] == {"fake": 0.9}
+    assert all(r == {"fake": 0.9, "coalescido": True} for r in results[1:])
+    assert flight.stats() == {"inflight": 0, "executed": 1, "coalesced": 4}
+
+
+def test_nothing_is_cached_after_completion():
+    flight = SingleFlight()
+    calls = []
+
+    async def analyze():
+        calls.append(1)
+        return {"ok": True}
+
+    async def scenario():
+        await flight.do("k", analyze)
+        return await flight.do("k", analyze)
+
+    assert asyncio.run(scenario()) == {"ok": True}
+    assert len(calls) == 2
+
+
+def test_error_reaches_every_waiter():
+    flight = SingleFlight()
+
+    async def analyze():
+        await asyncio.sleep(0.01)
+        raise ValueError("vídeo corrompido")
+
+    async def scenario():
+        return await asyncio.gather(*(flight.do("k", analyze) for _ in range(3)), return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert all(isinstance(r, ValueError) for r in results)
+    assert flight.stats()["inflight"] == 0
+
+
+def test_leader_disconnect_does_not_cancel_followers():
+    flight = SingleFlight()
+
+    async def analyze():
+        await asyncio.sleep(0.02)
+        return {"fake": 0.1}
+
+    async def scenario():
+        leader = asyncio.ensure_future(flight.do("k", analyze))
+        await asyncio.sleep(0)
+        follower = asyncio.ensure_future(flight.do("k", analyze))
+        await asyncio.sleep(0)
+        leader.cancel()
+        return await follower
+
+    assert asyncio.run(scenario()) == {"fake": 0.1, "coalescido": True}
+
+
+def test_join_sees_leader_and_follower_contexts():
+    joined = []
+    flight = SingleFlight(join=lambda leader, follower: joined.append((leader, follower)))
+
+    async def analyze():
+        await asyncio.sleep(0.01)
+        return {}
+
+    async def scenario():
+        await asyncio.gather(flight.do("k", analyze, "lider"), flight.do("k", analyze, "seguidor"), flight.do("k", analyze))
+
+    asyncio.run(scenario())
+    assert joined == [("lider", "seguidor")]
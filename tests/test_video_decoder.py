@@ -0,0 +1,78 @@
+import cv2
+import numpy as np
+import pytest
+
+import video_decoder
+from video_decoder import SampledVideoReader
+
+FRAMES = 60
+FPS = 10.0
+
+
+@pytest.fixture(autouse=True)
+def opencv(monkeypatch):
+    monkeypatch.setattr(video_decoder, "VIDEO_DECODER", "opencv")
+    monkeypatch.setattr(video_decoder, "DECODE_MAX_SIDE", 1920)
+    monkeypatch.setattr(video_decoder, "SEEK_MIN_GAP_S", 0.5)
+
+
+@pytest.fixture(scope="module")
+def video(tmp_path_factory):
+    """Frame i: cinza 4 * i (o índice sobrevive ao JPEG) e um quadrado vermelho no canto (ordem dos canais)."""
+    path = str(tmp_path_factory.mktemp("video") / "v.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), FPS, (64, 48))
+    for i in range(FRAMES):
+        frame = np.full((48, 64, 3), 4 * i, dtype=np.uint8)
+        frame[:16, :16] = (0, 0, 255)
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def _index_of(frame: np.ndarray) -> int:
+    """Frames saem em RGB: o vermelho gravado em BGR aparece no canal 0."""
+    marker = frame[4:12, 4:12].mean(axis=(0, 1))
+    assert marker[0] > 200 and marker[2] < 60
+    return int(round(frame[24:, 24:].mean() / 4))
+
+
+def test_opencv_reads_exactly_the_sampled_frames(video):
+    reader = SampledVideoReader()
+    frames, idxs = reader.read_frames(video, 4)
+    expected = list(np.linspace(0, FRAMES - 1, 4, dtype=int))
+    assert idxs == expected
+    assert [_index_of(f) for f in frames] == expected
+    assert frames.shape == (4, 48, 64, 3)
+
+
+def test_distant_samples_seek_instead_of_grabbing(video):
+    reader = SampledVideoReader()
+    reader.read_frames(video, 4)
+    # Amostras a ~19 frames de distância, acima de SEEK_MIN_GAP_S (5 frames): só os amostrados passam por grab()
+    assert reader.stats["decoder"] == "opencv"
+    assert reader.stats["seeks"] == 3
+    assert reader.stats["frames_grabbed"] == 4
+    assert reader.stats["frames_sampled"] == 4
+
+
+def test_close_samples_are_grabbed_in_sequence(monkeypatch, video):
+    monkeypatch.setattr(video_decoder, "SEEK_MIN_GAP_S", 100.0)
+    reader = SampledVideoReader()
+    frames, idxs = reader.read_frames(video, 4)
+    assert [_index_of(f) for f in frames] == idxs
+    assert reader.stats["seeks"] == 0
+    assert reader.stats["frames_grabbed"] == FRAMES
+
+
+def test_large_frames_are_downscaled(monkeypatch, video):
+    monkeypatch.setattr(video_decoder, "DECODE_MAX_SIDE", 32)
+    frames, _ = SampledVideoReader().read_frames(video, 2)
+    assert frames.shape[1:] == (24, 32, 3)
+
+
+def test_unreadable_file_returns_none(tmp_path):
+    path = tmp_path / "quebrado.mp4"
+    path.write_bytes(b"nao e video")
+    reader = SampledVideoReader()
+    assert reader.read_frames(str(path), 4) is None
+    assert reader.stats["decoder"] == "opencv"
@@ -5,34 +5,95 @@ Endpoints: /analisar-audio (voz), /analisar-lipsync (SyncNet - opcional).
 """
 
 import base64
+import hmac
 import os
 import subprocess
-import tempfile
+import threading
+import time
 from pathlib import Path
 
 import numpy as np
 
-from fastapi import FastAPI, File, UploadFile, HTTPException, Body
+from fastapi import FastAPI, File, UploadFile, HTTPException, Body, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
 
-from voice_detector import predict_synthetic
+import model_registry
+import sessions
+import stub_models
+import voice_detector
+from scheduler import ALLOWED_ORIGINS, join_deadline, Scheduler
+from scratch import ScratchManager
+from singleflight import SingleFlight, content_key
+from stub_models import STUB_MODELS
+from voice_detector import predict_synthetic, warmup
+
+# Com registro local, nenhum modelo vem do hub (antes de qualquer import de transformers)
+model_registry.offline()
 
 app = FastAPI(title="RealityScan Voice API")
-app.add_middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+app.add_middleware(CORSMiddleware, allow_origins=ALLOWED_ORIGINS, allow_methods=["*"], allow_headers=["*"])
+
+# Rate limit por cliente + fila justa: áudio do Sentry (interativo) passa à frente de uploads
+scheduler = Scheduler({
+    "/analisar-audio": "batch",
+    "/analisar-lipsync": "batch",
+    "/analisar-audio-base64": "interactive",
+})
+app.middleware("http")(scheduler.middleware)
+
+# Arquivos temporários por requisição em tmpfs/disco com cota; limpa sobras de workers mortos
+scratch_space = ScratchManager("voice-api")
+
+# Uploads idênticos simultâneos (áudio viralizando) rodam uma única análise
+inflight = SingleFlight(join=join_deadline)
+
+# Chamadas ao vivo do Sentry (X-Session-Id): evidência acumulada, amostragem reduzida após o veredito
+session_store = sessions.SessionStore()
 
 SYNCNET_DIR = os.environ.get("SYNCNET_DIR", "/app/syncnet_python")
+WARMUP = os.environ.get("WARMUP", "1") != "0"
+WARMUP_AUDIO_SECONDS = [float(x) for x in os.environ.get("WARMUP_AUDIO_SECONDS", "3,10").split(",") if x.strip()]
+
+# /ready só responde 200 depois de carregar e aquecer o modelo de voz
+ready = threading.Event()
+
+
+def _warmup():
+    try:
+        t = warmup(WARMUP_AUDIO_SECONDS if WARMUP else ())
+        print(f"🔥 Warm-up modelo de voz: {t:.1f}s (áudios de {WARMUP_AUDIO_SECONDS if WARMUP else []}s).")
+    except model_registry.RegistryError as e:
+        # Modelo faltando no registro: /ready fica em 503 em vez de servir o fallback "indeterminado"
+        print(f"❌ Registro de modelos: {e}")
+        return
+    except Exception as e:
+        print(f"⚠️ Warm-up falhou ({e}); seguindo sem warm-up.")
+    ready.set()
+
 
+@app.on_event("startup")
+def startup():
+    if model_registry.enabled():
+        model_registry.install_syncnet(SYNCNET_DIR)
+    # Em background: /health continua respondendo enquanto /ready devolve 503
+    threading.Thread(target=_warmup, daemon=True).start()
 
-def _ensure_wav(audio_path: str, content: bytes, suffix: str) -> str:
-    """Converte áudio para WAV 16kHz se necessário."""
+
+@app.get("/ready")
+def readiness():
+    if not ready.is_set():
+        return JSONResponse({"ready": False, "detail": "warm-up em andamento"}, status_code=503)
+    return {"ready": True}
+
+
+def _ensure_wav(audio_path: str, suffix: str, scratch) -> str:
+    """Converte áudio para WAV 16kHz se necessário (saída no rascunho da requisição)."""
     if suffix.lower() in (".wav",):
-        with open(audio_path, "wb") as f:
-            f.write(content)
         return audio_path
     # Converter com ffmpeg
-    out_path = audio_path + ".wav"
-    with open(audio_path, "wb") as f:
-        f.write(content)
+    out_path = scratch.path(".wav")
     r = subprocess.run(
         ["ffmpeg", "-y", "-i", audio_path, "-ac", "1", "-ar", "16000", out_path],
         capture_output=True,
@@ -40,16 +101,75 @@ def _ensure_wav(audio_path: str, content: bytes, suffix: str) -> str:
     )
     if r.returncode != 0:
         raise ValueError("Áudio inválido ou formato não suportado.")
-    return out_path
+    return scratch.account(out_path)
 
 
 @app.get("/health")
 def health():
-    return {"status": "ok", "voice": "ready"}
+    return {
+        "status": "ok",
+        "voice": "ready",
+        "models_version": voice_detector._voice_version,
+        "scheduler": scheduler.stats(),
+        "scratch": scratch_space.stats(),
+        "singleflight": inflight.stats(),
+        "sessoes": session_store.stats(),
+    }
+
+
+# Troca de versão do registro local de modelos; sem ADMIN_TOKEN as rotas /admin ficam desativadas
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")
+_swap_lock = threading.Lock()
+
+
+def _require_admin(request: Request):
+    if not ADMIN_TOKEN or not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(403, "Acesso restrito.")
+    if not model_registry.enabled():
+        raise HTTPException(409, "Registro de modelos desativado (defina MODEL_REGISTRY_DIR).")
+
+
+def _activate(version: str) -> dict:
+    t0 = time.perf_counter()
+    version = model_registry.checked(version)
+    # Aquece a versão nova ao lado da atual; a troca da referência é o último passo
+    voice_detector.reload_model(version, WARMUP_AUDIO_SECONDS if WARMUP else ())
+    model_registry.install_syncnet(SYNCNET_DIR, version)
+    model_registry.set_current(version)
+    return {"versao": version, "tempo_s": round(time.perf_counter() - t0, 1)}
+
+
+@app.get("/admin/modelos")
+def admin_modelos(request: Request):
+    _require_admin(request)
+    try:
+        ativa = model_registry.current_version()
+    except model_registry.RegistryError:
+        ativa = None
+    return {"versao_ativa": ativa, "carregadas": {"voz": voice_detector._voice_version}, "versoes": model_registry.versions()}
+
+
+@app.post("/admin/modelos/ativar")
+async def admin_ativar_modelos(request: Request, body: dict = Body(...)):
+    """Hot-swap: body { "versao": "2026.10" }. Requisições em andamento terminam com a versão anterior."""
+    _require_admin(request)
+    version = body.get("versao")
+    if not version or not isinstance(version, str):
+        raise HTTPException(400, "Campo 'versao' obrigatório.")
+    if not _swap_lock.acquire(blocking=False):
+        raise HTTPException(409, "Troca de versão já em andamento.")
+    try:
+        return await run_in_threadpool(_activate, version)
+    except model_registry.RegistryError as e:
+        raise HTTPException(400, str(e))
+    except Exception as e:
+        raise HTTPException(500, f"Falha ao carregar versão {version}: {str(e)}")
+    finally:
+        _swap_lock.release()
 
 
 @app.post("/analisar-audio")
-async def analisar_audio(audio: UploadFile = File(...)):
+async def analisar_audio(request: Request, audio: UploadFile = File(...)):
     """
     Analisa áudio para detectar voz sintética/IA.
     Aceita: wav, mp3, webm, ogg, flac.
@@ -67,34 +187,34 @@ async def analisar_audio(audio: UploadFile = File(...)):
     ext = Path(audio.filename or "audio.wav").suffix or ".wav"
     if "webm" in (audio.filename or "").lower():
         ext = ".webm"
+    key = await run_in_threadpool(content_key, "/analisar-audio", content)
+    return await inflight.do(key, lambda: _analisar_audio(request, content, ext), request)
 
-    tmp_path = None
-    try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            f.write(content)
-            tmp_path = f.name
 
-        wav_path = _ensure_wav(tmp_path, content, ext)
-        result = predict_synthetic(wav_path)
+async def _analisar_audio(request: Request, content: bytes, ext: str) -> dict:
+    scratch = scratch_space.new()
+    try:
+        tmp_path = scratch.write(content, ext)
+        wav_path = _ensure_wav(tmp_path, ext, scratch)
+        async with scheduler.slot(request):
+            result = await run_in_threadpool(predict_synthetic, wav_path)
         return result
     except ValueError as e:
         raise HTTPException(400, str(e))
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise de voz: {str(e)}")
     finally:
-        for p in (tmp_path, (tmp_path + ".wav") if tmp_path else None):
-            if p and os.path.exists(p):
-                try:
-                    os.unlink(p)
-                except Exception:
-                    pass
+        scratch.close()
 
 
 @app.post("/analisar-audio-base64")
-async def analisar_audio_base64(body: dict = Body(...)):
+async def analisar_audio_base64(request: Request, body: dict = Body(...)):
     """
     Recebe áudio em base64 (Sentry com compartilhamento de áudio).
-    body: { "audio": "data:audio/webm;base64,..." }
+    body: { "audio": "data:audio/webm;base64,...", "sessao": opcional }
+    Com sessão (X-Session-Id ou "sessao") a resposta traz o bloco "sessao" com o veredito acumulado.
     """
     audio_b64 = body.get("audio")
     if not audio_b64 or not isinstance(audio_b64, str):
@@ -107,32 +227,69 @@ async def analisar_audio_base64(body: dict = Body(...)):
         raise HTTPException(400, "Áudio muito curto.")
 
     ext = ".webm"  # Sentry grava webm
-    tmp_path = None
+    sid = sessions.session_id(request, body)
+    key = await run_in_threadpool(content_key, "/analisar-audio-base64", sid or "", raw)
+    return await inflight.do(key, lambda: _analisar_audio_raw(request, raw, ext, sid), request)
+
+
+def _load_voice_sample(wav_path: str) -> tuple:
+    audio = voice_detector._load_audio(wav_path)
+    return audio, sessions.speaker_signature(audio)
+
+
+async def _analisar_audio_raw(request: Request, raw: bytes, ext: str, sid: str = None) -> dict:
+    scratch = scratch_space.new()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            f.write(raw)
-            tmp_path = f.name
-        wav_path = _ensure_wav(tmp_path, raw, ext)
-        result = predict_synthetic(wav_path)
+        tmp_path = scratch.write(raw, ext)
+        wav_path = _ensure_wav(tmp_path, ext, scratch)
+        if sid is None:
+            async with scheduler.slot(request):
+                result = await run_in_threadpool(predict_synthetic, wav_path)
+            return result
+
+        audio, signature = await run_in_threadpool(_load_voice_sample, wav_path)
+        mode = session_store.plan(
+            sid, "voz", signature, sessions.cosine_distance, sessions.SESSION_SPEAKER_DISTANCE
+        )
+        if mode == sessions.SKIP:
+            result = voice_detector.voice_result(session_store.modality_score(sid, "voz"))
+        else:
+            if mode == sessions.LIGHT:
+                audio = audio[: int(16000 * sessions.SESSION_LIGHT_AUDIO_S)]
+            async with scheduler.slot(request):
+                fake = await run_in_threadpool(voice_detector.score_audio, audio)
+            if fake is None:
+                return voice_detector.predict_audio(audio)
+            session_store.record(sid, "voz", fake, mode)
+            result = voice_detector.voice_result(fake)
+        result["sessao"] = session_store.summary(sid, mode)
         return result
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(500, f"Erro na análise de voz: {str(e)}")
     finally:
-        for p in (tmp_path, (tmp_path + ".wav") if tmp_path else None):
-            if p and os.path.exists(p):
-                try:
-                    os.unlink(p)
-                except Exception:
-                    pass
+        scratch.close()
 
 
-def _run_syncnet(video_path: str) -> dict:
-    """Executa SyncNet no vídeo. Retorna { lip_sync_ok, confidence, distance }."""
+def _run_syncnet(video_path: str, data_dir: str) -> dict:
+    """
+    Executa SyncNet no vídeo. Retorna { lip_sync_ok, confidence, distance }.
+    data_dir é do rascunho da requisição: quem chama contabiliza na cota e apaga (scratch.close()).
+    """
+    if STUB_MODELS:
+        stub_models.delay(stub_models.STUB_LIPSYNC_MS)
+        avg_dist = stub_models.file_score(video_path)
+        return {
+            "lip_sync_ok": avg_dist < 0.4,
+            "confidence": round(1.0 - avg_dist, 4),
+            "distance": round(avg_dist, 4),
+            "resultado": "boca sincronizada" if avg_dist < 0.4 else "boca possivelmente dessincronizada (suspeito)",
+        }
     if not os.path.exists(os.path.join(SYNCNET_DIR, "run_syncnet.py")):
         return {"lip_sync_ok": None, "confidence": None, "distance": None, "resultado": "SyncNet não instalado"}
 
     ref = "sentry"
-    data_dir = tempfile.mkdtemp()
     try:
         # run_pipeline extrai faces e crops
         r1 = subprocess.run(
@@ -170,14 +327,10 @@ def _run_syncnet(video_path: str) -> dict:
             }
     except Exception as e:
         return {"lip_sync_ok": None, "confidence": None, "distance": None, "resultado": str(e)}
-    finally:
-        import shutil
-        if os.path.exists(data_dir):
-            shutil.rmtree(data_dir, ignore_errors=True)
 
 
 @app.post("/analisar-lipsync")
-async def analisar_lipsync(video: UploadFile = File(...)):
+async def analisar_lipsync(request: Request, video: UploadFile = File(...)):
     """
     Analisa se a boca está sincronizada com o áudio (SyncNet).
     Aceita vídeo com áudio (mp4, webm).
@@ -189,19 +342,21 @@ async def analisar_lipsync(video: UploadFile = File(...)):
     ext = ".mp4"
     if "webm" in (video.filename or "").lower():
         ext = ".webm"
+    key = await run_in_threadpool(content_key, "/analisar-lipsync", content)
+    return await inflight.do(key, lambda: _analisar_lipsync(request, content, ext), request)
 
-    tmp_path = None
+
+async def _analisar_lipsync(request: Request, content: bytes, ext: str) -> dict:
+    scratch = scratch_space.new()
     try:
-        with tempfile.NamedTemporaryFile(delete=False, suffix=ext) as f:
-            f.write(content)
-            tmp_path = f.name
-        return _run_syncnet(tmp_path)
+        tmp_path = scratch.write(content, ext)
+        syncnet_dir = scratch.mkdtemp("syncnet_")
+        async with scheduler.slot(request):
+            result = await run_in_threadpool(_run_syncnet, tmp_path, syncnet_dir)
+        scratch.account(syncnet_dir)
+        return result
     finally:
-        if tmp_path and os.path.exists(tmp_path):
-            try:
-                os.unlink(tmp_path)
-            except Exception:
-                pass
+        scratch.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,274 @@
+"""
+Scheduler de inferência: limite por cliente, fila justa ponderada e descarte por prazo.
+- Token bucket por cliente, aplicado no middleware antes do upload. X-API-Key / X-Device-Id só valem
+  vindos do proxy (IP em TRUSTED_PROXY_IPS ou X-Proxy-Secret = PROXY_SHARED_SECRET); fora isso, o IP.
+  Sem nenhuma fonte de identidade configurada o limite fica desligado (todo o tráfego do proxy cairia
+  num único balde), a não ser que RATE_LIMIT_BY_IP=1 (serviço exposto direto, sem proxy)
+- MAX_PENDING requisições aceitas por processo, contadas até o fim do corpo da resposta (inclusive
+  streams NDJSON); acima disso responde 503 (load shedding)
+- Fila WFQ entre tráfego interativo (Sentry: frames/áudio base64) e batch (vídeo/áudio completo)
+  para os MAX_INFLIGHT slots de inferência
+- Requisição cujo prazo do cliente (X-Deadline-Ms / X-Timeout-Ms) já passou é descartada (504)
+  antes de a inferência começar
+- Com TRAFFIC_TRACE_PATH, cada requisição vira uma linha JSONL que o loadtest/ sabe reproduzir
+"""
+import asyncio
+import hashlib
+import hmac
+import json
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+
+from fastapi import HTTPException, Request
+from fastapi.responses import JSONResponse
+
+RATE_LIMIT_PER_MIN = float(os.environ.get("RATE_LIMIT_PER_MIN", 60))
+RATE_LIMIT_BURST = float(os.environ.get("RATE_LIMIT_BURST", 20))
+MAX_INFLIGHT = int(os.environ.get("MAX_INFLIGHT", 1))
+MAX_PENDING = int(os.environ.get("MAX_PENDING", 32))
+WEIGHTS = {
+    "interactive": float(os.environ.get("WFQ_WEIGHT_INTERACTIVE", 4)),
+    "batch": float(os.environ.get("WFQ_WEIGHT_BATCH", 1)),
+}
+# Quem pode declarar a identidade do usuário (o proxy Node); os demais são limitados pelo IP
+TRUSTED_PROXY_IPS = {ip.strip() for ip in os.environ.get("TRUSTED_PROXY_IPS", "").split(",") if ip.strip()}
+PROXY_SHARED_SECRET = os.environ.get("PROXY_SHARED_SECRET", "")
+RATE_LIMIT_BY_IP = os.environ.get("RATE_LIMIT_BY_IP", "0") != "0"
+# CORS: lista separada por vírgula (padrão "*" mantém o comportamento anterior)
+ALLOWED_ORIGINS = [o.strip() for o in os.environ.get("ALLOWED_ORIGINS", "*").split(",") if o.strip()]
+# Registro de tráfego real para replay (instante, rota, bytes, cliente anonimizado, status, latência)
+TRAFFIC_TRACE_PATH = os.environ.get("TRAFFIC_TRACE_PATH", "")
+
+_MAX_BUCKETS = 10000
+
+
+class TokenBucket:
+    __slots__ = ("tokens", "ts")
+
+    def __init__(self):
+        self.tokens = RATE_LIMIT_BURST
+        self.ts = time.monotonic()
+
+    def take(self) -> float:
+        """Consome 1 token. Retorna 0 se permitido, senão segundos até o próximo token."""
+        now = time.monotonic()
+        self.tokens = min(RATE_LIMIT_BURST, self.tokens + (now - self.ts) * RATE_LIMIT_PER_MIN / 60.0)
+        self.ts = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) * 60.0 / RATE_LIMIT_PER_MIN
+
+    def full(self, now: float) -> bool:
+        return self.tokens + (now - self.ts) * RATE_LIMIT_PER_MIN / 60.0 >= RATE_LIMIT_BURST
+
+
+def trusted_proxy(request: Request) -> bool:
+    if request.client and request.client.host in TRUSTED_PROXY_IPS:
+        return True
+    secret = request.headers.get("x-proxy-secret")
+    return bool(PROXY_SHARED_SECRET and secret) and hmac.compare_digest(secret, PROXY_SHARED_SECRET)
+
+
+def rate_limit_enabled() -> bool:
+    """Há como distinguir clientes: proxy confiável configurado, ou limite por IP pedido explicitamente."""
+    return bool(TRUSTED_PROXY_IPS or PROXY_SHARED_SECRET or RATE_LIMIT_BY_IP)
+
+
+def client_key(request: Request) -> str:
+    """Chave do rate limit. Cabeçalhos de identidade de quem não é o proxy são ignorados (trocar de
+    X-Device-Id a cada requisição não pode dar um balde novo)."""
+    ip = request.client.host if request.client else "anon"
+    if not trusted_proxy(request):
+        return "ip:" + ip
+    api_key = request.headers.get("x-api-key")
+    if api_key:
+        return "key:" + api_key
+    device = request.headers.get("x-device-id")
+    return "dev:" + device[:128] if device else "ip:" + ip
+
+
+def request_deadline(request: Request):
+    """Prazo absoluto (epoch s) informado pelo cliente, ou None."""
+    try:
+        if request.headers.get("x-deadline-ms"):
+            return float(request.headers["x-deadline-ms"]) / 1000.0
+        if request.headers.get("x-timeout-ms"):
+            return time.time() + float(request.headers["x-timeout-ms"]) / 1000.0
+    except ValueError:
+        pass
+    return None
+
+
+def join_deadline(leader: Request, follower: Request):
+    """
+    Follower coalescido na análise do leader (singleflight): a análise compartilhada passa a valer até o
+    prazo mais tardio dos dois (sem prazo se algum não tiver), para o 504 de um não derrubar o outro.
+    """
+    a = getattr(leader.state, "deadline", None)
+    b = getattr(follower.state, "deadline", None)
+    leader.state.deadline = None if a is None or b is None else max(a, b)
+
+
+def _expired(request: Request) -> bool:
+    deadline = getattr(request.state, "deadline", None)
+    return deadline is not None and time.time() >= deadline
+
+
+def _trace(request: Request, status: int, t0: float):
+    rec = {
+        "t": round(time.time(), 3),
+        "path": request.url.path,
+        "bytes": int(request.headers.get("content-length") or 0),
+        "client": hashlib.sha1(client_key(request).encode("utf-8")).hexdigest()[:12],
+        "status": status,
+        "ms": round((time.perf_counter() - t0) * 1000, 1),
+    }
+    try:
+        # Linhas curtas em modo append: vários workers podem escrever no mesmo arquivo
+        with open(TRAFFIC_TRACE_PATH, "a") as f:
+            f.write(json.dumps(rec) + "\n")
+    except OSError:
+        pass
+
+
+class Scheduler:
+    def __init__(self, routes: dict):
+        """routes: caminho → classe de tráfego ("interactive" ou "batch")."""
+        self.routes = routes
+        self._buckets = {}
+        self._queues = {k: deque() for k in WEIGHTS}
+        self._last_finish = {k: 0.0 for k in WEIGHTS}
+        self._vtime = 0.0
+        self._inflight = 0
+        self._pending = 0
+        self.counters = {"rate_limited": 0, "shed_overload": 0, "shed_deadline": 0, "completed": 0}
+        if not rate_limit_enabled():
+            print("⚠️ Rate limit por cliente desligado: configure PROXY_SHARED_SECRET ou TRUSTED_PROXY_IPS "
+                  "(ou RATE_LIMIT_BY_IP=1 sem proxy).")
+
+    def _bucket(self, key: str) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= _MAX_BUCKETS:
+                now = time.monotonic()
+                self._buckets = {k: b for k, b in self._buckets.items() if not b.full(now)}
+            bucket = self._buckets[key] = TokenBucket()
+        return bucket
+
+    async def middleware(self, request: Request, call_next):
+        """Rate limit e load shedding antes de ler o corpo (uploads de até 200MB)."""
+        if request.url.path not in self.routes:
+            return await call_next(request)
+        if not TRAFFIC_TRACE_PATH:
+            return await self._admit(request, call_next)
+        t0 = time.perf_counter()
+        status = 500
+        try:
+            response = await self._admit(request, call_next)
+            status = response.status_code
+            return response
+        finally:
+            _trace(request, status, t0)
+
+    async def _admit(self, request: Request, call_next):
+        wait = self._bucket(client_key(request)).take() if rate_limit_enabled() else 0.0
+        if wait:
+            self.counters["rate_limited"] += 1
+            return JSONResponse(
+                {"detail": "Muitas requisições. Tente novamente em instantes."},
+                status_code=429,
+                headers={"Retry-After": str(math.ceil(wait))},
+            )
+        if self._pending >= MAX_PENDING:
+            self.counters["shed_overload"] += 1
+            return JSONResponse(
+                {"detail": "Servidor sobrecarregado. Tente novamente em instantes."},
+                status_code=503,
+                headers={"Retry-After": "5"},
+            )
+        request.state.deadline = request_deadline(request)
+        self._pending += 1
+        try:
+            response = await call_next(request)
+        except BaseException:
+            self._pending -= 1
+            raise
+        # A requisição só sai de pending quando o corpo termina (ex.: /analisar-lote em streaming)
+        body = response.body_iterator
+
+        async def tracked_body():
+            try:
+                async for chunk in body:
+                    yield chunk
+            finally:
+                self._pending -= 1
+
+        response.body_iterator = tracked_body()
+        return response
+
+    @asynccontextmanager
+    async def slot(self, request: Request):
+        """Aguarda a vez na fila justa e segura um slot de inferência durante o bloco."""
+        klass = self.routes.get(request.url.path, "batch")
+        if self._inflight < MAX_INFLIGHT and not any(self._queues.values()):
+            self._inflight += 1
+        else:
+            # WFQ: tag de término virtual = max(tempo virtual, último término da classe) + 1/peso
+            finish = max(self._vtime, self._last_finish[klass]) + 1.0 / WEIGHTS[klass]
+            self._last_finish[klass] = finish
+            fut = asyncio.get_running_loop().create_future()
+            # O prazo é lido só na hora de sair da fila: join_deadline pode estendê-lo enquanto espera
+            self._queues[klass].append((finish, fut, request))
+            try:
+                await fut
+            except asyncio.CancelledError:
+                if fut.done() and not fut.cancelled() and fut.exception() is None:
+                    self._release()
+                else:
+                    fut.cancel()
+                raise
+        try:
+            if _expired(request):
+                self.counters["shed_deadline"] += 1
+                raise HTTPException(504, "Prazo do cliente expirou antes da inferência.")
+            yield
+            self.counters["completed"] += 1
+        finally:
+            self._release()
+
+    def _pop_next(self):
+        best = None
+        for q in self._queues.values():
+            if q and (best is None or q[0][0] < best[0][0]):
+                best = q
+        return best.popleft() if best is not None else None
+
+    def _release(self):
+        self._inflight -= 1
+        while self._inflight < MAX_INFLIGHT:
+            entry = self._pop_next()
+            if entry is None:
+                return
+            finish, fut, request = entry
+            if fut.done():
+                continue
+            if _expired(request):
+                self.counters["shed_deadline"] += 1
+                fut.set_exception(HTTPException(504, "Prazo do cliente expirou antes da inferência."))
+                continue
+            self._vtime = finish
+            self._inflight += 1
+            fut.set_result(None)
+
+    def stats(self) -> dict:
+        return {
+            "inflight": self._inflight,
+            "pending": self._pending,
+            "queued": {k: len(q) for k, q in self._queues.items()},
+            "rate_limit": rate_limit_enabled(),
+            **self.counters,
+        }
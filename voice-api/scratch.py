@@ -0,0 +1,182 @@
+"""
+Espaço de rascunho por requisição (substitui NamedTemporaryFile(delete=False) / mktemp / mkdtemp).
+- Artefatos pequenos (< SCRATCH_MEMORY_MAX_MB) vão para tmpfs (/dev/shm, em memória);
+  uploads grandes vão para SCRATCH_DIR em disco. Com o tmpfs cheio (64 MB por padrão no Docker)
+  o arquivo vai para o disco em vez de falhar com ENOSPC
+- Cota por requisição (SCRATCH_REQUEST_MB) e global por processo (SCRATCH_TOTAL_MB); excedida → 507
+- Cada processo usa diretórios <serviço>-<pid>; no startup os de processos mortos são removidos
+- Tudo o que a requisição criou é apagado em close() / ao sair de `with manager.request() as s:`
+"""
+import errno
+import itertools
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+
+from fastapi import HTTPException
+
+SCRATCH_TMPFS_DIR = os.environ.get("SCRATCH_TMPFS_DIR", "/dev/shm")
+SCRATCH_DIR = os.environ.get("SCRATCH_DIR", tempfile.gettempdir())
+SCRATCH_MEMORY_MAX_BYTES = int(float(os.environ.get("SCRATCH_MEMORY_MAX_MB", 32)) * 1024 * 1024)
+SCRATCH_REQUEST_BYTES = int(float(os.environ.get("SCRATCH_REQUEST_MB", 512)) * 1024 * 1024)
+SCRATCH_TOTAL_BYTES = int(float(os.environ.get("SCRATCH_TOTAL_MB", 2048)) * 1024 * 1024)
+
+_ROOT_NAME = "realityscan-scratch"
+
+
+def _usable(path: str) -> bool:
+    return bool(path) and os.path.isdir(path) and os.access(path, os.W_OK)
+
+
+def _tree_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.lstat(os.path.join(root, name)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class Scratch:
+    """Rascunho de uma requisição: diretórios privados (0700) em tmpfs e em disco."""
+
+    def __init__(self, manager: "ScratchManager"):
+        self._manager = manager
+        self._dirs = {}
+        self._seq = itertools.count()
+        self.used = 0
+
+    def _dir(self, in_memory: bool) -> str:
+        key = "mem" if in_memory and self._manager.tmpfs_root else "disk"
+        if key not in self._dirs:
+            root = self._manager.tmpfs_root if key == "mem" else self._manager.disk_root
+            self._dirs[key] = tempfile.mkdtemp(prefix="req_", dir=root)
+        return self._dirs[key]
+
+    def reserve(self, nbytes: int):
+        """Reserva nbytes na cota da requisição e na global; 507 se exceder."""
+        if self.used + nbytes > SCRATCH_REQUEST_BYTES:
+            raise HTTPException(507, "Requisição excede o espaço temporário permitido.")
+        self._manager._reserve(nbytes)
+        self.used += nbytes
+
+    def _in_memory(self, size: int) -> bool:
+        return size <= SCRATCH_MEMORY_MAX_BYTES and self._manager.tmpfs_has_room()
+
+    def _new_path(self, in_memory: bool, suffix: str) -> str:
+        return os.path.join(self._dir(in_memory), f"f{next(self._seq)}{suffix}")
+
+    def path(self, suffix: str = "", size_hint: int = 0) -> str:
+        """Caminho novo (ainda não criado) para ferramentas externas (ffmpeg, VideoWriter)."""
+        return self._new_path(self._in_memory(size_hint), suffix)
+
+    def write(self, data: bytes, suffix: str = "") -> str:
+        self.reserve(len(data))
+        in_memory = self._in_memory(len(data))
+        p = self._new_path(in_memory, suffix)
+        try:
+            with open(p, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            if not in_memory or e.errno != errno.ENOSPC:
+                raise
+            # tmpfs encheu entre a checagem e a escrita: grava em disco
+            os.unlink(p)
+            p = self._new_path(False, suffix)
+            with open(p, "wb") as f:
+                f.write(data)
+        return p
+
+    def account(self, path: str) -> str:
+        """Contabiliza na cota um arquivo (ou diretório inteiro) gerado por ferramenta externa."""
+        if os.path.isdir(path):
+            self.reserve(_tree_size(path))
+        elif os.path.exists(path):
+            self.reserve(os.path.getsize(path))
+        return path
+
+    def mkdtemp(self, prefix: str = "d_") -> str:
+        """Diretório em disco para ferramentas que gravam vários arquivos; chame account(dir) ao terminar."""
+        return tempfile.mkdtemp(prefix=prefix, dir=self._dir(in_memory=False))
+
+    def close(self):
+        for d in self._dirs.values():
+            shutil.rmtree(d, ignore_errors=True)
+        self._dirs.clear()
+        self._manager._release(self.used)
+        self.used = 0
+
+
+class ScratchManager:
+    def __init__(self, service: str):
+        self.service = service
+        self._lock = threading.Lock()
+        self._used = 0
+        name = f"{service}-{os.getpid()}"
+        self.tmpfs_root = None
+        if _usable(SCRATCH_TMPFS_DIR):
+            self.tmpfs_root = os.path.join(SCRATCH_TMPFS_DIR, _ROOT_NAME, name)
+        self.disk_root = os.path.join(SCRATCH_DIR, _ROOT_NAME, name)
+        self.cleanup_orphans()
+        for root in (self.tmpfs_root, self.disk_root):
+            if root:
+                os.makedirs(root, mode=0o700, exist_ok=True)
+
+    def cleanup_orphans(self):
+        """Remove diretórios de processos deste serviço que morreram (crash, OOM kill) e o do próprio pid."""
+        for base in {SCRATCH_TMPFS_DIR, SCRATCH_DIR}:
+            parent = os.path.join(base, _ROOT_NAME)
+            if not os.path.isdir(parent):
+                continue
+            for entry in os.listdir(parent):
+                prefix, _, pid = entry.rpartition("-")
+                if prefix != self.service or not pid.isdigit():
+                    continue
+                if int(pid) != os.getpid():
+                    try:
+                        os.kill(int(pid), 0)
+                        continue
+                    except ProcessLookupError:
+                        pass
+                    except PermissionError:
+                        continue
+                shutil.rmtree(os.path.join(parent, entry), ignore_errors=True)
+
+    def tmpfs_has_room(self) -> bool:
+        """tmpfs ainda comporta um artefato pequeno do maior tamanho permitido (SCRATCH_MEMORY_MAX_MB)."""
+        if self.tmpfs_root is None:
+            return False
+        try:
+            st = os.statvfs(self.tmpfs_root)
+        except OSError:
+            return False
+        return st.f_bavail * st.f_frsize >= SCRATCH_MEMORY_MAX_BYTES
+
+    def _reserve(self, nbytes: int):
+        with self._lock:
+            if self._used + nbytes > SCRATCH_TOTAL_BYTES:
+                raise HTTPException(507, "Servidor sem espaço temporário. Tente novamente em instantes.")
+            self._used += nbytes
+
+    def _release(self, nbytes: int):
+        with self._lock:
+            self._used = max(0, self._used - nbytes)
+
+    def new(self) -> Scratch:
+        """Rascunho avulso; quem cria chama close() (ex.: no finally do endpoint)."""
+        return Scratch(self)
+
+    @contextmanager
+    def request(self):
+        s = Scratch(self)
+        try:
+            yield s
+        finally:
+            s.close()
+
+    def stats(self) -> dict:
+        return {"used_mb": round(self._used / 1024 / 1024, 1), "tmpfs": self.tmpfs_root is not None}
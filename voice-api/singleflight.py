@@ -0,0 +1,65 @@
+"""
+Coalescência de análises idênticas em andamento (single-flight).
+Quando um vídeo de golpe viraliza, o mesmo arquivo chega várias vezes em poucos segundos, antes de
+qualquer cache (índice pHash) ter resultado. Só a primeira requisição roda a análise; as idênticas que
+chegam enquanto ela roda aguardam o mesmo resultado (marcado com "coalescido": true).
+- Chave = rota + sha256 do conteúdo enviado
+- A análise roda numa task própria: se o cliente que a iniciou desconecta, as demais continuam esperando
+- Nada fica guardado depois que a análise termina (não é cache)
+- Com join, cada follower é apresentado ao contexto do leader (ex.: o prazo da análise compartilhada
+  passa a cobrir o follower, em vez de um 504 do leader chegar a todos)
+"""
+import asyncio
+import hashlib
+import os
+
+SINGLEFLIGHT_ENABLED = os.environ.get("SINGLEFLIGHT", "1") != "0"
+
+
+def content_key(route: str, *parts) -> str:
+    """Chave de coalescência: rota + sha256 das partes (bytes ou str) na ordem."""
+    h = hashlib.sha256()
+    for part in parts:
+        data = part.encode("utf-8") if isinstance(part, str) else part
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return f"{route}:{h.hexdigest()}"
+
+
+class SingleFlight:
+    def __init__(self, join=None):
+        """join(ctx_leader, ctx_follower): chamado quando uma requisição se junta a uma análise em andamento."""
+        self._inflight = {}
+        self._join = join
+        self.counters = {"executed": 0, "coalesced": 0}
+
+    def _done(self, key: str, task: asyncio.Task):
+        if self._inflight.get(key, (None,))[0] is task:
+            del self._inflight[key]
+        # Evita "Task exception was never retrieved" quando todos os clientes desistiram
+        if not task.cancelled():
+            task.exception()
+
+    async def do(self, key: str, fn, ctx=None):
+        """
+        Executa fn() (corrotina sem argumentos) uma vez por chave entre requisições simultâneas.
+        ctx: contexto desta requisição (ex.: Request), repassado a join se ela virar follower.
+        """
+        if not SINGLEFLIGHT_ENABLED:
+            return await fn()
+        entry = self._inflight.get(key)
+        if entry is None:
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = (task, ctx)
+            task.add_done_callback(lambda t: self._done(key, t))
+            self.counters["executed"] += 1
+            return await asyncio.shield(task)
+        task, leader_ctx = entry
+        if self._join is not None and leader_ctx is not None and ctx is not None:
+            self._join(leader_ctx, ctx)
+        self.counters["coalesced"] += 1
+        result = await asyncio.shield(task)
+        return {**result, "coalescido": True} if isinstance(result, dict) else result
+
+    def stats(self) -> dict:
+        return {"inflight": len(self._inflight), **self.counters}
@@ -0,0 +1,40 @@
+"""
+Backends falsos para teste de carga offline em CPU (loadtest/).
+Com STUB_MODELS=1 os detectores mantêm a mesma interface e todo o caminho de I/O real
+(upload, rascunho, decodificação, scheduler), mas no lugar de MTCNN / EfficientNet / wav2vec2 /
+SyncNet dormem uma latência configurável e devolvem um score determinístico do conteúdo.
+Nenhum peso é carregado e nada é baixado.
+"""
+import hashlib
+import os
+import time
+
+STUB_MODELS = os.environ.get("STUB_MODELS", "0") != "0"
+# Latências simuladas (ms); valores padrão aproximam uma GPU T4
+STUB_FACE_MS_PER_FRAME = float(os.environ.get("STUB_FACE_MS_PER_FRAME", 8))
+STUB_B7_MS_PER_FACE = float(os.environ.get("STUB_B7_MS_PER_FACE", 6))
+STUB_B7_MS_PER_BATCH = float(os.environ.get("STUB_B7_MS_PER_BATCH", 20))
+STUB_VOICE_MS_PER_S = float(os.environ.get("STUB_VOICE_MS_PER_S", 15))
+STUB_LIPSYNC_MS = float(os.environ.get("STUB_LIPSYNC_MS", 1500))
+
+
+def delay(ms: float):
+    if ms > 0:
+        time.sleep(ms / 1000.0)
+
+
+def score(data) -> float:
+    """Score estável em [0.05, 0.95] derivado do conteúdo (mesmo arquivo → mesmo score)."""
+    if not isinstance(data, (bytes, bytearray, memoryview)):
+        data = str(data).encode("utf-8")
+    h = int.from_bytes(hashlib.blake2b(data, digest_size=4).digest(), "little")
+    return 0.05 + 0.9 * (h / 0xFFFFFFFF)
+
+
+def file_score(path: str) -> float:
+    """score() do início do arquivo (o caminho muda a cada requisição, o conteúdo não)."""
+    try:
+        with open(path, "rb") as f:
+            return score(f.read(64 * 1024))
+    except OSError:
+        return 0.5
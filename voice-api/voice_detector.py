@@ -7,6 +7,8 @@ Fallback: facebook/wav2vec2-base-960h com heurística baseada em embeddings.
 
 import os
 import tempfile
+import threading
+import time
 from pathlib import Path
 
 import torch
@@ -14,33 +16,76 @@ import torch.nn.functional as F
 import torchaudio
 import numpy as np
 
+import model_registry
+import stub_models
+from stub_models import STUB_MODELS
+
 
 # Modelo anti-deepfake (requer HuggingFace)
 VOICE_MODEL = os.environ.get("VOICE_MODEL", "nii-yamagishilab/wav2vec-large-anti-deepfake-nda")
 VOICE_DEVICE = "cuda" if torch.cuda.is_available() else "cpu"
 
-_model = None
-_processor = None
+# (modelo, processor) numa única referência: o hot-swap troca os dois juntos e cada análise
+# usa o par que pegou no início
+_voice = None
+_voice_version = None
+_voice_lock = threading.Lock()
 
 
-def _load_model():
-    global _model, _processor
-    if _model is not None:
-        return
+def _load(version: str = None):
+    if STUB_MODELS:
+        return "stub", ("stub", None)
+    model_registry.offline()
+    from transformers import AutoModelForAudioClassification, AutoFeatureExtractor
 
-    try:
-        from transformers import AutoModelForAudioClassification, AutoFeatureExtractor
+    if model_registry.enabled():
+        # Só do registro local (safetensors via mmap), sem chamada ao hub
+        version = model_registry.checked(version)
+        source = model_registry.voice_model(VOICE_MODEL, version)
+    else:
+        source = VOICE_MODEL
+    print(f"Carregando modelo de voz: {source}...")
+    processor = AutoFeatureExtractor.from_pretrained(source, local_files_only=model_registry.enabled())
+    model = AutoModelForAudioClassification.from_pretrained(source, local_files_only=model_registry.enabled())
+    model = model.to(VOICE_DEVICE)
+    model.eval()
+    print("Modelo de voz carregado.")
+    return version, (model, processor)
 
-        print(f"Carregando modelo de voz: {VOICE_MODEL}...")
-        _processor = AutoFeatureExtractor.from_pretrained(VOICE_MODEL)
-        _model = AutoModelForAudioClassification.from_pretrained(VOICE_MODEL)
-        _model = _model.to(VOICE_DEVICE)
-        _model.eval()
-        print("Modelo de voz carregado.")
-    except Exception as e:
-        print(f"Aviso: modelo anti-deepfake não disponível ({e}). Use VOICE_MODEL ou instale modelo treinado. Fallback: indeterminado.")
-        _model = "fallback"
-        _processor = None
+
+def _load_model():
+    global _voice, _voice_version
+    voice = _voice
+    if voice is not None:
+        return voice
+    with _voice_lock:
+        if _voice is not None:
+            return _voice
+        try:
+            _voice_version, _voice = _load()
+        except model_registry.RegistryError:
+            # Registro ativo sem o modelo (ou corrompido): erro, nunca o fallback "indeterminado"
+            raise
+        except Exception as e:
+            print(f"Aviso: modelo anti-deepfake não disponível ({e}). Use VOICE_MODEL ou instale modelo treinado. Fallback: indeterminado.")
+            _voice = ("fallback", None)
+        return _voice
+
+
+def reload_model(version: str = None, warm_seconds=()) -> str:
+    """
+    Hot-swap: carrega a versão do registro ao lado da atual, aquece com áudio sintético de
+    warm_seconds e só então troca a referência.
+    """
+    global _voice, _voice_version
+    with _voice_lock:
+        new_version, (model, processor) = _load(version)
+        for sec in warm_seconds:
+            _score(model, processor, np.random.uniform(-0.1, 0.1, int(16000 * sec)).astype(np.float32))
+        if warm_seconds and VOICE_DEVICE == "cuda":
+            torch.cuda.synchronize()
+        _voice_version, _voice = new_version, (model, processor)
+    return _voice_version
 
 
 def _load_audio(audio_path: str, sr: int = 16000) -> np.ndarray:
@@ -53,31 +98,40 @@ def _load_audio(audio_path: str, sr: int = 16000) -> np.ndarray:
     return waveform.squeeze().numpy()
 
 
-def predict_synthetic(audio_path: str) -> dict:
-    """
-    Retorna probabilidade de voz sintética (0-1).
-    fake: prob. sintético
-    real: 1 - fake
-    """
-    _load_model()
-    audio = _load_audio(audio_path)
-
-    if len(audio) < 1600:  # < 0.1s
-        return {"fake": 0.5, "real": 0.5, "resultado": "áudio muito curto", "score_fake_pct": 50.0}
-
-    if _model == "fallback":
-        # Heurística simples: variância espectral baixa pode indicar síntese
-        return {"fake": 0.5, "real": 0.5, "resultado": "modelo não carregado (indeterminado)", "score_fake_pct": 50.0}
-
+def _score(model, processor, audio: np.ndarray) -> float:
+    if model == "stub":
+        stub_models.delay(stub_models.STUB_VOICE_MS_PER_S * len(audio) / 16000)
+        return stub_models.score(audio.tobytes())
     with torch.no_grad():
-        inputs = _processor(audio, sampling_rate=16000, return_tensors="pt", padding=True)
+        inputs = processor(audio, sampling_rate=16000, return_tensors="pt", padding=True)
         inputs = {k: v.to(VOICE_DEVICE) for k, v in inputs.items()}
-        logits = _model(**inputs).logits
+        logits = model(**inputs).logits
         probs = F.softmax(logits, dim=-1)
         # Assumir índice 1 = spoof/fake (depende do modelo)
-        fake = float(probs[0][1].cpu()) if probs.shape[1] > 1 else 0.5
-        real = 1.0 - fake
+        return float(probs[0][1].cpu()) if probs.shape[1] > 1 else 0.5
+
 
+def warmup(seconds=(3.0, 10.0)) -> float:
+    """Carrega o modelo e roda áudio sintético nas durações típicas (kernels/autotuning). Retorna o tempo (s)."""
+    t0 = time.perf_counter()
+    model, processor = _load_model()
+    if model != "fallback":
+        for sec in seconds:
+            _score(model, processor, np.random.uniform(-0.1, 0.1, int(16000 * sec)).astype(np.float32))
+        if VOICE_DEVICE == "cuda":
+            torch.cuda.synchronize()
+    return time.perf_counter() - t0
+
+
+def score_audio(audio: np.ndarray) -> float:
+    """Probabilidade de voz sintética, ou None com modelo fallback / áudio curto demais (< 0.1s)."""
+    model, processor = _load_model()
+    if model == "fallback" or len(audio) < 1600:
+        return None
+    return _score(model, processor, audio)
+
+
+def voice_result(fake: float) -> dict:
     if fake >= 0.7:
         resultado = "provável voz sintética"
     elif fake >= 0.5:
@@ -89,7 +143,30 @@ def predict_synthetic(audio_path: str) -> dict:
 
     return {
         "fake": round(fake, 4),
-        "real": round(real, 4),
+        "real": round(1.0 - fake, 4),
         "resultado": resultado,
         "score_fake_pct": round(fake * 100, 1),
     }
+
+
+def predict_audio(audio: np.ndarray) -> dict:
+    """Como predict_synthetic, para áudio já carregado (mono 16kHz)."""
+    model, processor = _load_model()
+
+    if len(audio) < 1600:  # < 0.1s
+        return {"fake": 0.5, "real": 0.5, "resultado": "áudio muito curto", "score_fake_pct": 50.0}
+
+    if model == "fallback":
+        # Heurística simples: variância espectral baixa pode indicar síntese
+        return {"fake": 0.5, "real": 0.5, "resultado": "modelo não carregado (indeterminado)", "score_fake_pct": 50.0}
+
+    return voice_result(_score(model, processor, audio))
+
+
+def predict_synthetic(audio_path: str) -> dict:
+    """
+    Retorna probabilidade de voz sintética (0-1).
+    fake: prob. sintético
+    real: 1 - fake
+    """
+    return predict_audio(_load_audio(audio_path))